@@ -0,0 +1,1225 @@
+"""
+benchmark.py  –  Local performance benchmarks
+---------------------------------------------
+Runs without Document AI or any input files; every benchmark builds its own
+synthetic data.
+
+Usage:
+    python benchmark.py pages [--pages 32] [--workers 1,2,4,8]
+    python benchmark.py e2e [--apps 8] [--pages 4] [--serial [--workers 2]] [--eager-report] [--pack] [--save-baseline | --check]
+    python benchmark.py mapper [--sizes 4,16,64]
+    python benchmark.py table [--rows 12,40,120] [--words 2]
+    python benchmark.py report [--apps 4] [--pages 4] [--quality draft,standard,archival]
+    python benchmark.py profiles [--samples 12]
+    python benchmark.py payload [--apps 6] [--pages 4] [--mbps 10]
+    python benchmark.py dedup [--apps 8] [--copies 8] [--mode link] [--index-apps 10000]
+    python benchmark.py pack [--apps 24] [--interval 0.1] [--max-pages 15]
+    python benchmark.py footers [--forms 12] [--no-text-layer]
+    python benchmark.py importtime [--module main] [--runs 5] [--budget-ms 800]
+
+Commands that support baselines store their headline metrics in
+benchmark_baselines.json with --save-baseline; --check compares a run
+against the saved numbers and exits non-zero on a regression beyond
+--tolerance.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import cv2
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baselines.json")
+
+
+# ----------------------------------------------------------------------
+# Synthetic data
+# ----------------------------------------------------------------------
+def synthetic_page(seed, width=1190, height=1684):
+    """A 2x-rendered A4 grayscale page with text-like strokes and scanner noise."""
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width), 235, dtype=np.uint8)
+    for row in range(120, height - 120, 48):
+        x = 80
+        while x < width - 200:
+            word = int(rng.integers(40, 160))
+            cv2.putText(page, "x" * (word // 14), (x, row), cv2.FONT_HERSHEY_SIMPLEX, 0.8, 30, 2)
+            x += word + 20
+    noise = rng.normal(0, 12, page.shape)
+    return np.clip(page + noise, 0, 255).astype(np.uint8)
+
+
+def write_synthetic_forms(directory, apps, pages_per_app, seed=0):
+    """Write `apps` scanned-looking PDFs (150 dpi A4 pages) into directory."""
+    from utils import pages_to_pdf_bytes
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for a in range(apps):
+        pages = [synthetic_page(seed + a * 100 + p) for p in range(pages_per_app)]
+        path = os.path.join(directory, f"synthetic_{a:04d}.pdf")
+        with open(path, "wb") as f:
+            f.write(pages_to_pdf_bytes(pages, resolution=144.0))
+        paths.append(path)
+    return paths
+
+
+# ----------------------------------------------------------------------
+# Measurement helpers
+# ----------------------------------------------------------------------
+class DiskSampler(threading.Thread):
+    """Samples the total size of a directory tree until stopped; keeps the peak."""
+
+    def __init__(self, root, exclude=(), interval=0.05):
+        super().__init__(daemon=True)
+        self.root = root
+        self.exclude = {os.path.join(root, e) for e in exclude}
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def _size(self):
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) not in self.exclude]
+            for name in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, name))
+                except OSError:
+                    pass
+        return total
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak = max(self.peak, self._size())
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, self._size())
+        return self.peak
+
+
+def peak_rss_mb():
+    """(self, largest child) peak resident set size in MB, or (None, None)."""
+    if resource is None:
+        return None, None
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    per_mb = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / per_mb, children / per_mb
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    return float(np.percentile(values, q))
+
+
+def handle_baseline(command, metrics, args, higher_is_better=()):
+    """Save or check `metrics` against benchmark_baselines.json."""
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    if getattr(args, "save_baseline", False):
+        baselines[command] = metrics
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Saved baseline for '{command}' to {BASELINE_FILE}")
+        return 0
+
+    if not getattr(args, "check", False):
+        return 0
+    if command not in baselines:
+        print(f"No baseline saved for '{command}'")
+        return 1
+
+    regressions = []
+    for key, base in baselines[command].items():
+        value = metrics.get(key)
+        if not isinstance(base, (int, float)) or not isinstance(value, (int, float)) or base == 0:
+            continue
+        if key.endswith("_ms") and abs(value - base) < args.min_delta_ms:
+            continue  # timer noise on fast stages
+        change = (value - base) / abs(base)
+        worse = -change if key in higher_is_better else change
+        if worse > args.tolerance:
+            regressions.append(f"  {key}: {base:.3f} -> {value:.3f} ({change:+.0%})")
+    if regressions:
+        print(f"REGRESSION vs. baseline (tolerance {args.tolerance:.0%}):")
+        print("\n".join(regressions))
+        return 1
+    print(f"No regressions vs. baseline (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+# ----------------------------------------------------------------------
+# Benchmarks
+# ----------------------------------------------------------------------
+def bench_pages(args):
+    """Preprocessing throughput (pages/sec) against process-pool size."""
+    from preprocess_pool import make_pool, preprocess_pages
+
+    pages = [synthetic_page(i) for i in range(args.pages)]
+    counts = [int(w) for w in args.workers.split(",")] if args.workers else _core_counts()
+
+    print(f"{'workers':>8} {'pages':>6} {'seconds':>8} {'pages/s':>8} {'speedup':>8}")
+    base = None
+    for workers in counts:
+        pool = make_pool(workers) if workers > 1 else None
+        try:
+            if pool is not None:
+                preprocess_pages(pages[:workers], pool=pool)  # warm up children
+            start = time.perf_counter()
+            if pool is None:
+                from utils import preprocess_page
+                out = [preprocess_page(p) for p in pages]
+            else:
+                out = preprocess_pages(pages, pool=pool)
+            elapsed = time.perf_counter() - start
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        assert len(out) == len(pages)
+        rate = len(pages) / elapsed
+        base = base or rate
+        print(f"{workers:>8} {len(pages):>6} {elapsed:>8.2f} {rate:>8.1f} {rate / base:>7.2f}x")
+
+
+def bench_e2e(args):
+    """Drive worker.run_once over synthetic forms against the local Document AI stand-in."""
+    if "config" in sys.modules:
+        raise SystemExit("e2e must run in a fresh process (config is already imported)")
+
+    data_dir = tempfile.mkdtemp(prefix="anjuman_bench_")
+    os.environ["ANJUMAN_DATA_DIR"] = data_dir
+    os.environ["DOC_AI_BACKEND"] = "fake"
+    os.environ["FAKE_DOC_AI_LATENCY"] = str(args.ocr_latency)
+    os.environ["FAKE_DOC_AI_PAGE_LATENCY"] = str(args.ocr_page_latency)
+    os.environ["FAKE_DOC_AI_ERROR_RATE"] = "0"
+
+    try:
+        import config
+        if args.pack:
+            config.OCR_PACK_ENABLED = True  # read when pipeline.py is imported
+        import worker
+
+        if args.serial:
+            worker.PIPELINE_ENABLED = False
+        if args.eager_report:
+            worker.REPORT_EAGER = True
+        write_synthetic_forms(config.INCOMING_DIR, args.apps, args.pages)
+        sampler = DiskSampler(config.WORK_DIR, exclude=("archive",))
+        sampler.start()
+        start = time.perf_counter()
+        results = worker.run_once(parallel_workers=args.workers)
+        elapsed = time.perf_counter() - start
+        peak_temp = sampler.stop()
+    finally:
+        if not args.keep:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    stages = {}
+    for r in results:
+        for stage, seconds in r.get("timings", {}).items():
+            stages.setdefault(stage, []).append(seconds)
+
+    rss_self, rss_children = peak_rss_mb()
+    metrics = {
+        "apps": len(results),
+        "apps_per_min": len(results) / elapsed * 60 if elapsed else 0.0,
+        "wall_seconds": elapsed,
+        "peak_rss_mb": rss_self,
+        "peak_child_rss_mb": rss_children,
+        "peak_temp_mb": peak_temp / 1e6,
+    }
+    for stage, values in stages.items():
+        metrics[f"{stage}_p50_ms"] = percentile(values, 50) * 1000
+
+    print(f"\n{'stage':<12} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9}")
+    for stage, values in stages.items():
+        print(f"{stage:<12} {percentile(values, 50) * 1000:>9.1f} {percentile(values, 95) * 1000:>9.1f} "
+              f"{np.mean(values) * 1000:>9.1f}")
+    print(f"\n{len(results)}/{args.apps} apps in {elapsed:.1f}s -> {metrics['apps_per_min']:.1f} apps/min")
+    print(f"peak RSS {rss_self or 0:.0f} MB (largest child {rss_children or 0:.0f} MB), "
+          f"peak temp disk {metrics['peak_temp_mb']:.1f} MB")
+
+    if len(results) != args.apps:
+        print("WARNING: not every application succeeded")
+    name = "e2e-serial" if args.serial else "e2e"
+    if args.eager_report:
+        name += "-eager-report"
+    if args.pack:
+        name += "-packed"
+    return handle_baseline(name, metrics, args, higher_is_better={"apps_per_min", "apps"})
+
+
+def _legacy_find_fields(ocr_json):
+    """The per-keyword text search map_fields_from_ocr used before the
+    single-pass extractor, kept here as the comparison point."""
+    text = ocr_json.get("text", "")
+
+    def find_value(keywords):
+        for k in keywords:
+            if k.lower() in text.lower():
+                idx = text.lower().find(k.lower())
+                snippet = text[idx: idx + 120]
+                parts = snippet.split(":")
+                if len(parts) > 1:
+                    value = parts[1].split("\n")[0].strip()
+                    return value
+        return ""
+
+    keywords = [["Name", "Head of Family"], ["Father", "Husband"], ["Voter ID", "EPIC"], ["Aadhaar", "Aadhar"],
+                ["Gender", "Sex"], ["Age"], ["Qualification", "Education"], ["Occupation", "Work"], ["Address"],
+                ["Ward"], ["Mobile", "Phone"], ["Masjid", "Namaz"]]
+    return [find_value(k) for k in keywords]
+
+
+def _synthetic_ocr_json(pages, seed=0):
+    """Fake form-parser output as a dict, `pages` pages long (pages past the
+    fourth repeat the fake's blank-page layout)."""
+    import fitz
+    from google.cloud import documentai_v1 as documentai
+    from fake_docai import synthesize_document
+
+    with fitz.open() as doc:
+        for _ in range(pages):
+            doc.new_page()
+        content = doc.tobytes() + str(seed).encode()
+    return documentai.Document.to_dict(synthesize_document(content, pages))
+
+
+def bench_mapper(args):
+    """Field extraction: single-pass extractor vs. the legacy keyword search."""
+    import timeit
+    from mapper import extract_fields
+
+    print(f"{'pages':>6} {'text KB':>8} {'legacy us':>10} {'single-pass us':>15} {'text-only us':>13} {'speedup':>8}")
+    metrics = {}
+    for pages in (int(p) for p in args.sizes.split(",")):
+        ocr = _synthetic_ocr_json(pages)
+        # Long documents push the labels deep into the text; text-only
+        # measures the scan without the formFields shortcut.
+        text_only = {"text": "\n".join(["lorem ipsum dolor sit amet " * 4] * (pages * 40)) + ocr["text"]}
+        n = args.repeat
+        legacy = min(timeit.repeat(lambda: _legacy_find_fields(text_only), number=n, repeat=3)) / n
+        single = min(timeit.repeat(lambda: extract_fields(ocr), number=n, repeat=3)) / n
+        scan = min(timeit.repeat(lambda: extract_fields(text_only), number=n, repeat=3)) / n
+        print(f"{pages:>6} {len(text_only['text']) / 1024:>8.1f} {legacy * 1e6:>10.1f} {single * 1e6:>15.1f} "
+              f"{scan * 1e6:>13.1f} {legacy / scan:>7.1f}x")
+        metrics[f"mapper_{pages}p_us"] = scan * 1e6
+    return handle_baseline("mapper", metrics, args)
+
+
+def _synthetic_table_ocr(rows, words, seed=0):
+    """A one-page OCR dict holding just a filled family_table: `rows` member
+    rows squeezed into the template's table box, `words` tokens per cell."""
+    import random
+    from zone_extractor import load_template
+    from table_extractor import _table_zone
+
+    template = load_template()
+    base = template["page_base"]
+    zone = _table_zone(template)
+    x, y, w, h = zone["bbox"]
+    pitch = h / (rows + 1)
+    token_h = pitch * 0.4
+    rng = random.Random(seed)
+    text, tokens, truth = [], [], []
+    offset = 0
+    for r in range(rows + 1):  # row 0 is the header
+        top = y + r * pitch + pitch * 0.3
+        record = {}
+        for col in zone["columns"]:
+            if r == 0:
+                cell = [col["key"].lower() if col["key"] != "memberName" else "name"]
+            elif col["key"] == "age":
+                cell = [str(rng.randint(1, 90))]
+            else:
+                cell = ["w%04d" % rng.randrange(10000) for _ in range(words)]
+            record[col["key"]] = " ".join(cell)
+            step = col["w"] / (len(cell) + 1)
+            for i, word in enumerate(cell):
+                x0 = col["x"] + 10 + i * step
+                x1 = x0 + min(step - 5, 22 * len(word))
+                tokens.append({"layout": {
+                    "textAnchor": {"textSegments": [{"startIndex": offset, "endIndex": offset + len(word)}]},
+                    "confidence": 0.8 + rng.random() * 0.2,
+                    "boundingPoly": {"normalizedVertices": [
+                        {"x": x0 / base["width"], "y": top / base["height"]},
+                        {"x": x1 / base["width"], "y": top / base["height"]},
+                        {"x": x1 / base["width"], "y": (top + token_h) / base["height"]},
+                        {"x": x0 / base["width"], "y": (top + token_h) / base["height"]},
+                    ]},
+                }})
+                text.append(word + " ")
+                offset += len(word) + 1
+        if r:
+            truth.append(record)
+    page = {"pageNumber": 1, "dimension": {"width": base["width"], "height": base["height"]}, "tokens": tokens}
+    return {"text": "".join(text), "pages": [page]}, truth
+
+
+def _loop_family_table(page, zone):
+    """Per-token reference parser: the same rules as table_extractor written
+    as plain Python loops, kept as the comparison point."""
+    from table_extractor import ROW_GAP_FACTOR
+
+    toks = []
+    for i in range(len(page)):
+        cx, cy = page.cx[i], page.cy[i]
+        for k, col in enumerate(zone["columns"]):
+            if col["x"] <= cx < col["x"] + col["w"]:
+                toks.append((cy, cx, k, page.texts[i]))
+                break
+    toks.sort()
+    line_h = sorted(page.heights)[len(page.heights) // 2]
+    rows, prev = [], None
+    for cy, cx, k, text in toks:
+        if prev is None or cy - prev > ROW_GAP_FACTOR * line_h:
+            rows.append([[] for _ in zone["columns"]])
+        rows[-1][k].append((cx, text))
+        prev = cy
+    return [[" ".join(t for _, t in sorted(cell)) for cell in row] for row in rows[1:]]
+
+
+def bench_table(args):
+    """FamilyMembers table parsing on dense synthetic tables."""
+    import timeit
+    from zone_extractor import index_pages, load_template
+    from table_extractor import extract_family_table, _table_zone
+
+    zone = _table_zone(load_template())
+    print(f"{'rows':>6} {'tokens':>7} {'index us':>9} {'loop us':>9} {'vectorized us':>14} {'speedup':>8} {'cells ok':>9}")
+    metrics = {}
+    for rows in (int(r) for r in args.rows.split(",")):
+        ocr, truth = _synthetic_table_ocr(rows, args.words)
+        pages = index_pages(ocr)
+        members = extract_family_table(ocr, [zone["page"]], pages=pages)
+        ok = sum(m[k]["value"] == (int(v) if k == "age" else v)
+                 for m, t in zip(members, truth) for k, v in t.items())
+        n = args.repeat
+        index = min(timeit.repeat(lambda: index_pages(ocr), number=n, repeat=3)) / n
+        loop = min(timeit.repeat(lambda: _loop_family_table(pages[0], zone), number=n, repeat=3)) / n
+        vec = min(timeit.repeat(lambda: extract_family_table(ocr, [zone["page"]], pages=pages), number=n, repeat=3)) / n
+        print(f"{rows:>6} {len(pages[0]):>7} {index * 1e6:>9.1f} {loop * 1e6:>9.1f} {vec * 1e6:>14.1f} "
+              f"{loop / vec:>7.1f}x {ok:>4}/{rows * len(zone['columns'])}")
+        metrics[f"table_{rows}r_us"] = vec * 1e6
+    return handle_baseline("table", metrics, args)
+
+
+def _legacy_report(app_id, filled_json, pages, output_path):
+    """The report builder before quality tiers: full-size pages, one drawString per line."""
+    import textwrap
+    from PIL import Image
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(output_path, pagesize=A4)
+    width, height = A4
+    margin = 20 * mm
+    y = height - margin - 38
+    c.setFont("Courier", 7)
+    for line in textwrap.wrap(json.dumps(filled_json, ensure_ascii=False, indent=2), 120):
+        if y < 80:
+            c.showPage()
+            y = height - margin
+            c.setFont("Courier", 7)
+        c.drawString(margin, y, line)
+        y -= 12
+    for page in pages:
+        c.showPage()
+        img = ImageReader(Image.fromarray(page))
+        iw, ih = img.getSize()
+        scale = min((width - 2 * margin) / iw, (height - 2 * margin - 20 * mm) / ih, 1.0)
+        c.drawImage(img, (width - iw * scale) / 2, (height - ih * scale) / 2 - 20, iw * scale, ih * scale)
+    c.save()
+
+
+def bench_report(args):
+    """
+    Report size and render time per application: legacy builder vs. each
+    quality tier, drawing pages as prepared XObjects and (tier-drawImage)
+    through reportlab's public drawImage.
+    """
+    import pdf_report
+    from utils import preprocess_page
+    from pdf_report import generate_pdf_report
+    from zone_extractor import load_template
+
+    filled = load_template()
+    filled["metadata"] = {"status": "draft"}
+    # A4 scans rendered at 200 dpi, binarized the way preprocess_group leaves them
+    apps = [[preprocess_page(synthetic_page(a * 100 + p, 1654, 2339)) for p in range(args.pages)]
+            for a in range(args.apps)]
+    tiers = [q for q in args.quality.split(",") if q]
+    builders = [("legacy", lambda i, pages, out: _legacy_report(i, filled, pages, out))]
+    builders += [(q, lambda i, pages, out, q=q: generate_pdf_report(i, filled, pages, out, quality=q)) for q in tiers]
+    builders += [(f"{q}-drawImage", lambda i, pages, out, q=q: generate_pdf_report(i, filled, pages, out, quality=q))
+                 for q in tiers]
+    direct = pdf_report.DIRECT_XOBJECTS
+
+    out_dir = tempfile.mkdtemp(prefix="anjuman-report-")
+    print(f"{'builder':>18} {'ms/app':>8} {'KB/app':>8} {'size':>7} {'speed':>7}")
+    metrics, base = {}, None
+    try:
+        for name, build in builders:
+            pdf_report.DIRECT_XOBJECTS = direct and not name.endswith("-drawImage")
+            times, sizes = [], []
+            for i, pages in enumerate(apps):
+                out = os.path.join(out_dir, f"{name}_{i}.pdf")
+                start = time.perf_counter()
+                build(i, pages, out)
+                times.append(time.perf_counter() - start)
+                sizes.append(os.path.getsize(out))
+            ms, kb = 1000 * float(np.median(times)), float(np.mean(sizes)) / 1024
+            base = base or (ms, kb)
+            print(f"{name:>18} {ms:>8.1f} {kb:>8.1f} {kb / base[1]:>6.2f}x {base[0] / ms:>6.1f}x")
+            if name != "legacy" and not name.endswith("-drawImage"):
+                metrics[f"report_{name}_ms"] = ms
+                metrics[f"report_{name}_kb"] = kb
+    finally:
+        pdf_report.DIRECT_XOBJECTS = direct
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return handle_baseline("report", metrics, args)
+
+
+HOF_FIELDS = ("name", "fatherOrHusbandName", "voterID", "aadhaarNumber", "gender", "age",
+              "qualification", "occupation", "address", "ward", "mobileNumber", "namazMasjid")
+
+
+def _sample_form(seed):
+    """
+    One filled page 1 at the template's 300 dpi base: (clean ink mask,
+    scanned-looking page, {field: (value, bbox)}). Same seed, same page.
+    """
+    from fake_docai import synthetic_form_values
+    from zone_extractor import load_template
+
+    template = load_template()
+    base = template["page_base"]
+    values = synthetic_form_values(seed)["HeadOfFamily"]
+    clean = np.full((base["height"], base["width"]), 255, dtype=np.uint8)
+    cv2.putText(clean, "ANJUMAN REGISTRATION FORM", (700, 200), cv2.FONT_HERSHEY_SIMPLEX, 2.0, 0, 4)
+    truth = {}
+    for field in HOF_FIELDS:
+        bbox = template["zones"][f"HeadOfFamily.{field}"]["bbox"]
+        x, y, w, h = bbox
+        text = str(values[field])
+        scale = 1.6
+        while cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, 3)[0][0] > w - 20:
+            scale -= 0.1
+        cv2.putText(clean, text, (x + 10, y + h // 2 + 20), cv2.FONT_HERSHEY_SIMPLEX, scale, 0, 3)
+        truth[field] = (text, bbox)
+    return clean < 128, _scan(clean, seed), truth
+
+
+def _scan(clean, seed):
+    """Paper tone, blur, a lighting gradient, sensor noise and dust on a clean page."""
+    rng = np.random.default_rng(seed)
+    page = np.where(clean < 128, 45.0, 228.0)
+    page = cv2.GaussianBlur(page, (0, 0), 1.2)
+    page += np.linspace(-12, 12, page.shape[1])[None, :]
+    page += rng.normal(0, 16, page.shape)
+    dust = rng.random(page.shape) < 0.0008
+    page[dust] = 60
+    return np.clip(page, 0, 255).astype(np.uint8)
+
+
+def _write_samples(directory, count):
+    """Fixed sample set: PDFs of [form page, blank page] scanned at 200 or 300 dpi."""
+    from utils import pages_to_pdf_bytes
+
+    samples = []
+    for i in range(count):
+        ink, page, truth = _sample_form(i)
+        blank = _scan(np.full_like(page, 255), 10_000 + i)
+        dpi = (200, 300)[i % 2]
+        if dpi != 300:
+            size = (round(page.shape[1] * dpi / 300), round(page.shape[0] * dpi / 300))
+            page, blank = (cv2.resize(p, size, interpolation=cv2.INTER_AREA) for p in (page, blank))
+        path = os.path.join(directory, f"sample_{i:03d}.pdf")
+        with open(path, "wb") as f:
+            f.write(pages_to_pdf_bytes([page, blank], resolution=dpi))
+        samples.append((path, ink, truth))
+    return samples
+
+
+def _field_reader():
+    """Tesseract line reader if it is installed, else None."""
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+    except Exception:
+        return None
+    return lambda crop: " ".join(pytesseract.image_to_string(crop, config="--psm 7").split())
+
+
+def _field_scores(processed, ink, truth, read):
+    """Per field: OCR exact match (read) or ink F1 against the clean page."""
+    sy, sx = processed.shape[0] / ink.shape[0], processed.shape[1] / ink.shape[1]
+    scores = {}
+    for field, (text, (x, y, w, h)) in truth.items():
+        x0, y0, x1, y1 = int(x * sx), int(y * sy), int((x + w) * sx), int((y + h) * sy)
+        crop = processed[y0:y1, x0:x1]
+        if read is not None:
+            scores[field] = float(read(crop).lower() == " ".join(text.split()).lower())
+            continue
+        ref = cv2.resize(ink[y:y + h, x:x + w].astype(np.float32), (crop.shape[1], crop.shape[0]),
+                         interpolation=cv2.INTER_AREA) > 0.5
+        got = crop < 128
+        tp = np.count_nonzero(ref & got)
+        scores[field] = 2 * tp / max(1, np.count_nonzero(ref) + np.count_nonzero(got))
+    return scores
+
+
+def bench_profiles(args):
+    """
+    CPU per page (rendering, and blank check + preprocessing) and field-level
+    quality of each preprocessing profile on a fixed sample set.
+    """
+    from config import PREPROCESS_PROFILES
+    from utils import iter_pdf_pages, is_blank_page, preprocess_page
+
+    read = _field_reader()
+    # Without an OCR engine a field counts as legible when its binarized ink
+    # matches the clean page with F1 >= 0.8.
+    legible = (lambda s: s == 1.0) if read else (lambda s: s >= 0.8)
+    print("field accuracy: " + ("tesseract exact match" if read else "ink F1 >= 0.8 vs. the clean page (no tesseract)"))
+
+    work = tempfile.mkdtemp(prefix="anjuman-profiles-")
+    try:
+        samples = _write_samples(work, args.samples)
+        runs = [("legacy", {"scale": 2.0}, "max_quality")]
+        runs += [(name, {"dpi": p["dpi"]}, name) for name, p in PREPROCESS_PROFILES.items()]
+        print(f"{'profile':>12} {'render ms':>10} {'prep ms':>8} {'px/page':>9} {'fields ok':>10} "
+              f"{'mean score':>11} {'blank skipped':>14}")
+        metrics = {}
+        for name, render, profile in runs:
+            render_cpu, prep_cpu, pages, px, ok, scores, blanks, wrong = 0.0, 0.0, 0, [], 0, [], 0, 0
+            for path, ink, truth in samples:
+                start = time.process_time()
+                for n, page in enumerate(iter_pdf_pages(path, **render)):
+                    pages += 1
+                    mid = time.process_time()
+                    render_cpu += mid - start
+                    blank = is_blank_page(page)
+                    processed = None if blank else preprocess_page(page, profile)
+                    start = time.process_time()
+                    prep_cpu += start - mid
+                    blanks += blank and n == 1
+                    wrong += blank and n == 0
+                    if n == 0 and not blank:
+                        px.append(processed.size)
+                        field_scores = _field_scores(processed, ink, truth, read)
+                        scores.extend(field_scores.values())
+                        ok += sum(legible(s) for s in field_scores.values())
+                    start = time.process_time()
+            fields = len(samples) * len(HOF_FIELDS)
+            print(f"{name:>12} {render_cpu / pages * 1000:>10.1f} {prep_cpu / pages * 1000:>8.1f} "
+                  f"{np.mean(px) if px else 0:>9.0f} {ok:>5}/{fields:<4} {np.mean(scores) if scores else 0:>11.3f} "
+                  f"{blanks:>7}/{len(samples)}{' (form pages skipped!)' if wrong else ''}")
+            metrics[f"{name}_prep_cpu_ms"] = prep_cpu / pages * 1000
+            metrics[f"{name}_field_accuracy"] = ok / fields
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return handle_baseline("profiles", metrics, args,
+                           higher_is_better={f"{n}_field_accuracy" for n, _, _ in runs})
+
+
+def _with_photo(page, seed):
+    """page with a photo-like grayscale patch (smooth shading, fine texture) in the top right."""
+    rng = np.random.default_rng(seed)
+    h, w = page.shape
+    ph, pw = h // 5, w // 4
+    yy, xx = np.mgrid[0:ph, 0:pw]
+    fx, fy = rng.uniform(20, 60, 2)
+    photo = 128 + 60 * np.sin(xx / fx) * np.cos(yy / fy) + 30 * np.sin((xx + yy) / 11.0)
+    out = page.copy()
+    out[h // 12:h // 12 + ph, w - pw - w // 12:w - w // 12] = np.clip(photo, 0, 255).astype(np.uint8)
+    return out
+
+
+def _legacy_pdf_bytes(pages, resolution=100.0):
+    """The merged PDF as built before bilevel encoding: every page 8-bit JPEG."""
+    import io
+    from PIL import Image
+
+    images = [Image.fromarray(p) for p in pages]
+    buf = io.BytesIO()
+    images[0].save(buf, "PDF", resolution=resolution, save_all=True, append_images=images[1:])
+    return buf.getvalue()
+
+
+def bench_payload(args):
+    """
+    Size of the merged PDF sent to Document AI per application, legacy 8-bit
+    JPEG pages vs. 1-bit CCITT G4 (grayscale where binarizing loses
+    content), and the fake Document AI round trip over an --mbps uplink.
+    """
+    from config import PDF_RESOLUTION
+    from fake_docai import FakeDocumentProcessorServiceClient
+    from utils import pages_to_pdf_bytes, preprocess_page, iter_pdf_pages
+
+    apps, gray_pages = [], 0
+    for a in range(args.apps):
+        ink, form, truth = _sample_form(a)
+        form = cv2.resize(form, (1654, 2339), interpolation=cv2.INTER_AREA)
+        if a % 2:
+            form = _with_photo(form, a)
+        pages = [form] + [synthetic_page(a * 100 + p, 1654, 2339) for p in range(1, args.pages)]
+        processed = [preprocess_page(p) for p in pages]
+        gray_pages += sum(len(np.unique(p)) > 2 for p in processed)
+        apps.append(processed)
+
+    client = FakeDocumentProcessorServiceClient(latency=args.ocr_latency, page_latency=args.ocr_page_latency,
+                                                upload_mbps=args.mbps, seed=0)
+    print(f"{args.apps} apps x {args.pages} pages ({gray_pages} kept grayscale), uplink {args.mbps} Mbit/s")
+    print(f"{'encoding':>10} {'KB/app':>8} {'max KB':>8} {'build ms':>9} {'OCR ms':>8} {'ink kept':>9}")
+    metrics = {}
+    work = tempfile.mkdtemp(prefix="anjuman-payload-")
+    try:
+        for name, build in (("legacy", _legacy_pdf_bytes), ("bilevel", pages_to_pdf_bytes)):
+            sizes, build_ms, ocr_ms, same = [], [], [], []
+            for n, pages in enumerate(apps):
+                start = time.perf_counter()
+                pdf = build(pages, resolution=PDF_RESOLUTION)
+                build_ms.append((time.perf_counter() - start) * 1000)
+                sizes.append(len(pdf))
+                start = time.perf_counter()
+                client.process_document(request={"raw_document": {"content": pdf, "mime_type": "application/pdf"}})
+                ocr_ms.append((time.perf_counter() - start) * 1000)
+                path = os.path.join(work, f"{name}_{n}.pdf")
+                with open(path, "wb") as f:
+                    f.write(pdf)
+                # Share of pixels on the same side of mid-gray as in the worker's pages
+                for page, back in zip(pages, iter_pdf_pages(path, scale=PDF_RESOLUTION / 72.0)):
+                    same.append(np.mean((page < 128) == (back < 128)))
+            print(f"{name:>10} {np.mean(sizes) / 1024:>8.0f} {max(sizes) / 1024:>8.0f} {np.mean(build_ms):>9.1f} "
+                  f"{np.mean(ocr_ms):>8.0f} {np.mean(same):>9.3%}")
+            metrics[f"{name}_kb_per_app"] = np.mean(sizes) / 1024
+            metrics[f"{name}_ocr_ms"] = np.mean(ocr_ms)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return handle_baseline("payload", metrics, args)
+
+
+def _recopy(page, seed):
+    """The same scan exported again: resized, JPEG-recompressed, shifted a few pixels."""
+    rng = np.random.default_rng(seed)
+    h, w = page.shape
+    f = rng.uniform(0.6, 1.0)
+    copy = cv2.resize(page, (round(w * f), round(h * f)), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", copy, [cv2.IMWRITE_JPEG_QUALITY, int(rng.integers(30, 90))])
+    copy = cv2.imdecode(buf, cv2.IMREAD_GRAYSCALE)
+    shift = np.float32([[1, 0, rng.integers(-3, 4)], [0, 1, rng.integers(-3, 4)]])
+    copy = cv2.warpAffine(copy, shift, (copy.shape[1], copy.shape[0]), borderValue=255)
+    return cv2.resize(copy, (w, h), interpolation=cv2.INTER_AREA)
+
+
+def _write_apps(directory, pages_by_name):
+    from utils import pages_to_pdf_bytes
+
+    os.makedirs(directory, exist_ok=True)
+    for name, pages in pages_by_name.items():
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(pages_to_pdf_bytes(pages, resolution=150.0))
+
+
+def bench_dedup(args):
+    """
+    Near-duplicate detection end to end: a first run_once over `apps`
+    applications, then a second over re-exported copies of `copies` of them
+    plus `apps` new ones. Reports links, misses, false links and OCR calls
+    saved, then index lookup time at --index-apps.
+    """
+    if "config" in sys.modules:
+        raise SystemExit("dedup must run in a fresh process (config is already imported)")
+
+    data_dir = tempfile.mkdtemp(prefix="anjuman_bench_")
+    os.environ["ANJUMAN_DATA_DIR"] = data_dir
+    os.environ["DOC_AI_BACKEND"] = "fake"
+    os.environ["FAKE_DOC_AI_LATENCY"] = "0.05"
+    os.environ["FAKE_DOC_AI_PAGE_LATENCY"] = "0.01"
+    os.environ["FAKE_DOC_AI_ERROR_RATE"] = "0"
+
+    try:
+        import config
+        import worker
+        import dedup
+
+        worker.DEDUP_MODE = args.mode
+        # Two-page applications: a filled form page (150 dpi) and a text page.
+        forms = {}
+        for i in range(2 * args.apps):
+            ink, page, truth = _sample_form(i)
+            page = cv2.resize(page, (1240, 1754), interpolation=cv2.INTER_AREA)
+            forms[i] = [page, synthetic_page(500 + i, 1240, 1754)]
+        _write_apps(config.INCOMING_DIR, {f"orig_{i:03d}.pdf": forms[i] for i in range(args.apps)})
+        first = {r["app_id"]: r for r in worker.run_once()}
+
+        copies = {f"copy_{i:03d}.pdf": [_recopy(p, 900 + i * 2 + n) for n, p in enumerate(forms[i % args.apps])]
+                  for i in range(args.copies)}
+        fresh = {f"new_{i:03d}.pdf": forms[i] for i in range(args.apps, 2 * args.apps)}
+        _write_apps(config.INCOMING_DIR, {**copies, **fresh})
+        start = time.perf_counter()
+        second = worker.run_once()
+        elapsed = time.perf_counter() - start
+
+        from local_db_manager import get_job
+        orig_ids = {os.path.basename(get_job(a)["source_paths"][0]): a for a in first}
+        linked = missed = false = 0
+        for r in second:
+            source = os.path.basename(get_job(r["app_id"])["source_paths"][0])
+            found = (get_job(r["app_id"])["artifacts"].get("dedup") or {}).get("duplicate_of")
+            if source.startswith("copy_"):
+                expected = orig_ids.get(f"orig_{int(source[5:8]) % args.apps:03d}.pdf")
+                linked += found == expected
+                missed += found is None
+                false += found not in (None, expected)
+            else:
+                false += found is not None
+        ocr_calls = sum("ocr" in r["timings"] for r in second)
+        dedup_ms = [r["timings"]["dedup"] * 1000 for r in first.values() if "dedup" in r["timings"]]
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(f"\nmode {args.mode}: {len(second)} apps in {elapsed:.1f}s, {ocr_calls} OCR calls "
+          f"({len(second) - ocr_calls} saved)")
+    print(f"copies found {linked}/{args.copies}, missed {missed}, false matches {false}")
+    print(f"dedup stage p50 {percentile(dedup_ms, 50):.1f} ms per application ({len(forms[0])} pages)")
+
+    # Lookup cost at --index-apps: synthetic applicants differ from the
+    # sample's pages in 14-30 bits of 3-7 tiles each (their filled-in
+    # fields); the query is a copy of one of them with a few bits flipped.
+    rng = np.random.default_rng(0)
+    centers = [int.from_bytes(dedup.page_hash(p), "big") for p in forms[0]]
+
+    def applicant(center):
+        for tile in rng.choice(dedup.GRID * dedup.GRID, size=int(rng.integers(3, 8)), replace=False):
+            for bit in rng.choice(dedup.TILE_BITS, size=int(rng.integers(14, 30)), replace=False):
+                center ^= 1 << (dedup.TILE_BITS * int(tile) + int(bit))
+        return center
+
+    index = dedup.DedupIndex(rows=lambda row_id: [])  # in memory only
+    apps = [[applicant(c) for c in centers] for _ in range(args.index_apps)]
+    for app_id, keys in enumerate(apps):
+        for page_no, key in enumerate(keys, start=1):
+            index.insert(app_id, page_no, key.to_bytes(dedup.HASH_BYTES, "big"))
+    queries = [(int(i), [(k ^ (1 << int(rng.integers(1024)))).to_bytes(dedup.HASH_BYTES, "big") for k in apps[i]])
+               for i in rng.integers(len(apps), size=50)]
+    start = time.perf_counter()
+    hits = sum(bool(m) and m[0]["app_id"] == i for i, q in queries for m in [index.find(q)])
+    lookup_ms = (time.perf_counter() - start) / len(queries) * 1000
+    print(f"lookup over {args.index_apps} applications ({len(centers)} pages each): "
+          f"{lookup_ms:.2f} ms per application, {hits}/{len(queries)} found")
+
+    metrics = {
+        "copies_found": linked / args.copies if args.copies else 1.0,
+        "false_matches": false,
+        "dedup_p50_ms": percentile(dedup_ms, 50),
+        "lookup_ms": lookup_ms,
+    }
+    return handle_baseline(f"dedup-{args.mode}", metrics, args, higher_is_better={"copies_found"})
+
+
+def bench_pack(args):
+    """
+    Applications per Document AI request and per-application OCR latency,
+    one request per application vs. packed requests (ocr_packer.py), for
+    applications arriving every --interval seconds. The stand-in reads a
+    packed PDF as one document, as the real service would, so a packed
+    application only has to get back its own pages (the text each part
+    reads through its anchors is checked in test_packer.py).
+    """
+    import asyncio
+    from config import DOC_AI_RATE_LIMIT, DOC_AI_BURST
+    from document_ai_client import AsyncDocumentAIClient
+    from fake_docai import FakeDocumentProcessorServiceAsyncClient
+    from ocr_packer import OcrPacker
+    from utils import pages_to_pdf_bytes, preprocess_page
+
+    apps = [pages_to_pdf_bytes([preprocess_page(synthetic_page(a * 100 + p, 827, 1170)) for p in range(args.pages)])
+            for a in range(args.apps)]
+
+    async def run(packed):
+        fake = FakeDocumentProcessorServiceAsyncClient(latency=args.ocr_latency, page_latency=args.ocr_page_latency,
+                                                       error_rate=0, seed=0)
+        client = AsyncDocumentAIClient(client=fake, cache=False, max_in_flight=args.concurrency,
+                                       rate_limit=DOC_AI_RATE_LIMIT, burst=DOC_AI_BURST)
+        if packed:
+            client = OcrPacker(client, max_pages=args.max_pages, wait=args.wait, cache=False)
+        latencies = []
+
+        async def one(i, content):
+            await asyncio.sleep(i * args.interval)
+            start = time.perf_counter()
+            document = await client.process(content)
+            latencies.append(time.perf_counter() - start)
+            return document
+
+        start = time.perf_counter()
+        documents = await asyncio.gather(*(one(i, c) for i, c in enumerate(apps)))
+        return documents, latencies, time.perf_counter() - start, fake.calls
+
+    print(f"{args.apps} apps x {args.pages} pages, one every {args.interval}s; fake OCR {args.ocr_latency}s + "
+          f"{args.ocr_page_latency}s/page, {args.concurrency} in flight, {DOC_AI_RATE_LIMIT:g} requests/s")
+    print(f"{'mode':>8} {'calls':>6} {'apps/call':>10} {'p50 s':>7} {'p95 s':>7} {'wall s':>7} {'pages ok':>9}")
+    metrics = {}
+    for mode in ("single", "packed"):
+        documents, latencies, wall, calls = asyncio.run(run(mode == "packed"))
+        pages_ok = sum(len(d.pages) == args.pages and [p.page_number for p in d.pages] == list(range(1, args.pages + 1))
+                       for d in documents)
+        print(f"{mode:>8} {calls:>6} {args.apps / calls:>10.1f} {percentile(latencies, 50):>7.2f} "
+              f"{percentile(latencies, 95):>7.2f} {wall:>7.2f} {pages_ok:>4}/{args.apps:<4}")
+        metrics[f"{mode}_calls"] = calls
+        metrics[f"{mode}_p50_ms"] = percentile(latencies, 50) * 1000
+        metrics[f"{mode}_p95_ms"] = percentile(latencies, 95) * 1000
+        if mode == "packed":
+            metrics["packed_pages_ok"] = pages_ok
+    return handle_baseline("pack", metrics, args, higher_is_better={"packed_pages_ok"})
+
+
+def _footer_forms(forms, text_layer, seed=0):
+    """
+    Scanned forms of 2-4 pages footed "Page X of Y", every other one ending
+    in an acknowledgement slip, as [[(label, pdf page bytes)]]. Each page
+    carries its label ("form F page P") and, with text_layer, its footer as
+    invisible text, the way a searchable scan does.
+    """
+    import fitz
+    from utils import pages_to_pdf_bytes
+
+    rng = np.random.default_rng(seed)
+    out = []
+    for f in range(forms):
+        total = int(rng.integers(2, 5))
+        pages = []
+        for n in range(1, total + 1):
+            footer = f"Page {n} of {total}"
+            if n == total and f % 2:
+                footer += "   Applicant Acknowledgement Slip"
+            image = synthetic_page(seed + f * 10 + n, 827, 1170)
+            image[1110:1150] = 235
+            cv2.putText(image, footer, (60, 1140), cv2.FONT_HERSHEY_SIMPLEX, 0.9, 20, 2)
+            with fitz.open(stream=pages_to_pdf_bytes([image]), filetype="pdf") as doc:
+                page = doc[0]
+                label = f"form {f} page {n}"
+                page.insert_text((20, 20), label, fontsize=6, render_mode=3)
+                if text_layer:
+                    page.insert_text((30, page.rect.height - 12), footer, fontsize=9, render_mode=3)
+                pages.append((label, doc.tobytes()))
+        out.append(pages)
+    return out
+
+
+def _write_footer_scenario(directory, forms, scenario):
+    """Write the forms as the scenario's files, in arrival order."""
+    import fitz
+
+    def write(name, pages):
+        path = os.path.join(directory, name)
+        with fitz.open() as doc:
+            for _, content in pages:
+                with fitz.open(stream=content, filetype="pdf") as page:
+                    doc.insert_pdf(page)
+            doc.save(path)
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    if scenario == "loose":      # one file per page
+        return [write(f"scan_{i:04d}.pdf", [page]) for i, page in enumerate(p for form in forms for p in form)]
+    if scenario == "stacked":    # the whole batch in one PDF
+        return [write("stack.pdf", [p for form in forms for p in form])]
+    # mixed: in turn a whole form, a form as loose pages, two forms in one PDF
+    paths, f, turn = [], 0, 0
+    while f < len(forms):
+        if turn % 3 == 0:
+            paths.append(write(f"form_{f:04d}.pdf", forms[f]))
+            f += 1
+        elif turn % 3 == 1:
+            paths += [write(f"form_{f:04d}_{n}.pdf", [page]) for n, page in enumerate(forms[f], start=1)]
+            f += 1
+        else:
+            paths.append(write(f"forms_{f:04d}.pdf", [page for form in forms[f:f + 2] for page in form]))
+            f += 2
+        turn += 1
+    return paths
+
+
+def bench_footers(args):
+    """
+    Footer-based grouping (grouping.py): applications rebuilt from loose
+    pages, stacked PDFs and a mix of both, checked against the forms they
+    came from; render time of the footer strip at FOOTER_DPI vs. the legacy
+    full page at 1.5x; footer OCR time and cache hits where tesseract is
+    installed.
+    """
+    if "config" in sys.modules:
+        raise SystemExit("footers must run in a fresh process (config is already imported)")
+
+    data_dir = tempfile.mkdtemp(prefix="anjuman_bench_")
+    os.environ["ANJUMAN_DATA_DIR"] = data_dir
+    try:
+        import fitz
+        from config import FOOTER_DPI, PAGE_FOOTER_CROP_RATIO
+        from grouping import FooterGrouper, ocr_available
+        from utils import render_footer
+
+        forms = _footer_forms(args.forms, not args.no_text_layer)
+        truth = [[label for label, _ in form] for form in forms]
+        pages = sum(map(len, truth))
+        ocr = ocr_available()
+        print(f"{args.forms} forms, {pages} pages, footers {'in a text layer' if not args.no_text_layer else 'scanned only'}"
+              f"; tesseract {'available' if ocr else 'not installed'}")
+        if args.no_text_layer and not ocr:
+            print("WARNING: without a text layer or tesseract every file is its own application")
+
+        def labels(path):
+            with fitz.open(path) as doc:
+                return [" ".join(p.get_text("text", clip=fitz.Rect(0, 0, 200, 30)).split()) for p in doc]
+
+        print(f"\n{'scenario':<9} {'files':>6} {'apps':>5} {'correct':>8} {'ms/page':>8} {'OCRed':>6} {'cached':>7}")
+        metrics = {}
+        for scenario in ("loose", "stacked", "mixed"):
+            directory = os.path.join(data_dir, scenario)
+            paths = _write_footer_scenario(directory, forms, scenario)
+            grouper = FooterGrouper(archive_dir=os.path.join(directory, "archive"))
+            start = time.perf_counter()
+            groups = grouper.group(paths)
+            elapsed = time.perf_counter() - start
+            found = [[label for path in group for label in labels(path)] for group in groups]
+            correct = sum(g in truth for g in found)
+            stats = grouper.stats()
+            if ocr:  # the same footers again: all from the cache
+                FooterGrouper(archive_dir=os.path.join(directory, "archive")).group(
+                    _write_footer_scenario(os.path.join(directory, "again"), forms, scenario))
+            print(f"{scenario:<9} {len(paths):>6} {len(groups):>5} {correct:>4}/{args.forms:<3} "
+                  f"{elapsed / pages * 1000:>8.2f} {stats['ocr_pages']:>6} {stats['ocr_cached']:>7}")
+            metrics[f"{scenario}_correct"] = correct / args.forms
+            metrics[f"{scenario}_ms_per_page"] = elapsed / pages * 1000
+
+        # Footer image per page: legacy full render + crop vs. the clip alone
+        stack = _write_footer_scenario(os.path.join(data_dir, "render"), forms, "stacked")[0]
+        legacy, clip, sizes = [], [], []
+        with fitz.open(stack) as doc:
+            for page in doc:
+                start = time.perf_counter()
+                pix = page.get_pixmap(matrix=fitz.Matrix(1.5, 1.5))
+                img = cv2.cvtColor(np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.width, 3),
+                                   cv2.COLOR_RGB2GRAY)
+                footer = img[int(img.shape[0] * (1 - PAGE_FOOTER_CROP_RATIO)):]
+                legacy.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                strip = render_footer(page)
+                clip.append(time.perf_counter() - start)
+                sizes.append((footer.size, strip.size))
+        print(f"\nfooter render per page: legacy full page 1.5x {percentile(legacy, 50) * 1000:.2f} ms "
+              f"({sizes[0][0] / 1e3:.0f} kpx strip), clip at {FOOTER_DPI} dpi {percentile(clip, 50) * 1000:.2f} ms "
+              f"({sizes[0][1] / 1e3:.0f} kpx)")
+        metrics["legacy_render_ms"] = percentile(legacy, 50) * 1000
+        metrics["clip_render_ms"] = percentile(clip, 50) * 1000
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    name = "footers-scanned" if args.no_text_layer else "footers"
+    return handle_baseline(name, metrics, args,
+                           higher_is_better={"loose_correct", "stacked_correct", "mixed_correct"})
+
+
+# Modules the API process should only load on first use (or never, outside workers)
+HEAVY_MODULES = ("cv2", "fitz", "numpy", "PIL", "PyPDF2", "reportlab", "google.cloud.documentai_v1",
+                 "worker", "pipeline", "ingest_daemon", "pdf_report")
+
+
+def _importtime(module, env):
+    """{module: (self us, cumulative us)} from one `python -X importtime -c "import module"`."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          env=env, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|", 2)
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def bench_importtime(args):
+    """
+    Cold import time of the API entry point, from `python -X importtime`:
+    total and the slowest top-level imports (median of --runs fresh
+    processes), and which heavy modules got loaded. Exits non-zero when the
+    total is over --budget-ms or (for a light module) a heavy one is imported.
+    """
+    data_dir = tempfile.mkdtemp(prefix="anjuman_bench_")
+    env = dict(os.environ, ANJUMAN_DATA_DIR=data_dir, DOC_AI_BACKEND="fake")
+    try:
+        runs = [_importtime(args.module, env) for _ in range(args.runs)]
+        created = os.listdir(data_dir)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    total_ms = percentile([r[args.module][1] for r in runs], 50) / 1000
+    last = runs[-1]
+    heavy = sorted(m for m in HEAVY_MODULES if m in last and m != args.module)
+    top = sorted(((percentile([r.get(name, (0, 0))[1] for r in runs], 50), name)
+                  for name in last if "." not in name and name != args.module), reverse=True)
+
+    print(f"import {args.module}: {total_ms:.0f} ms (median of {args.runs}), {len(last)} modules")
+    print(f"\n{'cumulative ms':>14}  module")
+    for us, name in top[:args.top]:
+        print(f"{us / 1000:>14.1f}  {name}")
+    print(f"\nheavy modules loaded: {', '.join(heavy) or 'none'}")
+    if created:
+        print(f"WARNING: importing created files in the data directory: {', '.join(sorted(created))}")
+
+    status = handle_baseline(f"importtime-{args.module}", {"import_ms": total_ms, "modules": len(last)}, args)
+    if args.budget_ms and total_ms > args.budget_ms:
+        print(f"OVER BUDGET: {total_ms:.0f} ms > {args.budget_ms:.0f} ms")
+        status = 1
+    if heavy and args.module not in HEAVY_MODULES:
+        status = 1
+    return status
+
+
+def _core_counts():
+    cores = os.cpu_count() or 1
+    counts, n = [], 1
+    while n < cores:
+        counts.append(n)
+        n *= 2
+    return counts + [cores]
+
+
+COMMANDS = {
+    "pages": bench_pages,
+    "e2e": bench_e2e,
+    "mapper": bench_mapper,
+    "table": bench_table,
+    "report": bench_report,
+    "profiles": bench_profiles,
+    "payload": bench_payload,
+    "dedup": bench_dedup,
+    "pack": bench_pack,
+    "footers": bench_footers,
+    "importtime": bench_importtime,
+}
+
+
+def _add_baseline_args(p):
+    p.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    p.add_argument("--check", action="store_true", help="fail on regression vs. the stored baseline")
+    p.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression (default 0.15)")
+    p.add_argument("--min-delta-ms", type=float, default=10.0, help="ignore timing changes smaller than this")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Anjuman pipeline benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("pages", help="page preprocessing throughput vs. core count")
+    p.add_argument("--pages", type=int, default=32)
+    p.add_argument("--workers", default="", help="comma-separated pool sizes (default: 1,2,4..cores)")
+
+    p = sub.add_parser("e2e", help="end-to-end run_once over synthetic forms with the fake Document AI")
+    p.add_argument("--apps", type=int, default=8)
+    p.add_argument("--pages", type=int, default=4, help="pages per application")
+    p.add_argument("--workers", type=int, default=2, help="run_once parallel_workers (with --serial)")
+    p.add_argument("--serial", action="store_true",
+                   help="whole applications per worker thread instead of the staged pipeline")
+    p.add_argument("--eager-report", action="store_true",
+                   help="render every PDF report in the worker instead of on first request")
+    p.add_argument("--pack", action="store_true", help="pack several applications per Document AI request")
+    p.add_argument("--ocr-latency", type=float, default=0.5, help="fake Document AI seconds per request")
+    p.add_argument("--ocr-page-latency", type=float, default=0.1, help="fake Document AI seconds per page")
+    p.add_argument("--keep", action="store_true", help="keep the temporary data directory")
+    _add_baseline_args(p)
+
+    p = sub.add_parser("mapper", help="field extraction micro-benchmark vs. the legacy keyword search")
+    p.add_argument("--sizes", default="4,16,64", help="comma-separated document lengths in pages")
+    p.add_argument("--repeat", type=int, default=50)
+    _add_baseline_args(p)
+
+    p = sub.add_parser("table", help="FamilyMembers table parsing on dense synthetic tables")
+    p.add_argument("--rows", default="12,40,120", help="comma-separated member row counts")
+    p.add_argument("--words", type=int, default=2, help="tokens per text cell")
+    p.add_argument("--repeat", type=int, default=50)
+    _add_baseline_args(p)
+
+    p = sub.add_parser("report", help="PDF report size and render time per application")
+    p.add_argument("--apps", type=int, default=4)
+    p.add_argument("--pages", type=int, default=4, help="pages per application")
+    p.add_argument("--quality", default="draft,standard,archival", help="comma-separated quality tiers")
+    _add_baseline_args(p)
+
+    p = sub.add_parser("profiles", help="preprocessing profiles: CPU per page and field accuracy on fixed samples")
+    p.add_argument("--samples", type=int, default=12, help="forms in the sample set (each with a blank page)")
+    _add_baseline_args(p)
+
+    p = sub.add_parser("payload", help="Document AI upload size per application and fake OCR round trip")
+    p.add_argument("--apps", type=int, default=6, help="applications (every other one with a photo on page 1)")
+    p.add_argument("--pages", type=int, default=4, help="pages per application")
+    p.add_argument("--mbps", type=float, default=10.0, help="uplink to Document AI in Mbit/s")
+    p.add_argument("--ocr-latency", type=float, default=0.5, help="fake Document AI seconds per request")
+    p.add_argument("--ocr-page-latency", type=float, default=0.1, help="fake Document AI seconds per page")
+    _add_baseline_args(p)
+
+    p = sub.add_parser("dedup", help="near-duplicate detection: copies linked, false matches, lookup time")
+    p.add_argument("--apps", type=int, default=8, help="applications in the first run (and new ones in the second)")
+    p.add_argument("--copies", type=int, default=8, help="re-exported copies in the second run")
+    p.add_argument("--mode", default="link", choices=("flag", "link"))
+    p.add_argument("--index-apps", type=int, default=10000, help="applications in the lookup benchmark's index")
+    _add_baseline_args(p)
+
+    p = sub.add_parser("pack", help="applications per Document AI request and OCR latency with request packing")
+    p.add_argument("--apps", type=int, default=24)
+    p.add_argument("--pages", type=int, default=4, help="pages per application")
+    p.add_argument("--interval", type=float, default=0.1, help="seconds between arriving applications")
+    p.add_argument("--max-pages", type=int, default=15, help="pages per packed request")
+    p.add_argument("--wait", type=float, default=0.25, help="seconds a partly filled request waits")
+    p.add_argument("--concurrency", type=int, default=4, help="Document AI requests in flight")
+    p.add_argument("--ocr-latency", type=float, default=1.0, help="fake Document AI seconds per request")
+    p.add_argument("--ocr-page-latency", type=float, default=0.25, help="fake Document AI seconds per page")
+    _add_baseline_args(p)
+
+    p = sub.add_parser("footers", help="footer-based grouping of loose and stacked pages into applications")
+    p.add_argument("--forms", type=int, default=12, help="forms of 2-4 pages in the batch")
+    p.add_argument("--no-text-layer", action="store_true",
+                   help="footers only in the scanned image (needs tesseract)")
+    _add_baseline_args(p)
+
+    p = sub.add_parser("importtime", help="cold import time of the API process and heavy modules it loads")
+    p.add_argument("--module", default="main", help="module to import (default: main)")
+    p.add_argument("--runs", type=int, default=5, help="fresh interpreters to time")
+    p.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    p.add_argument("--budget-ms", type=float, default=800.0, help="fail above this import time (0: no budget)")
+    _add_baseline_args(p)
+
+    args = parser.parse_args(argv)
+    return COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
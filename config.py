@@ -1,3 +1,9 @@
+"""
+Settings for the backend. Importing this module only reads the environment:
+directories are created by ensure_dirs(), which the worker and the API call
+before they write anything.
+"""
+
 import os
 
 # =========================
@@ -8,44 +14,186 @@ import os
 PROJECT_ID = "ai-form-416805"
 LOCATION = "us"  # valid regions: us, eu
 PROCESSOR_ID = "8c59dbf065df1fa2"  # your FORM_PARSER_PROCESSOR
+PROCESSOR_VERSION = ""  # pin a processor version; empty uses the processor's default
+# "google" calls the real service; "fake" uses the local stand-in in
+# fake_docai.py (offline runs, CI and benchmarks).
+DOC_AI_BACKEND = os.environ.get("DOC_AI_BACKEND", "google")
+# Service account key for the "google" backend, exported when the client is first created
 SERVICE_ACCOUNT_FILE = r"C:\Users\HI\Desktop\intelligent-form-processor-local\backend\anjuman_backend\ai-form-416805-bdea6b1fbf2e.json"
 
-# Export environment variables to ensure client libraries work correctly
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = SERVICE_ACCOUNT_FILE
-os.environ["GCP_PROJECT_ID"] = PROJECT_ID
-os.environ["DOCUMENT_AI_LOCATION"] = LOCATION
-os.environ["DOCUMENT_AI_PROCESSOR_ID"] = PROCESSOR_ID
-
 # =========================
 # Local Directories
 # =========================
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+# Root for incoming/, work/, results/ and the local DB (override with ANJUMAN_DATA_DIR)
+DATA_DIR = os.path.abspath(os.environ.get("ANJUMAN_DATA_DIR", BASE_DIR))
 
-INCOMING_DIR = os.path.join(BASE_DIR, "incoming")          # scanned images dropped here
-WORK_DIR = os.path.join(BASE_DIR, "work")
+INCOMING_DIR = os.path.join(DATA_DIR, "incoming")          # scanned images dropped here
+WORK_DIR = os.path.join(DATA_DIR, "work")
+ARCHIVE_DIR = os.path.join(WORK_DIR, "archive")            # source PDFs of processed applications
 PDFS_DIR = os.path.join(WORK_DIR, "pdfs")                  # converted 4-page PDFs
-OCR_RAW_DIR = os.path.join(WORK_DIR, "ocr_raw")            # raw Document AI JSON
-DRAFTS_DIR = os.path.join(BASE_DIR, "results", "drafts")   # structured JSON outputs
-REPORTS_DIR = os.path.join(BASE_DIR, "results", "reports") # human-readable PDF summaries
+OCR_RAW_DIR = os.path.join(WORK_DIR, "ocr_raw")            # raw Document AI output archives
+DRAFTS_DIR = os.path.join(DATA_DIR, "results", "drafts")   # structured JSON outputs
+REPORTS_DIR = os.path.join(DATA_DIR, "results", "reports") # human-readable PDF summaries
+CLAIM_DIR = os.path.join(WORK_DIR, "claimed")              # incoming PDFs taken by a worker run
+FAILED_DIR = os.path.join(WORK_DIR, "failed")              # PDFs whose processing failed
+UPLOAD_DIR = os.path.join(WORK_DIR, "uploads")             # uploads being received / unpacked
+OCR_CACHE_DIR = os.path.join(WORK_DIR, "ocr_cache")        # Document AI results keyed by PDF hash
+REPORT_SOURCE_DIR = os.path.join(WORK_DIR, "report_sources") # merged PDFs reports are rendered from
+REPORT_CACHE_DIR = os.path.join(WORK_DIR, "report_cache")   # reports rendered on request
+PROFILE_DIR = os.path.join(WORK_DIR, "profiles")           # per-job profiles (profiling.py)
 TEMPLATE_FILE = os.path.join(BASE_DIR, "template.json")
+DB_FILE = os.path.join(DATA_DIR, "local_db.sqlite3")         # form records + app_id counter
+LEGACY_DB_FILE = os.path.join(DATA_DIR, "local_db.json")     # migrated into DB_FILE on first open
 
 # =========================
 # Processing Settings
 # =========================
 
-# Detect footers to auto-group pages per application
+# Detect footers to auto-group pages per application (grouping.py): a
+# "Page X of Y" footer places a page in its form, and the acknowledgement
+# slip ends one. Footers are read from the PDF text layer, or by OCR of the
+# footer strip alone, rendered at FOOTER_DPI.
 PAGE_FOOTER_CROP_RATIO = 0.12  # bottom 12% of image height
 FOOTER_PATTERNS = [
     "applicant acknowledgement slip",
     "acknowledgement slip",
     r"page\s*\d+\s*of\s*\d+"
 ]
+FOOTER_GROUPING = True      # False: every PDF is one application
+FOOTER_DPI = 100
+FOOTER_OCR_WORKERS = os.cpu_count() or 1  # footer OCR threads (tesseract runs as a subprocess)
+FOOTER_GROUP_WAIT = 30.0    # seconds the ingest daemon waits for the rest of an incomplete form
+
+# Pages are rendered, preprocessed and merged in memory. Set this to also
+# write page JPEGs to work/app_<id>/ and the merged PDF to work/pdfs/.
+KEEP_INTERMEDIATE_FILES = False
+
+# A job still marked running is resumed by a new submission of the same
+# source only once its owner is gone: a dead process on this host, or no
+# checkpoint for JOB_STALE_SECONDS from a process elsewhere.
+JOB_STALE_SECONDS = 3600
+
+# dpi the merged PDF declares for the preprocessed pages
+PDF_RESOLUTION = 100.0
+
+# Preprocessing profiles: render dpi (capped at the scan's own resolution)
+# and the denoising filter run before Otsu binarization, a median filter of
+# size ksize or a bilateral filter of diameter d. Compare them with
+# `python benchmark.py profiles`.
+PREPROCESS_PROFILE = "balanced"
+PREPROCESS_PROFILES = {
+    "fast": {"dpi": 150, "denoise": "median", "ksize": 3},
+    "balanced": {"dpi": 200, "denoise": "bilateral", "d": 5},
+    "max_quality": {"dpi": 300, "denoise": "bilateral", "d": 9},
+}
+SKIP_BLANK_PAGES = True        # drop pages with (almost) no ink before OCR
+BLANK_PAGE_INK_RATIO = 0.001   # share of ink pixels below which a page is blank
+# Pages are binarized, and sent to OCR as 1-bit CCITT G4 images, unless some
+# 1/8 x 1/8 area of the page has more than this share of mid-tone pixels
+# (photos, shading) that thresholding would wipe out; those stay grayscale.
+BILEVEL_MAX_MIDTONE = 0.2
+
+# Near-duplicate applications (dedup.py): pages are hashed after
+# preprocessing and compared with earlier applications before OCR.
+# "flag" processes a copy as usual and names the earlier app_id in its
+# metadata.dedup; "link" skips OCR and the new record and lists the copy in
+# the earlier application's metadata.dedup.linked; "off" disables hashing.
+DEDUP_MODE = "flag"
+DEDUP_MAX_DISTANCE = 128       # differing bits (of 1024) for two pages to match
+DEDUP_MAX_TILE_DISTANCE = 12   # differing bits (of 64) allowed in any one of the 16 page tiles
+
+# Processes used to preprocess pages in parallel (1 = inline, no pool)
+PREPROCESS_WORKERS = os.cpu_count() or 1
+
+# Ingestion daemon (ingest_daemon.py)
+INGEST_DAEMON_ENABLED = True   # main.py starts the daemon with the API
+INGEST_WORKERS = 2             # applications processed concurrently
+INGEST_QUEUE_SIZE = 16         # claimed PDFs waiting for a worker
+INGEST_USE_INOTIFY = True      # falls back to polling where inotify is unavailable
+INGEST_POLL_INTERVAL = 1.0     # seconds between directory scans
+INGEST_STABLE_SECONDS = 0.5    # unchanged size/mtime needed for files inotify did not see closed
+
+# /upload-zip streaming
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # bytes per read/write when receiving and unpacking uploads
 
 # Document AI request polling
 DOC_AI_POLL_INTERVAL = 3       # seconds between status checks
 DOC_AI_TIMEOUT = 600           # max wait time (seconds) per document
 
+# Local Document AI stand-in (fake_docai.py, DOC_AI_BACKEND = "fake")
+FAKE_DOC_AI_LATENCY = float(os.environ.get("FAKE_DOC_AI_LATENCY", "1.0"))            # seconds per request
+FAKE_DOC_AI_PAGE_LATENCY = float(os.environ.get("FAKE_DOC_AI_PAGE_LATENCY", "0.25")) # extra seconds per page
+FAKE_DOC_AI_ERROR_RATE = float(os.environ.get("FAKE_DOC_AI_ERROR_RATE", "0"))        # share of calls failing (retryable)
+FAKE_DOC_AI_UPLOAD_MBPS = float(os.environ.get("FAKE_DOC_AI_UPLOAD_MBPS", "0"))      # uplink for the PDF upload (0 = instant)
+
+# OCR result cache (ocr_cache.py)
+OCR_CACHE_ENABLED = True
+OCR_CACHE_MAX_BYTES = 2 * 1024 ** 3  # LRU eviction above 2 GB
+
+# Raw OCR archives (ocr_store.py): compressed Document proto + summary JSON,
+# written on a background thread
+OCR_ARCHIVE_ENABLED = True
+OCR_ARCHIVE_COMPRESSION = "auto"  # "zstd" (needs zstandard), "gzip", or "auto" = zstd if installed
+OCR_ARCHIVE_LEVEL = 6             # compression level
+
+# Async Document AI client (document_ai_client.AsyncDocumentAIClient)
+DOC_AI_MAX_IN_FLIGHT = 4       # concurrent requests in flight
+DOC_AI_RATE_LIMIT = 2.0        # sustained requests per second (token bucket)
+DOC_AI_BURST = 4               # token bucket capacity
+DOC_AI_MAX_RETRIES = 5         # retries on throttling / transient errors
+DOC_AI_BACKOFF_BASE = 1.0      # seconds; doubled per retry, with full jitter
+DOC_AI_BACKOFF_MAX = 30.0      # cap on a single backoff delay (seconds)
+DOC_AI_BREAKER_THRESHOLD = 5   # consecutive failures that open the circuit
+DOC_AI_BREAKER_RESET = 60      # seconds the circuit stays open before a trial call
+
+# Request packing (ocr_packer.py): the pipeline sends several applications'
+# merged PDFs to Document AI as one request and splits the result per
+# application. A partly filled request waits up to OCR_PACK_WAIT seconds for
+# more applications. Off until the split has been checked against the real
+# service's output on packed PDFs (the local stand-in cannot show it).
+OCR_PACK_ENABLED = False
+OCR_PACK_MAX_PAGES = 15               # pages per synchronous form parser request
+OCR_PACK_MAX_BYTES = 20 * 1024 ** 2   # request size limit of synchronous processing
+OCR_PACK_WAIT = 0.25
+
+# Staged pipeline (pipeline.py): workers per step and queue bounds
+PIPELINE_ENABLED = True                          # run_once / ingest daemon use the pipeline
+PIPELINE_PREPARE_WORKERS = 2                     # threads feeding pages to the preprocessing pool
+PIPELINE_OCR_CONCURRENCY = DOC_AI_MAX_IN_FLIGHT  # Document AI requests in flight
+PIPELINE_PERSIST_WORKERS = 2                     # map + JSON + DB
+PIPELINE_REPORT_WORKERS = 2                      # report rendering + archiving
+PIPELINE_QUEUE_SIZE = 4                          # applications waiting between two steps
+PIPELINE_MAX_IN_FLIGHT = 12                      # applications inside the pipeline at once
+
+# Reports (report_cache.py): the worker keeps the merged PDF and the API
+# renders each report on first request
+REPORT_EAGER = False                      # True: render every report in the worker instead
+REPORT_CACHE_MAX_BYTES = 512 * 1024 ** 2  # LRU eviction of rendered reports above 512 MB
+REPORT_SOURCE_MAX_BYTES = 2 * 1024 ** 3  # oldest merged PDFs pruned above 2 GB (reports then
+                                         # render from the archived source PDFs)
+
+# Report page images: pixels per inch at their size on the A4 report page,
+# 1-bit encoding for two-tone (binarized) pages, JPEG quality for the rest
+# (None = lossless)
+REPORT_QUALITY = "standard"
+REPORT_QUALITY_TIERS = {
+    "draft": {"dpi": 100, "bilevel": True, "jpeg_quality": 50},
+    "standard": {"dpi": 150, "bilevel": True, "jpeg_quality": 75},
+    "archival": {"dpi": 300, "bilevel": True, "jpeg_quality": None},
+}
+
+# Prometheus metrics (metrics.py), served by the API on GET /metrics
+METRICS_ENABLED = True
+
+# Per-job profiling (profiling.py): the jobs picked here, or through
+# POST /profiling, run each stage under cProfile and tracemalloc; the
+# artifacts are served by GET /jobs/{app_id}/profile.
+PROFILE_SAMPLE_RATE = 0.0      # share of jobs profiled (0 = off)
+PROFILE_APP_IDS = []           # app_ids always profiled, e.g. a failed job before its retry
+PROFILE_TOP_ALLOCATIONS = 15   # allocation sites kept per stage
+
 # Confidence threshold for adjudication
 CONFIDENCE_THRESHOLD = 0.75
 
@@ -56,12 +204,23 @@ USE_GEMINI = False             # set True to enable Gemini adjudication
 MAX_GEMINI_CALLS_PER_APP = 6   # max fallback calls per application
 
 # =========================
-# Ensure Directory Structure Exists
+# Directory Structure
 # =========================
-for d in [INCOMING_DIR, WORK_DIR, PDFS_DIR, OCR_RAW_DIR, DRAFTS_DIR, REPORTS_DIR]:
-    os.makedirs(d, exist_ok=True)
+_dirs_ready = False
+
+
+def ensure_dirs():
+    """Create the data directories (once per process)."""
+    global _dirs_ready
+    if _dirs_ready:
+        return
+    for d in [INCOMING_DIR, WORK_DIR, ARCHIVE_DIR, CLAIM_DIR, FAILED_DIR, PDFS_DIR, OCR_RAW_DIR, DRAFTS_DIR,
+              REPORTS_DIR]:
+        os.makedirs(d, exist_ok=True)
+    _dirs_ready = True
+
 
-print(f"[CONFIG] Loaded configuration for project: {PROJECT_ID}")
-print(f"[CONFIG] Processor ID: {PROCESSOR_ID}")
-print(f"[CONFIG] Service Account: {SERVICE_ACCOUNT_FILE}")
-print(f"[CONFIG] Working directory: {BASE_DIR}")
+def summary():
+    """One line describing the loaded configuration, for startup logs."""
+    return (f"project {PROJECT_ID}, processor {PROCESSOR_ID} (backend: {DOC_AI_BACKEND}), "
+            f"data in {DATA_DIR}")
@@ -0,0 +1,161 @@
+"""
+dedup.py  –  Near-duplicate detection for re-uploaded applications
+------------------------------------------------------------------
+Every preprocessed page gets a perceptual hash, and an application whose
+pages all lie within a small Hamming distance of an earlier application's
+pages is a near-duplicate of it (worker stage "dedup", before OCR).
+
+The hash is a tiled pHash: the page is smoothed at 512 x 512, reduced to a
+4 x 4 grid of 32 x 32 blocks, and each block contributes the signs of its
+8 x 8 low-frequency DCT coefficients against their median: 16 x 64 = 1024
+bits. A single 64-bit hash of the whole page cannot tell two applicants
+apart, since every form is the same printed template and the handwriting is
+a small part of the page; per block, it can. A page matches when no block
+differs in more than DEDUP_MAX_TILE_DISTANCE bits and the whole hash in no
+more than DEDUP_MAX_DISTANCE. Copies that were re-exported, recompressed or
+resized stay inside those limits; a fresh scan of the same paper (rotated or
+shifted by more than a few pixels) usually does not.
+
+Hashes are stored in the ``page_hashes`` table and held in memory by page
+position, picking up rows written by other processes on each lookup; an
+application's new rows (a retried job) replace the ones held for it. A copy
+keeps its page order, so page k is only compared with the k-th pages of
+earlier applications, and only applications whose every earlier page
+matched stay candidates. Within a position the scan is linear: pages of one
+template all lie within a few hundred bits of each other, well inside the
+search radius a copy needs, so BK-trees and multi-index hashing have next
+to nothing to prune there and measured slower than the plain scan.
+"""
+
+import threading
+
+import cv2
+import numpy as np
+
+from config import DEDUP_MAX_DISTANCE, DEDUP_MAX_TILE_DISTANCE
+from local_db_manager import save_page_hashes, page_hashes_since
+
+SMOOTH_SIZE = 512  # side the page is smoothed at, whatever its dpi
+SMOOTH_SIGMA = 1.5
+GRID = 4     # blocks per side
+BLOCK = 32   # pixels per block side before the DCT
+COEFFS = 8   # low-frequency coefficients kept per side
+TILE_BITS = COEFFS * COEFFS
+HASH_BYTES = GRID * GRID * TILE_BITS // 8
+_TILE_MASK = (1 << TILE_BITS) - 1
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    m = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m.astype(np.float32)
+
+
+_DCT = _dct_matrix(BLOCK)[:COEFFS]
+
+
+def page_hash(page):
+    """Tiled pHash of a grayscale page, as HASH_BYTES bytes."""
+    # Smoothing first keeps JPEG artefacts and speckle that survived
+    # binarization from flipping bits in text-heavy blocks.
+    smooth = cv2.resize(page, (SMOOTH_SIZE, SMOOTH_SIZE), interpolation=cv2.INTER_AREA)
+    smooth = cv2.GaussianBlur(smooth, (0, 0), SMOOTH_SIGMA)
+    size = GRID * BLOCK
+    small = cv2.resize(smooth, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+    blocks = small.reshape(GRID, BLOCK, GRID, BLOCK).swapaxes(1, 2).reshape(-1, BLOCK, BLOCK)
+    coeffs = (_DCT @ blocks @ _DCT.T).reshape(len(blocks), TILE_BITS)
+    # The DC term only carries the block's mean brightness.
+    bits = coeffs > np.median(coeffs[:, 1:], axis=1, keepdims=True)
+    return np.packbits(bits).tobytes()
+
+
+def max_tile_distance(a, b):
+    x = a ^ b
+    return max(((x >> (TILE_BITS * i)) & _TILE_MASK).bit_count() for i in range(GRID * GRID))
+
+
+class DedupIndex:
+    """Page hashes of processed applications, searchable by Hamming distance. Thread-safe."""
+
+    def __init__(self, max_distance=DEDUP_MAX_DISTANCE, max_tile_distance=DEDUP_MAX_TILE_DISTANCE,
+                 rows=page_hashes_since):
+        self.max_distance = max_distance
+        self.max_tile_distance = max_tile_distance
+        self._by_page = {}  # page_no -> [(key, app_id)]
+        self._pages = {}    # app_id -> page numbers indexed
+        self._rows = rows  # row_id -> stored (row_id, app_id, page_no, hash) rows after it
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def insert(self, app_id, page_no, digest):
+        """Index one page hash in memory only (add() also stores it)."""
+        self._by_page.setdefault(page_no, []).append((int.from_bytes(digest, "big"), app_id))
+        self._pages.setdefault(app_id, set()).add(page_no)
+
+    def _drop(self, app_id):
+        """Forget app_id's page hashes."""
+        for page_no in self._pages.pop(app_id, ()):
+            self._by_page[page_no] = [entry for entry in self._by_page[page_no] if entry[1] != app_id]
+
+    def refresh(self):
+        """Load hashes stored since the last refresh (by any process)."""
+        with self._lock:
+            seen = set()
+            for row_id, app_id, page_no, digest in self._rows(self._last_id):
+                # save_page_hashes replaces an application's rows as a whole
+                # (a retried job): new rows supersede the ones held for it.
+                if app_id not in seen:
+                    self._drop(app_id)
+                    seen.add(app_id)
+                self.insert(app_id, page_no, digest)
+                self._last_id = row_id
+
+    def add(self, app_id, hashes):
+        """Store and index app_id's page hashes, replacing any it had."""
+        save_page_hashes(app_id, hashes)
+        with self._lock:
+            self._drop(app_id)
+        self.refresh()
+
+    def find(self, hashes, exclude=None):
+        """
+        Earlier applications with the same number of pages as hashes, each
+        page matching the page in the same position, closest first:
+        [{"app_id", "distance"}], where distance is the largest per-page
+        Hamming distance.
+        """
+        if not hashes:
+            return []
+        self.refresh()
+        n = len(hashes)
+        best = None  # app_id -> largest page distance so far
+        with self._lock:
+            for page_no, digest in enumerate(hashes, start=1):
+                key = int.from_bytes(digest, "big")
+                found = {}
+                for other, app_id in self._by_page.get(page_no, ()):
+                    if app_id == exclude or (best is not None and app_id not in best):
+                        continue
+                    d = (key ^ other).bit_count()
+                    if d <= self.max_distance and d < found.get(app_id, d + 1) \
+                            and max_tile_distance(key, other) <= self.max_tile_distance:
+                        found[app_id] = d
+                best = {a: max(d, best[a]) if best else d for a, d in found.items()}
+                if not best:
+                    return []
+            matches = [{"app_id": a, "distance": d} for a, d in best.items() if len(self._pages[a]) == n]
+        return sorted(matches, key=lambda m: (m["distance"], m["app_id"]))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Shared process-wide dedup index."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DedupIndex()
+        return _index
@@ -0,0 +1,59 @@
+"""
+docjson.py  –  Accessors for Document AI output in dict form
+----------------------------------------------------------
+Document AI results reach the mapper as plain dicts, either from
+Document.to_json (camelCase keys) or Document.to_dict (snake_case keys).
+Both spell int64 offsets as strings and omit zero values. These helpers hide
+those differences.
+"""
+
+
+def get(d, camel, snake=None, default=None):
+    """d[camel] or d[snake], whichever is present."""
+    if not d:
+        return default
+    if camel in d:
+        return d[camel]
+    if snake is not None and snake in d:
+        return d[snake]
+    return default
+
+
+def pages(doc):
+    return doc.get("pages") or []
+
+
+def form_fields(page):
+    return get(page, "formFields", "form_fields", []) or []
+
+
+def tokens(page):
+    return page.get("tokens") or []
+
+
+def layout(item):
+    return item.get("layout") or {}
+
+
+def text_segments(anchor):
+    """[(start, end), ...] for a textAnchor."""
+    segments = []
+    for seg in get(anchor, "textSegments", "text_segments", []) or []:
+        start = int(get(seg, "startIndex", "start_index", 0) or 0)
+        end = int(get(seg, "endIndex", "end_index", 0) or 0)
+        segments.append((start, end))
+    return segments
+
+
+def anchor_text(text, anchor):
+    """Text referenced by a textAnchor."""
+    return "".join(text[start:end] for start, end in text_segments(anchor))
+
+
+def layout_text(text, lay):
+    return anchor_text(text, get(lay, "textAnchor", "text_anchor"))
+
+
+def confidence(lay, default=0.0):
+    value = lay.get("confidence") if lay else None
+    return float(value) if value is not None else default
@@ -2,71 +2,390 @@
 document_ai_client.py  –  Offline/local-first Document AI client
 ---------------------------------------------------------------
 Processes each PDF locally (synchronous mode) with Google Document AI.
-No Cloud Storage is used; all I/O happens on local disk.
+No Cloud Storage is used; all I/O happens on local disk. The Document is
+returned in memory; the raw output is archived in the background by
+ocr_store.
+
+AsyncDocumentAIClient keeps several requests in flight over the async
+Document AI transport, with a token-bucket quota limiter, exponential
+backoff with jitter on retryable errors, a circuit breaker and a
+per-request deadline of DOC_AI_TIMEOUT seconds.
 
 Requirements:
     pip install google-cloud-documentai
 """
 
 import os
-import json
 import time
+import random
+import asyncio
+import threading
+from google.api_core import exceptions as api_exceptions
 from google.cloud import documentai_v1 as documentai
 from config import (
     PROJECT_ID,
     LOCATION,
     PROCESSOR_ID,
+    PROCESSOR_VERSION,
+    DOC_AI_BACKEND,
     SERVICE_ACCOUNT_FILE,
-    OCR_RAW_DIR,
-    DOC_AI_POLL_INTERVAL,
     DOC_AI_TIMEOUT,
+    DOC_AI_MAX_IN_FLIGHT,
+    DOC_AI_RATE_LIMIT,
+    DOC_AI_BURST,
+    DOC_AI_MAX_RETRIES,
+    DOC_AI_BACKOFF_BASE,
+    DOC_AI_BACKOFF_MAX,
+    DOC_AI_BREAKER_THRESHOLD,
+    DOC_AI_BREAKER_RESET,
 )
+from ocr_cache import cache_key, get_cache
+from ocr_store import archive_async
+from metrics import OCR_REQUESTS, OCR_REQUEST_SECONDS, OCR_IN_FLIGHT, OCR_UPLOAD_BYTES, OCR_CACHE_HITS
+
+
+def make_client(asynchronous=False):
+    """Create the Document AI client selected by DOC_AI_BACKEND."""
+    if DOC_AI_BACKEND == "fake":
+        from fake_docai import FakeDocumentProcessorServiceClient, FakeDocumentProcessorServiceAsyncClient
+        return FakeDocumentProcessorServiceAsyncClient() if asynchronous else FakeDocumentProcessorServiceClient()
+
+    # Explicitly load credentials
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = SERVICE_ACCOUNT_FILE
+    if asynchronous:
+        return documentai.DocumentProcessorServiceAsyncClient()
+    return documentai.DocumentProcessorServiceClient()
+
+
+_client = None
+_client_lock = threading.Lock()
+
 
-# Explicitly load credentials
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = SERVICE_ACCOUNT_FILE
+def get_client():
+    """The shared synchronous client, created on first use (not at import)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = make_client()
+        return _client
 
-# Instantiate client once
-client = documentai.DocumentProcessorServiceClient()
 
-def process_pdf_local(pdf_path):
+PROCESSOR_NAME = f"projects/{PROJECT_ID}/locations/{LOCATION}/processors/{PROCESSOR_ID}"
+if PROCESSOR_VERSION:
+    PROCESSOR_NAME += f"/processorVersions/{PROCESSOR_VERSION}"
+
+# Errors worth retrying: throttling, transient server faults and timeouts.
+RETRYABLE_ERRORS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.ResourceExhausted,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.GatewayTimeout,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.Aborted,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+
+def process_pdf_local(pdf_path, content=None):
     """
     Processes a single PDF synchronously using Document AI.
-    Works offline (no GCS) and writes output JSON locally.
+    Works offline (no GCS) and returns the documentai.Document; a compressed
+    copy is archived to OCR_RAW_DIR in the background.
+    If content (PDF bytes) is given it is sent as-is and pdf_path only names
+    the archive; otherwise the PDF is read from pdf_path.
+    Identical content is answered from the OCR cache without calling the API.
     """
-    name = f"projects/{PROJECT_ID}/locations/{LOCATION}/processors/{PROCESSOR_ID}"
-    print(f"[INFO] Processing {os.path.basename(pdf_path)} via Document AI processor {PROCESSOR_ID}")
+    if content is None:
+        with open(pdf_path, "rb") as f:
+            content = f.read()
 
-    with open(pdf_path, "rb") as f:
-        raw_document = {"content": f.read(), "mime_type": "application/pdf"}
+    cache = get_cache()
+    key = cache_key(content) if cache else None
+    document = cache.get(key) if cache else None
+    if document is not None:
+        print(f"[INFO] OCR cache hit for {os.path.basename(pdf_path)}")
+        OCR_CACHE_HITS.inc()
+        archive_async(document, pdf_path)
+        return document
 
-    request = {"name": name, "raw_document": raw_document}
+    print(f"[INFO] Processing {os.path.basename(pdf_path)} via Document AI processor {PROCESSOR_ID}")
+    raw_document = {"content": content, "mime_type": "application/pdf"}
+
+    request = {"name": PROCESSOR_NAME, "raw_document": raw_document}
 
     start = time.time()
-    result = client.process_document(request=request)
+    OCR_IN_FLIGHT.inc()
+    OCR_UPLOAD_BYTES.inc(len(content))
+    try:
+        result = get_client().process_document(request=request, timeout=DOC_AI_TIMEOUT)
+    except Exception:
+        OCR_REQUESTS.labels(outcome="error").inc()
+        raise
+    finally:
+        OCR_IN_FLIGHT.dec()
     elapsed = time.time() - start
+    OCR_REQUESTS.labels(outcome="ok").inc()
+    OCR_REQUEST_SECONDS.observe(elapsed)
     print(f"[INFO] Completed {os.path.basename(pdf_path)} in {elapsed:.1f}s")
 
-    document = result.document
-    out_path = os.path.join(OCR_RAW_DIR, os.path.basename(pdf_path).replace(".pdf", "_ocr.json"))
-    os.makedirs(OCR_RAW_DIR, exist_ok=True)
-
-    with open(out_path, "w", encoding="utf-8") as f:
-        f.write(documentai.Document.to_json(document))
-
-    return out_path
+    if cache:
+        cache.put(key, result.document)
+    archive_async(result.document, pdf_path)
+    return result.document
 
 
 def process_batch_local(pdf_paths):
     """
-    Sequentially process multiple PDFs using local Document AI calls.
+    Process multiple PDFs concurrently through AsyncDocumentAIClient.
+    Returns (document, pdf_path) for every PDF that succeeded; the documents
+    are archived in the background as in process_pdf_local.
     """
+    async def _run():
+        async_client = AsyncDocumentAIClient()
+        contents = []
+        for pdf in pdf_paths:
+            with open(pdf, "rb") as f:
+                contents.append(f.read())
+        return await async_client.process_many(contents)
+
     results = []
-    for idx, pdf in enumerate(pdf_paths, start=1):
-        try:
-            print(f"[BATCH] ({idx}/{len(pdf_paths)}) {os.path.basename(pdf)}")
-            ocr_path = process_pdf_local(pdf)
-            results.append((ocr_path, pdf))
-        except Exception as e:
-            print(f"[ERROR] {pdf}: {e}")
-        time.sleep(DOC_AI_POLL_INTERVAL)  # polite spacing
+    for pdf, outcome in zip(pdf_paths, asyncio.run(_run())):
+        if isinstance(outcome, Exception):
+            print(f"[ERROR] {pdf}: {outcome}")
+            continue
+        archive_async(outcome, pdf)
+        results.append((outcome, pdf))
     return results
+
+
+# ----------------------------------------------------------------------
+# Async client building blocks
+# ----------------------------------------------------------------------
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling Document AI while the circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds, then lets a single trial call through
+    (half-open). A successful trial closes the circuit again.
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self.trial_in_flight):
+            raise CircuitOpenError("Document AI circuit breaker is open")
+        if state == "half_open":
+            self.trial_in_flight = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class AsyncDocumentAIClient:
+    """
+    Concurrent Document AI client for use inside an asyncio event loop.
+
+    `client` can be any object with an awaitable
+    ``process_document(request=..., timeout=...)`` returning a response with a
+    ``.document``; by default the async client for DOC_AI_BACKEND is
+    created on first use. Passing a local fake processor makes the retry,
+    quota and breaker behaviour testable offline.
+
+    Results are looked up in and stored to `cache` (the shared OCR cache by
+    default; pass ``cache=False`` to bypass it).
+    """
+
+    def __init__(
+        self,
+        client=None,
+        processor_name=PROCESSOR_NAME,
+        max_in_flight=DOC_AI_MAX_IN_FLIGHT,
+        rate_limit=DOC_AI_RATE_LIMIT,
+        burst=DOC_AI_BURST,
+        max_retries=DOC_AI_MAX_RETRIES,
+        backoff_base=DOC_AI_BACKOFF_BASE,
+        backoff_max=DOC_AI_BACKOFF_MAX,
+        timeout=DOC_AI_TIMEOUT,
+        breaker=None,
+        cache=None,
+    ):
+        self._client = client
+        self.cache = get_cache() if cache is None else (cache or None)
+        self.processor_name = processor_name
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate_limit, burst)
+        self.breaker = breaker or CircuitBreaker(DOC_AI_BREAKER_THRESHOLD, DOC_AI_BREAKER_RESET)
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = make_client(asynchronous=True)
+        return self._client
+
+    def _backoff(self, attempt):
+        # "Full jitter": uniform over [0, capped exponential delay].
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def process(self, content, mime_type="application/pdf"):
+        """Return the documentai.Document for content, from the OCR cache or
+        by sending it to Document AI."""
+        key = None
+        if self.cache:
+            key = cache_key(content)
+            document = await asyncio.to_thread(self.cache.get, key)
+            if document is not None:
+                OCR_CACHE_HITS.inc()
+                return document
+
+        document = await self._call(content, mime_type)
+        if self.cache:
+            await asyncio.to_thread(self.cache.put, key, document)
+        return document
+
+    async def _call(self, content, mime_type):
+        """Send one document to Document AI with quota, retries and deadline."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        request = {
+            "name": self.processor_name,
+            "raw_document": {"content": content, "mime_type": mime_type},
+        }
+
+        attempt = 0
+        while True:
+            # Waiting for local quota or a free slot is not a service
+            # failure: it stays outside the breaker's accounting.
+            await self._wait_locally(self.bucket.acquire(), deadline)
+            await self._wait_locally(self._in_flight.acquire(), deadline)
+            try:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    OCR_REQUESTS.labels(outcome="error").inc()
+                    raise self._deadline_exceeded()
+                try:
+                    self.breaker.before_call()
+                except CircuitOpenError:
+                    OCR_REQUESTS.labels(outcome="error").inc()
+                    raise
+                started = loop.time()
+                OCR_IN_FLIGHT.inc()
+                OCR_UPLOAD_BYTES.inc(len(content))
+                try:
+                    result = await asyncio.wait_for(
+                        self.client.process_document(request=request, timeout=remaining), remaining
+                    )
+                except asyncio.TimeoutError:
+                    # The request deadline passed: the same DeadlineExceeded
+                    # the local waits raise, not a bare TimeoutError.
+                    self.breaker.record_failure()
+                    error = self._deadline_exceeded()
+                except RETRYABLE_ERRORS as e:
+                    self.breaker.record_failure()
+                    error = e
+                except BaseException as e:
+                    # Non-retryable: the request itself is bad, not the service.
+                    self.breaker.trial_in_flight = False
+                    if not isinstance(e, asyncio.CancelledError):
+                        OCR_REQUESTS.labels(outcome="error").inc()
+                    raise
+                else:
+                    self.breaker.record_success()
+                    OCR_REQUESTS.labels(outcome="ok").inc()
+                    return result.document
+                finally:
+                    OCR_IN_FLIGHT.dec()
+                    OCR_REQUEST_SECONDS.observe(loop.time() - started)
+            finally:
+                self._in_flight.release()
+
+            delay = self._backoff(attempt)
+            if attempt >= self.max_retries or loop.time() + delay >= deadline:
+                OCR_REQUESTS.labels(outcome="error").inc()
+                raise error
+            OCR_REQUESTS.labels(outcome="retry").inc()
+            attempt += 1
+            print(f"[WARN] Document AI call failed ({type(error).__name__}); retry {attempt} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    def _deadline_exceeded(self):
+        return api_exceptions.DeadlineExceeded(f"Document AI deadline of {self.timeout}s exceeded")
+
+    async def _wait_locally(self, waiter, deadline):
+        """
+        Await a local wait (quota token, in-flight slot); DeadlineExceeded if
+        the deadline passes first.
+        """
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            waiter.close()
+        else:
+            try:
+                return await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                pass
+        OCR_REQUESTS.labels(outcome="error").inc()
+        raise self._deadline_exceeded()
+
+    async def process_many(self, contents):
+        """Process several documents concurrently. Returns, in input order,
+        a Document or the exception raised for each one."""
+        return await asyncio.gather(*(self.process(c) for c in contents), return_exceptions=True)
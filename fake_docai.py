@@ -0,0 +1,363 @@
+"""
+fake_docai.py  –  Local stand-in for the Document AI form parser
+----------------------------------------------------------------
+Drop-in replacement for DocumentProcessorServiceClient (and its async
+variant) that answers process_document() without any network access.
+Select it with DOC_AI_BACKEND = "fake" in config.py (or the DOC_AI_BACKEND
+environment variable).
+
+Responses are realistic Document protos: full text, one Page per PDF page
+with dimension, layout, lines and word tokens whose bounding boxes sit in
+the zones of template.json, a page-2 family table laid out on the
+template's columns, "Page X of Y" footers and formFields key/value pairs
+for the HeadOfFamily block. Like the real service, the stand-in knows
+nothing of how the PDF was put together: it reads the whole PDF as one
+continuous form, whatever bookmarks or packing it carries. Content is
+derived from a hash of the PDF bytes, and each page from that hash and its
+page number, so the same PDF always yields the same document.
+
+Latency (per request, per page, and for uploading the PDF over a link of
+FAKE_DOC_AI_UPLOAD_MBPS) and a retryable error rate are configurable to
+exercise the async client and the benchmarks.
+"""
+
+import json
+import time
+import random
+import asyncio
+import hashlib
+
+import fitz  # PyMuPDF
+from google.api_core import exceptions as api_exceptions
+from google.cloud import documentai_v1 as documentai
+
+from config import (
+    TEMPLATE_FILE,
+    FAKE_DOC_AI_LATENCY,
+    FAKE_DOC_AI_PAGE_LATENCY,
+    FAKE_DOC_AI_ERROR_RATE,
+    FAKE_DOC_AI_UPLOAD_MBPS,
+)
+
+Doc = documentai.Document
+
+CHAR_WIDTH = 22   # px per character at the 2480x3508 template base
+TOKEN_HEIGHT = 48
+ROW_HEIGHT = 150  # family table row pitch (room for one wrapped line)
+
+HOF_LABELS = {
+    "name": "Name of Head of Family",
+    "fatherOrHusbandName": "Father / Husband Name",
+    "voterID": "Voter ID",
+    "aadhaarNumber": "Aadhaar No",
+    "gender": "Gender",
+    "age": "Age",
+    "qualification": "Qualification",
+    "occupation": "Occupation",
+    "address": "Address",
+    "ward": "Ward",
+    "mobileNumber": "Mobile",
+    "namazMasjid": "Namaz Masjid",
+}
+
+TABLE_HEADERS = {
+    "memberName": "Member Name",
+    "relationToHOF": "Relation",
+    "gender": "Gender",
+    "age": "Age",
+    "qualification": "Qualification",
+    "aadhaarNumberIfUnder18": "Aadhaar (<18)",
+    "voterIDIfAbove18": "Voter ID (18+)",
+    "occupation": "Occupation",
+}
+
+FIRST_NAMES_M = ["Mohammed", "Abdul", "Imran", "Salim", "Yusuf", "Irfan", "Faisal", "Asif", "Rashid", "Zaid"]
+FIRST_NAMES_F = ["Fatima", "Ayesha", "Zainab", "Nasreen", "Shabana", "Rukhsar", "Sana", "Heena", "Amina", "Noor"]
+LAST_NAMES = ["Shaikh", "Khan", "Ansari", "Qureshi", "Pathan", "Siddiqui", "Sayyed", "Mulla", "Inamdar", "Bagwan"]
+QUALIFICATIONS = ["SSC", "HSC", "BA", "BCom", "BSc", "Diploma", "MA", "None"]
+OCCUPATIONS = ["Business", "Teacher", "Driver", "Tailor", "Student", "Housewife", "Labour", "Clerk", "Retired"]
+STREETS = ["Station Road", "Market Yard", "Nai Basti", "Masjid Lane", "Gandhi Chowk", "Azad Nagar"]
+MASJIDS = ["Jama Masjid", "Noorani Masjid", "Madina Masjid", "Bilal Masjid", "Makki Masjid"]
+RELATIONS = ["Wife", "Son", "Daughter", "Mother", "Father", "Brother", "Sister", "Daughter-in-law"]
+
+_template = None
+
+
+def _load_template():
+    global _template
+    if _template is None:
+        with open(TEMPLATE_FILE, "r", encoding="utf-8") as f:
+            _template = json.load(f)
+    return _template
+
+
+# ----------------------------------------------------------------------
+# Synthetic form content
+# ----------------------------------------------------------------------
+def synthetic_form_values(seed, members=None):
+    """Ground-truth values for one synthetic form. Same seed, same form."""
+    rng = random.Random(seed)
+    last = rng.choice(LAST_NAMES)
+    hof_name = f"{rng.choice(FIRST_NAMES_M)} {last}"
+    hof_age = rng.randint(28, 75)
+    hof = {
+        "name": hof_name,
+        "fatherOrHusbandName": f"{rng.choice(FIRST_NAMES_M)} {last}",
+        "voterID": "".join(rng.choice("ABCDEFGHJKLMNPRSTUVWXYZ") for _ in range(3)) + f"{rng.randrange(10**7):07d}",
+        "aadhaarNumber": " ".join(f"{rng.randrange(10**4):04d}" for _ in range(3)),
+        "gender": "Male",
+        "age": hof_age,
+        "qualification": rng.choice(QUALIFICATIONS),
+        "occupation": rng.choice(OCCUPATIONS[:5]),
+        "address": f"{rng.randint(1, 999)}, {rng.choice(STREETS)}, Near {rng.choice(MASJIDS)}, Ward {rng.randint(1, 40)}",
+        "ward": str(rng.randint(1, 40)),
+        "mobileNumber": str(rng.choice([7, 8, 9])) + f"{rng.randrange(10**9):09d}",
+        "namazMasjid": rng.choice(MASJIDS),
+    }
+
+    family = []
+    for _ in range(members if members is not None else rng.randint(2, 12)):
+        relation = rng.choice(RELATIONS)
+        female = relation in ("Wife", "Daughter", "Mother", "Sister", "Daughter-in-law")
+        age = rng.randint(1, 80)
+        family.append({
+            "memberName": f"{rng.choice(FIRST_NAMES_F if female else FIRST_NAMES_M)} {last}",
+            "relationToHOF": relation,
+            "gender": "F" if female else "M",
+            "age": age,
+            "qualification": rng.choice(QUALIFICATIONS),
+            "aadhaarNumberIfUnder18": f"{rng.randrange(10**12):012d}" if age < 18 else "",
+            "voterIDIfAbove18": ("".join(rng.choice("ABCDEFGHJKLMNPRSTUVWXYZ") for _ in range(3))
+                                 + f"{rng.randrange(10**7):07d}") if age >= 18 else "",
+            "occupation": rng.choice(OCCUPATIONS),
+        })
+
+    return {
+        "HeadOfFamily": hof,
+        "FamilyMembers": family,
+        "HOFVoterIDAttached": rng.random() < 0.8,
+        "dateReceived": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025",
+    }
+
+
+class _DocumentBuilder:
+    """Accumulates document text, tokens, lines and form fields page by page."""
+
+    def __init__(self, width, height, rng):
+        self.width = width
+        self.height = height
+        self.rng = rng
+        self.text = []
+        self.length = 0
+        self.pages = []
+
+    def _segment(self, start, end):
+        return Doc.TextAnchor(text_segments=[Doc.TextAnchor.TextSegment(start_index=start, end_index=end)])
+
+    def _poly(self, x, y, w, h):
+        xs = (x / self.width, (x + w) / self.width)
+        ys = (y / self.height, (y + h) / self.height)
+        return documentai.BoundingPoly(normalized_vertices=[
+            documentai.NormalizedVertex(x=xs[0], y=ys[0]),
+            documentai.NormalizedVertex(x=xs[1], y=ys[0]),
+            documentai.NormalizedVertex(x=xs[1], y=ys[1]),
+            documentai.NormalizedVertex(x=xs[0], y=ys[1]),
+        ])
+
+    def _layout(self, start, end, box, confidence):
+        return Doc.Page.Layout(
+            text_anchor=self._segment(start, end),
+            confidence=confidence,
+            bounding_poly=self._poly(*box),
+        )
+
+    def new_page(self):
+        page = {"number": len(self.pages) + 1, "start": self.length, "tokens": [], "lines": [], "fields": []}
+        self.pages.append(page)
+        return page
+
+    def line(self, page, text, x, y, max_width=None, confidence=None, end="\n"):
+        """Lay text out as word tokens from (x, y), wrapping at max_width,
+        and append `end` to the document text.
+        Returns (start, end, box) of the whole phrase."""
+        text = str(text)
+        start = self.length
+        cx, cy = x, y
+        right = x + (max_width or self.width)
+        x1, y1 = x, y + TOKEN_HEIGHT
+        line_start, line_x = start, x
+        words = text.split(" ") if text else []
+        for i, word in enumerate(words):
+            w = max(len(word), 1) * CHAR_WIDTH
+            if cx + w > right and cx > x:
+                self._close_line(page, line_start, self.length, line_x, cy, cx - line_x)
+                cx, cy = x, cy + TOKEN_HEIGHT + 12
+                line_start = self.length
+            conf = confidence if confidence is not None else self.rng.uniform(0.82, 0.99)
+            token_start = self.length
+            sep = " " if i < len(words) - 1 else ""
+            self._append(word + sep)
+            page["tokens"].append(Doc.Page.Token(layout=self._layout(token_start, token_start + len(word), (cx, cy, w, TOKEN_HEIGHT), conf)))
+            cx += w + CHAR_WIDTH
+            x1, y1 = max(x1, cx - CHAR_WIDTH), cy + TOKEN_HEIGHT
+        stop = self.length
+        if words:
+            self._close_line(page, line_start, stop, line_x, cy, cx - CHAR_WIDTH - line_x)
+        self._append(end)
+        return start, stop, (x, y, x1 - x, y1 - y)
+
+    def _close_line(self, page, start, end, x, y, w):
+        page["lines"].append(Doc.Page.Line(layout=self._layout(start, end, (x, y, max(w, 1), TOKEN_HEIGHT), 0.95)))
+
+    def _append(self, s):
+        self.text.append(s)
+        self.length += len(s)
+
+    def form_field(self, page, name, value):
+        (ns, ne, nbox), (vs, ve, vbox) = name, value
+        page["fields"].append(Doc.Page.FormField(
+            field_name=self._layout(ns, ne, nbox, self.rng.uniform(0.9, 0.99)),
+            field_value=self._layout(vs, ve, vbox, self.rng.uniform(0.8, 0.99)),
+        ))
+
+    def build(self):
+        pages = []
+        for p in self.pages:
+            end = p["tokens"][-1].layout.text_anchor.text_segments[0].end_index if p["tokens"] else p["start"]
+            pages.append(Doc.Page(
+                page_number=p["number"],
+                dimension=Doc.Page.Dimension(width=self.width, height=self.height, unit="pixels"),
+                layout=self._layout(p["start"], end, (0, 0, self.width, self.height), 0.97),
+                lines=p["lines"],
+                tokens=p["tokens"],
+                form_fields=p["fields"],
+            ))
+        return Doc(text="".join(self.text), mime_type="application/pdf", pages=pages)
+
+
+def synthesize_document(content, page_count=None):
+    """Build the fake form-parser Document for the given PDF bytes."""
+    seed = int.from_bytes(hashlib.sha256(content).digest()[:8], "big")
+    if page_count is None:
+        page_count = count_pdf_pages(content)
+    template = _load_template()
+    base = template["page_base"]
+    zones = template["zones"]
+    values = synthetic_form_values(seed)
+    hof = values["HeadOfFamily"]
+
+    b = _DocumentBuilder(base["width"], base["height"], None)
+    for page_no in range(1, page_count + 1):
+        b.rng = random.Random(f"{seed}:{page_no}")
+        page = b.new_page()
+        if page_no == 1:
+            b.line(page, "ANJUMAN REGISTRATION FORM", 700, 150)
+            for key, label in HOF_LABELS.items():
+                x, y, w, h = zones[f"HeadOfFamily.{key}"]["bbox"]
+                # Printed label and handwritten value share the zone's box.
+                name = b.line(page, f"{label}:", x + 10, y + 20, end=" ")
+                value_x = name[2][0] + name[2][2] + CHAR_WIDTH
+                value = b.line(page, hof[key], value_x, y + 20, max_width=x + w - 10 - value_x)
+                b.form_field(page, name, value)
+        elif page_no == 2:
+            table = zones["family_table"]
+            tx, ty = table["bbox"][:2]
+            b.line(page, "FAMILY MEMBERS", tx, ty - 120)
+            for col in table["columns"]:
+                b.line(page, TABLE_HEADERS[col["key"]], col["x"] + 10, ty + 20, max_width=col["w"] - 20)
+            for r, member in enumerate(values["FamilyMembers"], start=1):
+                for col in table["columns"]:
+                    if member[col["key"]] != "":
+                        b.line(page, member[col["key"]], col["x"] + 10, ty + 20 + r * ROW_HEIGHT, max_width=col["w"] - 20)
+        elif page_no == 3:
+            x, y, w, h = zones["DocumentChecklist.HOFVoterID"]["bbox"]
+            b.line(page, "DOCUMENT CHECKLIST", x, y - 100)
+            if values["HOFVoterIDAttached"]:
+                b.line(page, "✓", x + 60, y + 15)
+            b.line(page, "Voter ID of Head of Family", x + w + 40, y + 15)
+            b.line(page, "Aadhaar of Head of Family", x + w + 40, y + 115)
+        elif page_no == 4:
+            x, y, w, h = zones["LegalDeclaration.signatureOfHOF"]["bbox"]
+            b.line(page, "I declare that the information given above is true.", x, y - 200)
+            b.line(page, "Signature of HOF:", x, y - 70)
+            b.line(page, hof["name"], x + 20, y + 60, max_width=w - 40)
+            x, y, w, h = zones["AcknowledgementSlip.nameOfHeadOfFamily"]["bbox"]
+            label = b.line(page, "Received from:", x + 10, y + 30, end=" ")
+            value_x = label[2][0] + label[2][2] + CHAR_WIDTH
+            b.line(page, hof["name"], value_x, y + 30, max_width=x + w - 10 - value_x)
+            x, y, w, h = zones["AcknowledgementSlip.dateReceived"]["bbox"]
+            b.line(page, "Date:", x, y - 60)
+            b.line(page, values["dateReceived"], x + 20, y + 20, max_width=w - 40)
+        footer = f"Page {page_no} of {page_count}"
+        if page_no == page_count and page_count >= 4:
+            footer = f"Applicant Acknowledgement Slip {footer}"
+        b.line(page, footer, 900, base["height"] - 130)
+    return b.build()
+
+
+def count_pdf_pages(content):
+    try:
+        with fitz.open(stream=content, filetype="pdf") as doc:
+            return doc.page_count
+    except Exception:
+        return 4
+
+
+# ----------------------------------------------------------------------
+# Clients
+# ----------------------------------------------------------------------
+class _FakeProcessorBase:
+    def __init__(self, latency=None, page_latency=None, error_rate=None, seed=None, upload_mbps=None):
+        self.latency = FAKE_DOC_AI_LATENCY if latency is None else latency
+        self.page_latency = FAKE_DOC_AI_PAGE_LATENCY if page_latency is None else page_latency
+        self.upload_mbps = FAKE_DOC_AI_UPLOAD_MBPS if upload_mbps is None else upload_mbps
+        self.error_rate = FAKE_DOC_AI_ERROR_RATE if error_rate is None else error_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    @staticmethod
+    def _content(request):
+        raw = request["raw_document"] if isinstance(request, dict) else request.raw_document
+        return raw["content"] if isinstance(raw, dict) else raw.content
+
+    def _plan(self, request):
+        """Returns (delay_seconds, content, page_count, fail)."""
+        self.calls += 1
+        content = self._content(request)
+        pages = count_pdf_pages(content)
+        delay = (self.latency + self.page_latency * pages) * self.rng.uniform(0.9, 1.1)
+        if self.upload_mbps:
+            delay += len(content) * 8 / (self.upload_mbps * 1e6)
+        return delay, content, pages, self.rng.random() < self.error_rate
+
+    @staticmethod
+    def _timeout(timeout):
+        # gapic passes a sentinel object when no timeout was given
+        return float(timeout) if isinstance(timeout, (int, float)) else None
+
+    def _respond(self, content, pages, fail, delay, timeout):
+        if timeout is not None and delay > timeout:
+            raise api_exceptions.DeadlineExceeded("fake Document AI: deadline exceeded")
+        if fail:
+            raise api_exceptions.ServiceUnavailable("fake Document AI: injected transient error")
+        return documentai.ProcessResponse(document=synthesize_document(content, pages))
+
+
+class FakeDocumentProcessorServiceClient(_FakeProcessorBase):
+    """Synchronous stand-in for documentai.DocumentProcessorServiceClient."""
+
+    def process_document(self, request=None, *, name=None, retry=None, timeout=None, metadata=()):
+        delay, content, pages, fail = self._plan(request)
+        timeout = self._timeout(timeout)
+        time.sleep(delay if timeout is None else min(delay, timeout))
+        return self._respond(content, pages, fail, delay, timeout)
+
+
+class FakeDocumentProcessorServiceAsyncClient(_FakeProcessorBase):
+    """Asyncio stand-in for documentai.DocumentProcessorServiceAsyncClient."""
+
+    async def process_document(self, request=None, *, name=None, retry=None, timeout=None, metadata=()):
+        delay, content, pages, fail = self._plan(request)
+        timeout = self._timeout(timeout)
+        await asyncio.sleep(delay if timeout is None else min(delay, timeout))
+        return await asyncio.to_thread(self._respond, content, pages, fail, delay, timeout)
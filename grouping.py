@@ -0,0 +1,314 @@
+"""
+grouping.py  –  Footer-based grouping of pages into applications
+----------------------------------------------------------------
+Not every scanner station writes one PDF per application: some write a file
+per page, others one PDF holding a whole stack of forms. FooterGrouper
+reads the footer of every page and rebuilds the applications from the
+printed markers (FOOTER_PATTERNS):
+
+  "Page X of Y"              page X of a Y-page form: page 1 starts an
+                             application, page Y ends it, and a page that
+                             does not follow on from the one before (or has
+                             a different Y) starts a new one
+  acknowledgement slip       the form's last page; it ends the application
+
+Footers are read from the PDF's text layer when it has one (searchable
+scans). Otherwise the footer strip alone (the bottom PAGE_FOOTER_CROP_RATIO
+of the page) is rendered in grayscale at FOOTER_DPI, or the scan's own
+resolution if lower, and OCRed with tesseract on a pool of
+FOOTER_OCR_WORKERS threads; tesseract runs as a separate process, so the
+threads run in parallel. OCR results are cached in the ``footer_texts``
+table under a hash of the strip's pixels, so no footer is OCRed twice.
+
+Pages are taken in file order, then page order. A page without a readable
+marker stays with the application before it while that one is short of its
+Y pages; otherwise each file's unmarked pages are an application of their
+own, as before grouping existed. An application spanning several files is
+grouped as those files. A PDF holding more than one application, or part
+of one, is split into part PDFs next to it (<name>__p<first>-<last>.pdf),
+and the original moves to ARCHIVE_DIR once every one of its pages is in an
+application. Until then the original is the record of the split: after a
+crash it is grouped again, and its part PDFs still lying next to it are
+not picked up as well (part_source).
+"""
+
+import os
+import re
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+
+from config import ARCHIVE_DIR, FOOTER_PATTERNS, FOOTER_DPI, FOOTER_OCR_WORKERS, PAGE_FOOTER_CROP_RATIO
+from utils import footer_rect, render_footer, extract_text_from_image
+from local_db_manager import get_footer_texts, save_footer_texts
+
+# Digits OCR tends to read as letters
+_PAGE_OF = re.compile(r"page\s*([0-9lI|oO]{1,3})\s*of\s*([0-9lI|oO]{1,3})", re.IGNORECASE)
+_DIGITS = str.maketrans("lI|oO", "11100")
+# The other footer patterns mark the acknowledgement slip.
+_SLIP = [re.compile(p.replace(" ", r"\s+"), re.IGNORECASE) for p in FOOTER_PATTERNS if not p.startswith("page")]
+_PART = re.compile(r"^(.+)__p\d{3}-\d{3}(\.[^.]+)$")
+
+
+def parse_footer(text):
+    """
+    The grouping marker in a footer's text: {"page": X, "of": Y, "slip":
+    bool}, with page and of None when there is no "Page X of Y", or None if
+    the footer has no marker at all.
+    """
+    page = total = None
+    m = _PAGE_OF.search(text or "")
+    if m:
+        page, total = (int(g.translate(_DIGITS)) for g in m.groups())
+        if not 1 <= page <= total:
+            page = total = None
+    slip = any(p.search(text or "") for p in _SLIP)
+    if page is None and not slip:
+        return None
+    return {"page": page, "of": total, "slip": slip}
+
+
+def part_source(path):
+    """The PDF a part PDF was split from (same directory), or None if path is not a part."""
+    m = _PART.match(os.path.basename(path))
+    return os.path.join(os.path.dirname(path), m.group(1) + m.group(2)) if m else None
+
+
+_tesseract = None
+
+
+def ocr_available():
+    """True if tesseract can be run (pytesseract and the binary)."""
+    global _tesseract
+    if _tesseract is None:
+        try:
+            import pytesseract
+            pytesseract.get_tesseract_version()
+            _tesseract = True
+        except Exception:
+            _tesseract = False
+            logging.info("tesseract is not available; page footers are only read from PDF text layers")
+    return _tesseract
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="footer-ocr")
+        return _pool
+
+
+def _runs(pages):
+    """[(path, page indexes)] for consecutive pages of the same file."""
+    runs = []
+    for path, index in pages:
+        if runs and runs[-1][0] == path:
+            runs[-1][1].append(index)
+        else:
+            runs.append((path, [index]))
+    return runs
+
+
+class FooterGrouper:
+    """
+    Groups PDFs into applications by their page footers. feed() takes files
+    as they arrive and returns the applications they complete; the one
+    still waiting for pages is held until more files come, or until
+    flush(). Thread-safe.
+    """
+
+    def __init__(self, crop_ratio=PAGE_FOOTER_CROP_RATIO, dpi=FOOTER_DPI, workers=FOOTER_OCR_WORKERS,
+                 archive_dir=ARCHIVE_DIR, cache=True):
+        self.crop_ratio = crop_ratio
+        self.dpi = dpi
+        self.workers = workers
+        self.archive_dir = archive_dir
+        self.cache = cache
+        self.pages = 0          # pages read
+        self.text_layer = 0     # footers found in a PDF text layer
+        self.ocr_pages = 0      # footers OCRed
+        self.ocr_cached = 0     # footers answered from the cache
+        self._open = None       # application being assembled
+        self._done = []         # finished applications, [(path, page index)]
+        self._page_counts = {}  # path -> pages in the file
+        self._remaining = {}    # path -> its pages not yet in a finished application
+        self._lock = threading.Lock()
+
+    def group(self, paths):
+        """Group a complete set of files: feed() and flush() in one."""
+        with self._lock:
+            return self._feed(paths) + self._flush()
+
+    def feed(self, paths):
+        """Add files (in arrival order); returns the applications completed, as lists of paths."""
+        with self._lock:
+            return self._feed(paths)
+
+    def flush(self, older_than=None):
+        """
+        End the application being assembled, or only if its last page came
+        in over older_than seconds ago; returns the applications completed.
+        """
+        with self._lock:
+            if older_than is not None and self._open and time.monotonic() - self._open["at"] < older_than:
+                return []
+            if older_than is not None and self._open:
+                logging.warning("No further pages for %s after %.0fs; processing it with %d pages",
+                                os.path.basename(self._open["pages"][0][0]), older_than, len(self._open["pages"]))
+            return self._flush()
+
+    # ------------------------------------------------------------------
+    # Footers
+    # ------------------------------------------------------------------
+    def read_footers(self, paths):
+        """{path: [marker or None, per page]}, None for files that cannot be opened."""
+        markers, strips = {}, []
+        for path in paths:
+            try:
+                doc = fitz.open(path)
+            except Exception as e:
+                logging.warning("Cannot read footers of %s: %s", os.path.basename(path), e)
+                markers[path] = None
+                continue
+            with doc:
+                found = []
+                for i, page in enumerate(doc):
+                    self.pages += 1
+                    marker = parse_footer(page.get_text("text", clip=footer_rect(page, self.crop_ratio)))
+                    if marker is not None:
+                        self.text_layer += 1
+                    elif ocr_available():
+                        strip = render_footer(page, self.crop_ratio, self.dpi)
+                        key = hashlib.sha256(f"{strip.shape}".encode() + strip.tobytes()).hexdigest()
+                        strips.append((path, i, key, strip))
+                    found.append(marker)
+                markers[path] = found
+        if strips:
+            texts = get_footer_texts({key for _, _, key, _ in strips}) if self.cache else {}
+            self.ocr_cached += sum(key in texts for _, _, key, _ in strips)
+            missing = {key: strip for _, _, key, strip in strips if key not in texts}
+            if missing:
+                ocred = dict(zip(missing, _get_pool(self.workers).map(extract_text_from_image, missing.values())))
+                self.ocr_pages += len(ocred)
+                if self.cache:
+                    save_footer_texts(ocred)
+                texts.update(ocred)
+            for path, i, key, _ in strips:
+                markers[path][i] = parse_footer(texts[key])
+        return markers
+
+    # ------------------------------------------------------------------
+    # Grouping
+    # ------------------------------------------------------------------
+    def _feed(self, paths):
+        markers = self.read_footers(paths)
+        for path in paths:
+            pages = markers[path]
+            if pages is None:
+                # Unreadable: one application, left for the worker to fail
+                self._close()
+                self._page_counts[path] = None
+                self._done.append([(path, None)])
+                continue
+            self._page_counts[path] = self._remaining[path] = len(pages)
+            for index, marker in enumerate(pages):
+                self._add(path, index, marker)
+        return self._emit()
+
+    def _add(self, path, index, marker):
+        cur = self._open
+        if marker is not None and marker["page"] is not None:
+            if cur is None or cur["of"] != marker["of"] or cur["next"] != marker["page"]:
+                self._close()
+                cur = self._start(marker["of"], marker["page"], None)
+            ends = marker["page"] == marker["of"] or marker["slip"]
+        elif marker is not None:  # acknowledgement slip without a page number
+            if cur is None:
+                cur = self._start(None, 1, path)
+            ends = True
+        else:
+            continues = cur is not None and (cur["next"] <= cur["of"] if cur["of"] else cur["file"] == path)
+            if not continues:
+                self._close()
+                cur = self._start(None, 1, path)
+            ends = cur["of"] is not None and cur["next"] == cur["of"]
+        cur["pages"].append((path, index))
+        cur["next"] += 1
+        cur["at"] = time.monotonic()
+        if ends:
+            self._close()
+
+    def _start(self, total, first, path):
+        self._open = {"pages": [], "of": total, "next": first, "file": path, "at": time.monotonic()}
+        return self._open
+
+    def _close(self):
+        if self._open and self._open["pages"]:
+            self._done.append(self._open["pages"])
+        self._open = None
+
+    def _flush(self):
+        self._close()
+        return self._emit()
+
+    def _emit(self):
+        groups = [self._materialize(pages) for pages in self._done]
+        self._done = []
+        return groups
+
+    def _materialize(self, pages):
+        group = []
+        for path, indexes in _runs(pages):
+            if indexes == [None] or len(indexes) == self._page_counts[path]:
+                group.append(path)  # the whole file
+                self._forget(path)
+                continue
+            group.append(self._write_part(path, indexes))
+            self._remaining[path] -= len(indexes)
+            if not self._remaining[path]:
+                self._retire(path)
+        return group
+
+    def _forget(self, path):
+        self._page_counts.pop(path, None)
+        self._remaining.pop(path, None)
+
+    def _write_part(self, path, indexes):
+        stem, ext = os.path.splitext(path)
+        part = f"{stem}__p{indexes[0] + 1:03d}-{indexes[-1] + 1:03d}{ext}"
+        tmp = f"{part}.tmp"
+        with fitz.open(path) as src, fitz.open() as out:
+            out.insert_pdf(src, from_page=indexes[0], to_page=indexes[-1])
+            out.save(tmp, garbage=3)
+        os.replace(tmp, part)
+        return part
+
+    def _retire(self, path):
+        """Move a PDF whose pages all went into part PDFs out of the way."""
+        self._forget(path)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        try:
+            shutil.move(path, os.path.join(self.archive_dir, os.path.basename(path)))
+            logging.info("Split %s into part PDFs", os.path.basename(path))
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pages": self.pages,
+                "text_layer": self.text_layer,
+                "ocr_pages": self.ocr_pages,
+                "ocr_cached": self.ocr_cached,
+                "held": len(self._open["pages"]) if self._open else 0,  # pages waiting for the rest of their form
+            }
@@ -0,0 +1,408 @@
+"""
+ingest_daemon.py  –  Continuous ingestion of INCOMING_DIR
+--------------------------------------------------------
+A long-running service that picks up PDFs as they land in INCOMING_DIR:
+
+  watcher   inotify on Linux (via ctypes, no extra package), otherwise a
+            directory scan every INGEST_POLL_INTERVAL seconds.
+  ready     a file counts as fully written once its writer closed it
+            (IN_CLOSE_WRITE) or it was renamed in (IN_MOVED_TO); files seen
+            any other way must keep the same size and mtime for
+            INGEST_STABLE_SECONDS.
+  claim     worker.claim_file() renames the PDF into CLAIM_DIR. The rename
+            is atomic, so a file is claimed by exactly one daemon or
+            run_once call; the loser of a race just sees it gone.
+  queue     claimed files go onto a bounded queue (INGEST_QUEUE_SIZE); the
+            watcher stops claiming while it is full, leaving files in
+            INCOMING_DIR.
+  grouper   with FOOTER_GROUPING, one thread groups the claimed files into
+            applications by their page footers (grouping.py) and queues each
+            application once complete. A form still short of pages is held
+            until its next file arrives, or for FOOTER_GROUP_WAIT seconds.
+  workers   the staged pipeline (pipeline.py) with PIPELINE_ENABLED, else
+            INGEST_WORKERS threads running worker.process_application_group.
+
+Files left in CLAIM_DIR by a previous run that died mid-way are requeued on
+start. Run standalone with `python ingest_daemon.py`, or embedded: main.py
+starts one on FastAPI startup and /ingest calls nudge().
+"""
+
+import os
+import sys
+import time
+import queue
+import select
+import struct
+import logging
+import threading
+import ctypes
+import ctypes.util
+
+from config import (
+    INCOMING_DIR,
+    INGEST_WORKERS,
+    INGEST_QUEUE_SIZE,
+    INGEST_POLL_INTERVAL,
+    INGEST_STABLE_SECONDS,
+    INGEST_USE_INOTIFY,
+    PIPELINE_ENABLED,
+    FOOTER_GROUPING,
+    FOOTER_GROUP_WAIT,
+    summary,
+)
+import worker
+from grouping import FooterGrouper
+from pipeline import Pipeline
+from metrics import QUEUE_DEPTH, on_collect
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+_EVENT = struct.Struct("iIII")
+
+_TICK = 0.2  # seconds between stability checks while files are settling
+
+
+class InotifyWatch:
+    """Minimal inotify watch on one directory. Raises OSError where unavailable."""
+
+    def __init__(self, path):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is Linux-only")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch({path}) failed")
+
+    def read(self, timeout, wake_fd=None):
+        """
+        Wait up to timeout seconds, or until wake_fd is readable; returns
+        [(mask, name)]. An IN_Q_OVERFLOW event (name "") means events were
+        lost and the directory must be rescanned.
+        """
+        fds = [self.fd] if wake_fd is None else [self.fd, wake_fd]
+        ready, _, _ = select.select(fds, [], [], timeout)
+        if wake_fd in ready:
+            os.read(wake_fd, 4096)
+        if self.fd not in ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events, pos = [], 0
+        while pos + _EVENT.size <= len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, pos)
+            pos += _EVENT.size
+            name = data[pos:pos + length].rstrip(b"\0").decode("utf-8", "surrogateescape")
+            pos += length
+            events.append((mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class IngestDaemon:
+    """Watches INCOMING_DIR and processes each PDF exactly once."""
+
+    def __init__(self, incoming_dir=INCOMING_DIR, workers=INGEST_WORKERS, queue_size=INGEST_QUEUE_SIZE,
+                 poll_interval=INGEST_POLL_INTERVAL, stable_seconds=INGEST_STABLE_SECONDS,
+                 use_inotify=INGEST_USE_INOTIFY, handler=None, grouping=FOOTER_GROUPING,
+                 group_wait=FOOTER_GROUP_WAIT):
+        self.incoming_dir = incoming_dir
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.stable_seconds = stable_seconds
+        self.use_inotify = use_inotify
+        self._pipeline_mode = handler is None and PIPELINE_ENABLED
+        self._pipeline = None
+        self.handler = handler or worker.process_application_group
+        self.grouper = FooterGrouper() if grouping else None
+        self.group_wait = group_wait
+
+        self._queue = queue.Queue(maxsize=max(1, queue_size))   # claimed paths
+        self._apps = queue.Queue(maxsize=max(1, queue_size))    # grouped applications
+        self._grouped = threading.Event()                       # grouper thread finished
+        self._stop = threading.Event()
+        self._nudge = threading.Event()
+        self._threads = []
+        self._watch = None
+        self._wake_r, self._wake_w = os.pipe()  # wakes the watcher out of select()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._lock = threading.Lock()
+
+        self._ready = {}    # path -> monotonic time it became ready
+        self._pending = {}  # path -> (size, mtime_ns) at last look
+        self.processed = 0
+        self.failed = 0
+        self.in_progress = 0
+        self.last_pickup_latency = None
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self):
+        if self._threads:
+            return self
+        os.makedirs(self.incoming_dir, exist_ok=True)
+        if self.use_inotify:
+            try:
+                self._watch = InotifyWatch(self.incoming_dir)
+            except OSError as e:
+                logging.warning("inotify unavailable (%s); polling %s every %.1fs",
+                                e, self.incoming_dir, self.poll_interval)
+        self._stop.clear()
+        self._grouped.clear()
+        if self.grouper:
+            t = threading.Thread(target=self._group_loop, name="ingest-grouper", daemon=True)
+            t.start()
+            self._threads.append(t)
+        if self._pipeline_mode:
+            self._pipeline = Pipeline().start()
+            consumers = [("ingest-feeder", self._feed_pipeline)]
+        else:
+            consumers = [(f"ingest-worker-{i}", self._consume) for i in range(self.workers)]
+        for name, target in consumers:
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+        for path in worker.list_claimed_files():
+            logging.info("Requeueing %s left from a previous run", os.path.basename(path))
+            self._queue.put((path, time.monotonic()))
+        t = threading.Thread(target=self._watch_loop, name="ingest-watcher", daemon=True)
+        t.start()
+        self._threads.append(t)
+        logging.info("Ingest daemon watching %s (%s, %d workers)", self.incoming_dir,
+                     "inotify" if self._watch else "polling", self.workers)
+        return self
+
+    def stop(self, timeout=None):
+        """Stop claiming, let the workers finish what is already queued."""
+        self._stop.set()
+        self.nudge()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        if self._watch:
+            self._watch.close()
+            self._watch = None
+
+    def nudge(self):
+        """Rescan INCOMING_DIR now instead of waiting for the next event or poll."""
+        self._nudge.set()
+        try:
+            os.write(self._wake_w, b"\0")
+        except BlockingIOError:
+            pass  # a wake-up is already pending
+
+    def running(self):
+        return bool(self._threads) and not self._stop.is_set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": self.running(),
+                "watcher": "inotify" if self._watch else "polling",
+                "queued": self._queue.qsize() + self._apps.qsize(),
+                "in_progress": self.in_progress,
+                "waiting": len(self._ready) + len(self._pending),
+                "processed": self.processed,
+                "failed": self.failed,
+                "last_pickup_latency": self.last_pickup_latency,
+                "held_pages": self.grouper.stats()["held"] if self.grouper else 0,
+            }
+
+    # ------------------------------------------------------------------
+    # Watcher
+    # ------------------------------------------------------------------
+    def _watch_loop(self):
+        self._scan()
+        next_poll = time.monotonic() + self.poll_interval
+        while not self._stop.is_set():
+            timeout = _TICK if (self._pending or self._ready) else self.poll_interval
+            rescan = False
+            if self._watch:
+                for mask, name in self._watch.read(min(timeout, max(next_poll - time.monotonic(), 0)), self._wake_r):
+                    if mask & IN_Q_OVERFLOW:
+                        rescan = True
+                    elif name.endswith(".pdf"):
+                        path = os.path.join(self.incoming_dir, name)
+                        if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                            self._pending.pop(path, None)
+                            self._ready.setdefault(path, time.monotonic())
+                        elif path not in self._ready:
+                            self._pending[path] = None
+            else:
+                self._nudge.wait(timeout)
+
+            if self._nudge.is_set():
+                self._nudge.clear()
+                rescan = True
+            if rescan or time.monotonic() >= next_poll:
+                # A periodic scan also backs up inotify: files copied in
+                # before the watch existed, or by writers it cannot see.
+                self._scan()
+                next_poll = time.monotonic() + self.poll_interval
+            self._settle()
+            self._claim_ready()
+
+    def _scan(self):
+        for path in worker.list_incoming_files():
+            if path not in self._ready:
+                self._pending.setdefault(path, None)
+
+    def _settle(self):
+        """Move pending files whose size and mtime stopped changing to ready."""
+        now = time.time()
+        for path, seen in list(self._pending.items()):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                del self._pending[path]
+                continue
+            sig = (st.st_size, st.st_mtime_ns)
+            if seen == sig and now - st.st_mtime >= self.stable_seconds:
+                del self._pending[path]
+                self._ready[path] = time.monotonic()
+            else:
+                self._pending[path] = sig
+
+    def _claim_ready(self):
+        for path in sorted(self._ready, key=self._ready.get):
+            if self._queue.full():
+                return  # leave the rest in INCOMING_DIR until a slot frees up
+            ready_at = self._ready.pop(path)
+            claimed = worker.claim_file(path)
+            if claimed:
+                self._queue.put((claimed, ready_at))
+
+    # ------------------------------------------------------------------
+    # Grouper
+    # ------------------------------------------------------------------
+    def _group_loop(self):
+        """Group claimed files into applications (FOOTER_GROUPING)."""
+        ready_at = time.monotonic()
+        while True:
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                if self._stop.is_set():
+                    break
+                self._queue_apps(self.grouper.flush(older_than=self.group_wait), ready_at)
+                continue
+            while True:  # group everything claimed so far in one go
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for _ in batch:
+                self._queue.task_done()
+            ready_at = min(r for _, r in batch)
+            paths = [path for path, _ in batch]
+            try:
+                groups = self.grouper.feed(paths)
+            except Exception:
+                logging.exception("Grouping %d files failed; processing each on its own", len(paths))
+                groups = [[path] for path in paths]
+            self._queue_apps(groups, ready_at)
+            if self._ready:
+                self.nudge()  # queue slots freed up; claim whatever is waiting
+        self._queue_apps(self.grouper.flush(), ready_at)
+        self._grouped.set()
+
+    def _queue_apps(self, groups, ready_at):
+        for group in groups:
+            self._apps.put((group, ready_at))
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+    def _take(self):
+        """Next application (list of paths), or None once stopped and drained."""
+        source = self._apps if self.grouper else self._queue
+        while True:
+            try:
+                item, ready_at = source.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set() and (not self.grouper or self._grouped.is_set()):
+                    return None
+                continue
+            source.task_done()
+            with self._lock:
+                self.in_progress += 1
+                self.last_pickup_latency = time.monotonic() - ready_at
+            return item if self.grouper else [item]
+
+    def _done(self, group_paths, result):
+        worker.settle_group(group_paths, result)
+        with self._lock:
+            self.in_progress -= 1
+            if result:
+                self.processed += 1
+            else:
+                self.failed += 1
+        if self._ready:
+            self.nudge()  # a slot freed up; claim whatever is waiting
+
+    def _consume(self):
+        while True:
+            group = self._take()
+            if group is None:
+                return
+            try:
+                result = self.handler(group)
+            except Exception:
+                logging.exception("Ingest of %s failed", group[0])
+                result = None
+            self._done(group, result)
+
+    def _feed_pipeline(self):
+        """Pipeline mode: hand applications to the staged pipeline, which
+        blocks here once PIPELINE_MAX_IN_FLIGHT applications are inside."""
+        while True:
+            group = self._take()
+            if group is None:
+                self._pipeline.close()
+                return
+            self._pipeline.submit(group, self._done)
+
+
+_daemon = None
+_daemon_lock = threading.Lock()
+
+
+@on_collect
+def _collect_metrics():
+    daemon = _daemon
+    if daemon is not None:
+        QUEUE_DEPTH.labels(queue="ingest_claimed").set(daemon._queue.qsize())
+        QUEUE_DEPTH.labels(queue="ingest_grouped").set(daemon._apps.qsize())
+
+
+def get_daemon():
+    """The process-wide daemon, created (not started) on first use."""
+    global _daemon
+    with _daemon_lock:
+        if _daemon is None:
+            _daemon = IngestDaemon()
+        return _daemon
+
+
+if __name__ == "__main__":
+    print(f"[CONFIG] {summary()}")
+    daemon = get_daemon().start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        daemon.stop()
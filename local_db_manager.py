@@ -1,62 +1,591 @@
+"""
+local_db_manager.py  –  Local form store backed by SQLite
+---------------------------------------------------------
+Forms are stored one row per record with an index on ``metadata.app_id``, so
+inserts and lookups no longer rewrite or scan the whole database. Application
+IDs are allocated inside a SQLite write transaction, which keeps allocation
+atomic across worker processes as well as threads.
+
+A ``jobs`` table holds one processing job per application: the stages that
+completed, the artifacts they left behind and the job status, so a failed
+application resumes with its original app_id instead of starting over. A
+running job records its owner (host:pid); it is only taken over once that
+process is gone, so a second copy of a source still being processed gets a
+job of its own.
+
+A ``results`` table indexes the drafts and reports the worker writes (status,
+completion time, file names), so the results API can list, filter and page
+without touching the filesystem. Its ``results`` counter changes with every
+write and serves as the listing's ETag.
+
+A ``page_hashes`` table keeps the perceptual hash of every processed page
+(dedup.py), so re-uploaded copies of an application can be recognized before
+they are sent to OCR again, and a ``footer_texts`` table caches the OCR of
+page footers by a hash of the footer strip (grouping.py).
+
+A legacy ``local_db.json`` is migrated into the SQLite file the first time the
+store is opened and then renamed to ``local_db.json.migrated``.
+"""
+
 import os
+import re
 import json
-from threading import Lock
+import time
+import base64
+import socket
+import sqlite3
+import threading
 
-DB_FILE = os.path.join(os.path.dirname(__file__), "local_db.json")
-_LOCK = Lock()
+from config import DB_FILE, LEGACY_DB_FILE, DRAFTS_DIR, REPORTS_DIR, JOB_STALE_SECONDS
+from metrics import DB_TRANSACTION_SECONDS
 
+FIRST_APP_ID = 1000
+_SQLITE_TIMEOUT = 30  # seconds to wait on a locked database
 
-def _load_db():
-    if not os.path.exists(DB_FILE):
-        return {"last_app_id": 1000, "forms": []}
-    with open(DB_FILE, "r", encoding="utf-8") as f:
-        try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return {"last_app_id": 1000, "forms": []}
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS app_ids (
+    app_id INTEGER PRIMARY KEY AUTOINCREMENT
+);
+CREATE TABLE IF NOT EXISTS forms (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    app_id INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_forms_app_id ON forms(app_id);
+CREATE TABLE IF NOT EXISTS jobs (
+    app_id INTEGER PRIMARY KEY,
+    source_key TEXT NOT NULL,
+    source_paths TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stages TEXT NOT NULL DEFAULT '{}',
+    artifacts TEXT NOT NULL DEFAULT '{}',
+    attempts INTEGER NOT NULL DEFAULT 1,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_source_key ON jobs(source_key);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+CREATE TABLE IF NOT EXISTS results (
+    app_id INTEGER PRIMARY KEY,
+    status TEXT NOT NULL,
+    hof_name TEXT NOT NULL DEFAULT '',
+    json_file TEXT,
+    report_file TEXT,
+    completed_at TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_results_status ON results(status, app_id);
+CREATE INDEX IF NOT EXISTS idx_results_completed ON results(completed_at);
+CREATE TABLE IF NOT EXISTS page_hashes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    app_id INTEGER NOT NULL,
+    page_no INTEGER NOT NULL,
+    phash BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_page_hashes_app_id ON page_hashes(app_id);
+CREATE TABLE IF NOT EXISTS footer_texts (
+    page_key TEXT PRIMARY KEY,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+JOB_RUNNING = "running"
+JOB_FAILED = "failed"
+JOB_DONE = "done"
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+
+# ----------------------------------------------------------------------
+# Connection handling
+# ----------------------------------------------------------------------
+def _connect():
+    os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
+    conn = sqlite3.connect(DB_FILE, timeout=_SQLITE_TIMEOUT, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _conn():
+    """Return this thread's connection, creating the schema on first use."""
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        conn = _connect()
+        _local.conn = conn
+        _local.pid = os.getpid()
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                _init_schema(conn)
+                _initialized = True
+    return conn
+
+
+class _transaction:
+    """``BEGIN IMMEDIATE`` block: takes the write lock up front so concurrent
+    writers in other processes queue instead of failing mid-transaction."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        DB_TRANSACTION_SECONDS.observe(time.perf_counter() - self.started)
+        return False
+
+
+def _init_schema(conn):
+    conn.executescript(_SCHEMA)
+    if "owner" not in {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}:
+        conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")  # databases from before job owners
+    migrated = False
+    with _transaction(conn):
+        seeded = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'app_ids'").fetchone()
+        if seeded is None:
+            migrated = _migrate_legacy_json(conn)
+    if migrated:
+        os.replace(LEGACY_DB_FILE, LEGACY_DB_FILE + ".migrated")
+    with _transaction(conn):
+        if conn.execute("SELECT 1 FROM counters WHERE name = 'results'").fetchone() is None:
+            _backfill_results(conn)
+
+
+def _migrate_legacy_json(conn):
+    """One-time import of ``local_db.json``; also seeds the app_id counter.
+    Returns True when a legacy file was imported."""
+    last_app_id = FIRST_APP_ID
+    forms = []
+    if os.path.exists(LEGACY_DB_FILE):
+        with open(LEGACY_DB_FILE, "r", encoding="utf-8") as f:
+            try:
+                legacy = json.load(f)
+            except json.JSONDecodeError:
+                legacy = {}
+        last_app_id = max(int(legacy.get("last_app_id", FIRST_APP_ID)), FIRST_APP_ID)
+        forms = legacy.get("forms", [])
 
+    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('app_ids', ?)", (last_app_id,))
+    conn.executemany(
+        "INSERT INTO forms (app_id, data) VALUES (?, ?)",
+        [(_app_id_of(form), json.dumps(form, ensure_ascii=False)) for form in forms],
+    )
+    return os.path.exists(LEGACY_DB_FILE)
 
-def _save_db(data):
-    tmp = f"{DB_FILE}.tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, DB_FILE)
 
+_DRAFT_NAME = re.compile(r"^application_(\d+)_(.*)\.json$")
+_REPORT_NAME = re.compile(r"^application_(\d+)_report\.pdf$")
 
+
+def _backfill_results(conn):
+    """One-time index of drafts and reports written before the results table
+    existed: a single directory scan, with status and completion time taken
+    from the stored form where there is one."""
+    entries = {}
+    if os.path.isdir(DRAFTS_DIR):
+        for entry in os.scandir(DRAFTS_DIR):
+            m = _DRAFT_NAME.match(entry.name)
+            if m:
+                completed = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(entry.stat().st_mtime))
+                entries[int(m.group(1))] = {"hof_name": m.group(2).replace("_", " "),
+                                            "json_file": entry.name, "completed_at": completed}
+    if os.path.isdir(REPORTS_DIR):
+        for entry in os.scandir(REPORTS_DIR):
+            m = _REPORT_NAME.match(entry.name)
+            if m and int(m.group(1)) in entries:
+                entries[int(m.group(1))]["report_file"] = entry.name
+    for app_id, data in conn.execute("SELECT app_id, data FROM forms WHERE app_id IS NOT NULL"):
+        if app_id in entries:
+            meta = json.loads(data).get("metadata", {})
+            entries[app_id]["status"] = meta.get("status", "draft")
+            entries[app_id]["completed_at"] = meta.get("processing_completed") or entries[app_id]["completed_at"]
+    conn.executemany(
+        "INSERT OR IGNORE INTO results (app_id, status, hof_name, json_file, report_file, completed_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [(app_id, e.get("status", "draft"), e["hof_name"], e["json_file"], e.get("report_file"), e["completed_at"])
+         for app_id, e in entries.items()],
+    )
+    conn.execute("INSERT INTO counters (name, value) VALUES ('results', 1)")
+
+
+def _app_id_of(form_json):
+    return form_json.get("metadata", {}).get("app_id")
+
+
+# ----------------------------------------------------------------------
+# Public API
+# ----------------------------------------------------------------------
 def generate_application_id():
-    with _LOCK:
-        db = _load_db()
-        db["last_app_id"] += 1
-        _save_db(db)
-        return db["last_app_id"]
+    conn = _conn()
+    with _transaction(conn):
+        cur = conn.execute("INSERT INTO app_ids DEFAULT VALUES")
+        return cur.lastrowid
 
 
 def insert_form_record(form_json):
-    with _LOCK:
-        db = _load_db()
-        db["forms"].append(form_json)
-        _save_db(db)
+    conn = _conn()
+    with _transaction(conn):
+        conn.execute(
+            "INSERT INTO forms (app_id, data) VALUES (?, ?)",
+            (_app_id_of(form_json), json.dumps(form_json, ensure_ascii=False)),
+        )
+
+
+def save_form_record(form_json):
+    """Insert the form, or replace the stored record with the same app_id
+    (a resumed job writing its record a second time)."""
+    app_id = _app_id_of(form_json)
+    data = json.dumps(form_json, ensure_ascii=False)
+    conn = _conn()
+    with _transaction(conn):
+        cur = conn.execute(
+            "UPDATE forms SET data = ? WHERE id = (SELECT id FROM forms WHERE app_id = ? ORDER BY id LIMIT 1)",
+            (data, app_id),
+        )
+        if app_id is None or cur.rowcount == 0:
+            conn.execute("INSERT INTO forms (app_id, data) VALUES (?, ?)", (app_id, data))
 
 
 def get_all_forms():
-    db = _load_db()
-    return db.get("forms", [])
+    rows = _conn().execute("SELECT data FROM forms ORDER BY id").fetchall()
+    return [json.loads(data) for (data,) in rows]
 
 
 def get_form_by_id(app_id):
-    db = _load_db()
-    for form in db.get("forms", []):
-        if form.get("metadata", {}).get("app_id") == app_id:
-            return form
-    return None
+    row = _conn().execute(
+        "SELECT data FROM forms WHERE app_id = ? ORDER BY id LIMIT 1", (app_id,)
+    ).fetchone()
+    return json.loads(row[0]) if row else None
 
 
 def update_form(app_id, updated_json):
-    with _LOCK:
-        db = _load_db()
-        for i, form in enumerate(db.get("forms", [])):
-            if form.get("metadata", {}).get("app_id") == app_id:
-                db["forms"][i] = updated_json
-                _save_db(db)
-                return True
-    return False
+    conn = _conn()
+    with _transaction(conn):
+        cur = conn.execute(
+            "UPDATE forms SET app_id = ?, data = ? "
+            "WHERE id = (SELECT id FROM forms WHERE app_id = ? ORDER BY id LIMIT 1)",
+            (_app_id_of(updated_json), json.dumps(updated_json, ensure_ascii=False), app_id),
+        )
+        status = updated_json.get("metadata", {}).get("status")
+        if cur.rowcount and status:
+            _touch_result(conn, _app_id_of(updated_json), status=status)
+        return cur.rowcount > 0
+
+
+def link_duplicate(app_id, link):
+    """
+    Append link (a dict with the duplicate's ``app_id``) to
+    ``metadata.dedup.linked`` of app_id's form, once per duplicate. Returns
+    the updated form, or None if app_id has no record.
+    """
+    conn = _conn()
+    with _transaction(conn):
+        row = conn.execute(
+            "SELECT id, data FROM forms WHERE app_id = ? ORDER BY id LIMIT 1", (app_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        form = json.loads(row[1])
+        meta = form.setdefault("metadata", {})
+        linked = meta.setdefault("dedup", {}).setdefault("linked", [])
+        if all(entry.get("app_id") != link.get("app_id") for entry in linked):
+            linked.append(link)
+            conn.execute("UPDATE forms SET data = ? WHERE id = ?", (json.dumps(form, ensure_ascii=False), row[0]))
+            _touch_result(conn, app_id, status=meta.get("status"))
+        return form
+
+
+# ----------------------------------------------------------------------
+# Page hashes (dedup.py)
+# ----------------------------------------------------------------------
+def save_page_hashes(app_id, hashes):
+    """Store app_id's page hashes (bytes, in page order), replacing earlier ones."""
+    conn = _conn()
+    with _transaction(conn):
+        conn.execute("DELETE FROM page_hashes WHERE app_id = ?", (app_id,))
+        conn.executemany(
+            "INSERT INTO page_hashes (app_id, page_no, phash) VALUES (?, ?, ?)",
+            [(app_id, page_no, h) for page_no, h in enumerate(hashes, start=1)],
+        )
+
+
+def page_hashes_since(row_id=0):
+    """(id, app_id, page_no, phash) rows added after row_id, oldest first."""
+    return _conn().execute(
+        "SELECT id, app_id, page_no, phash FROM page_hashes WHERE id > ? ORDER BY id", (row_id,)
+    ).fetchall()
+
+
+# ----------------------------------------------------------------------
+# Footer OCR cache (grouping.py)
+# ----------------------------------------------------------------------
+def get_footer_texts(keys):
+    """{page_key: text} for the keys with a cached footer OCR."""
+    conn = _conn()
+    found = {}
+    keys = list(keys)
+    for i in range(0, len(keys), 500):  # stay under SQLite's variable limit
+        chunk = keys[i:i + 500]
+        found.update(conn.execute(
+            f"SELECT page_key, text FROM footer_texts WHERE page_key IN ({','.join('?' * len(chunk))})", chunk
+        ).fetchall())
+    return found
+
+
+def save_footer_texts(texts):
+    """Cache footer OCR results, a {page_key: text} mapping."""
+    conn = _conn()
+    with _transaction(conn):
+        conn.executemany("INSERT OR REPLACE INTO footer_texts (page_key, text) VALUES (?, ?)", list(texts.items()))
+
+
+# ----------------------------------------------------------------------
+# Jobs
+# ----------------------------------------------------------------------
+_JOB_COLUMNS = "app_id, source_key, source_paths, status, stages, artifacts, attempts, error, created_at, updated_at"
+
+
+def _now():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def _job_row(row):
+    if row is None:
+        return None
+    job = dict(zip(_JOB_COLUMNS.split(", "), row))
+    for key in ("source_paths", "stages", "artifacts"):
+        job[key] = json.loads(job[key])
+    return job
+
+
+def _owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_gone(owner, updated_at):
+    """True if the process that owns a running job can no longer be running it."""
+    host, _, pid = (owner or "").rpartition(":")
+    if host == socket.gethostname() and pid.isdigit():
+        if int(pid) == os.getpid():
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except OSError:  # exists, owned by another user
+            return False
+        return False
+    stale = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - JOB_STALE_SECONDS))
+    return updated_at < stale
+
+
+def start_job(source_key, source_paths):
+    """
+    Return (job, resumed) for the source identified by source_key.
+    A failed job for the same source, or a running one whose owner is gone
+    (a crashed run), is resumed (attempts + 1, same app_id); otherwise a new
+    app_id is allocated and a job created. The claim is made in one write
+    transaction, so two submissions never take over the same job.
+    """
+    conn = _conn()
+    now = _now()
+    paths = json.dumps(list(source_paths))
+    with _transaction(conn):
+        rows = conn.execute(
+            f"SELECT {_JOB_COLUMNS}, owner FROM jobs WHERE source_key = ? AND status != ? ORDER BY app_id DESC",
+            (source_key, JOB_DONE),
+        ).fetchall()
+        row = next((r for r in rows if r[3] == JOB_FAILED or _owner_gone(r[-1], r[-2])), None)
+        if row is not None:
+            conn.execute(
+                "UPDATE jobs SET status = ?, source_paths = ?, attempts = attempts + 1, error = NULL, updated_at = ?, "
+                "owner = ? WHERE app_id = ?",
+                (JOB_RUNNING, paths, now, _owner(), row[0]),
+            )
+            resumed = True
+            app_id = row[0]
+        else:
+            app_id = conn.execute("INSERT INTO app_ids DEFAULT VALUES").lastrowid
+            conn.execute(
+                "INSERT INTO jobs (app_id, source_key, source_paths, status, created_at, updated_at, owner) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (app_id, source_key, paths, JOB_RUNNING, now, now, _owner()),
+            )
+            resumed = False
+        job = _job_row(conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE app_id = ?", (app_id,)).fetchone())
+    return job, resumed
+
+
+def complete_job_stage(app_id, stage, artifacts=None, seconds=None):
+    """Record stage as done and merge its artifacts into the job."""
+    conn = _conn()
+    with _transaction(conn):
+        row = conn.execute("SELECT stages, artifacts FROM jobs WHERE app_id = ?", (app_id,)).fetchone()
+        if row is None:
+            raise KeyError(app_id)
+        stages, stored = json.loads(row[0]), json.loads(row[1])
+        stages[stage] = {"completed_at": _now(), "seconds": seconds}
+        stored.update(artifacts or {})
+        conn.execute(
+            "UPDATE jobs SET stages = ?, artifacts = ?, updated_at = ? WHERE app_id = ?",
+            (json.dumps(stages), json.dumps(stored, ensure_ascii=False), _now(), app_id),
+        )
+
+
+def reopen_job_stage(app_id, stage):
+    """Mark stage as not done, so the job's next attempt runs it again."""
+    conn = _conn()
+    with _transaction(conn):
+        row = conn.execute("SELECT stages FROM jobs WHERE app_id = ?", (app_id,)).fetchone()
+        if row is None:
+            raise KeyError(app_id)
+        stages = json.loads(row[0])
+        stages.pop(stage, None)
+        conn.execute(
+            "UPDATE jobs SET stages = ?, updated_at = ? WHERE app_id = ?",
+            (json.dumps(stages), _now(), app_id),
+        )
+
+
+def finish_job(app_id, status, error=None):
+    conn = _conn()
+    with _transaction(conn):
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE app_id = ?",
+            (status, error, _now(), app_id),
+        )
+
+
+def update_job_sources(app_id, source_paths):
+    conn = _conn()
+    with _transaction(conn):
+        conn.execute(
+            "UPDATE jobs SET source_paths = ?, updated_at = ? WHERE app_id = ?",
+            (json.dumps(list(source_paths)), _now(), app_id),
+        )
+
+
+def get_job(app_id):
+    row = _conn().execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE app_id = ?", (app_id,)).fetchone()
+    return _job_row(row)
+
+
+def list_jobs(status=None, limit=100):
+    """Most recent jobs first; artifacts are left out of the listing."""
+    sql = f"SELECT {_JOB_COLUMNS} FROM jobs"
+    params = []
+    if status:
+        sql += " WHERE status = ?"
+        params.append(status)
+    sql += " ORDER BY app_id DESC LIMIT ?"
+    params.append(limit)
+    jobs = [_job_row(r) for r in _conn().execute(sql, params).fetchall()]
+    for job in jobs:
+        del job["artifacts"]
+    return jobs
+
+
+# ----------------------------------------------------------------------
+# Results index
+# ----------------------------------------------------------------------
+_RESULT_COLUMNS = "app_id, status, hof_name, json_file, report_file, completed_at, version"
+
+
+def _bump_results(conn):
+    conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'results'")
+
+
+def _touch_result(conn, app_id, **fields):
+    fields = {k: v for k, v in fields.items() if v is not None}
+    if not fields:
+        return
+    sets = ", ".join(f"{k} = ?" for k in fields)
+    conn.execute(f"UPDATE results SET {sets}, version = version + 1 WHERE app_id = ?", (*fields.values(), app_id))
+    _bump_results(conn)
+
+
+def record_result(app_id, status=None, hof_name=None, json_file=None, report_file=None, completed_at=None):
+    """Add or update an application's entry in the results index; fields
+    left as None keep their stored value."""
+    conn = _conn()
+    with _transaction(conn):
+        if conn.execute("SELECT 1 FROM results WHERE app_id = ?", (app_id,)).fetchone():
+            _touch_result(conn, app_id, status=status, hof_name=hof_name, json_file=json_file,
+                          report_file=report_file, completed_at=completed_at)
+        else:
+            conn.execute(
+                "INSERT INTO results (app_id, status, hof_name, json_file, report_file, completed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (app_id, status or "draft", hof_name or "", json_file, report_file, completed_at or _now()),
+            )
+            _bump_results(conn)
+
+
+def results_version():
+    """Changes whenever any results entry does."""
+    row = _conn().execute("SELECT value FROM counters WHERE name = 'results'").fetchone()
+    return row[0] if row else 0
+
+
+def get_result(app_id):
+    row = _conn().execute(f"SELECT {_RESULT_COLUMNS} FROM results WHERE app_id = ?", (app_id,)).fetchone()
+    return dict(zip(_RESULT_COLUMNS.split(", "), row)) if row else None
+
+
+def encode_cursor(app_id):
+    return base64.urlsafe_b64encode(str(app_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"invalid cursor {cursor!r}")
+
+
+def list_results(status=None, date_from=None, date_to=None, app_id=None, cursor=None, limit=50):
+    """
+    One page of the results index, newest app_id first.
+    date_from/date_to bound the completion time (ISO dates or timestamps,
+    both inclusive). Returns (entries, next_cursor); next_cursor is None on
+    the last page.
+    """
+    where, params = [], []
+    if status:
+        where.append("status = ?")
+        params.append(status)
+    if app_id is not None:
+        where.append("app_id = ?")
+        params.append(app_id)
+    if date_from:
+        where.append("completed_at >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("completed_at <= ?")
+        params.append(date_to + "T23:59:59Z" if len(date_to) == 10 else date_to)
+    if cursor:
+        where.append("app_id < ?")
+        params.append(decode_cursor(cursor))
+    sql = f"SELECT {_RESULT_COLUMNS} FROM results"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY app_id DESC LIMIT ?"
+    params.append(limit + 1)
+    rows = _conn().execute(sql, params).fetchall()
+    entries = [dict(zip(_RESULT_COLUMNS.split(", "), r)) for r in rows[:limit]]
+    next_cursor = encode_cursor(entries[-1]["app_id"]) if len(rows) > limit else None
+    return entries, next_cursor
@@ -1,41 +1,307 @@
 # main.py
-from fastapi import FastAPI, BackgroundTasks, UploadFile, File
-from worker import run_once
+import re
+import asyncio
+import hashlib
+import zipfile
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, BackgroundTasks, UploadFile, File, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+# Only light modules here: worker, pipeline, ingest_daemon and report_cache
+# pull in OpenCV, PyMuPDF, reportlab and the Document AI client, and are
+# imported where they are first needed.
+from uploads import save_upload, publish, safe_name, extract_upload
+from local_db_manager import get_job, list_jobs, JOB_FAILED, get_result, results_version
+from local_db_manager import list_results as query_results
+import metrics
+import profiling
 import os
-from config import DRAFTS_DIR, REPORTS_DIR, INCOMING_DIR
-import shutil
+from config import DRAFTS_DIR, REPORTS_DIR, INGEST_DAEMON_ENABLED, ensure_dirs, summary
 
-app = FastAPI(title="Anjuman Backend")
+
+def get_daemon():
+    """
+    The ingest daemon, or None when INGEST_DAEMON_ENABLED is off. The first
+    call loads the processing stack, so async handlers call it through
+    asyncio.to_thread.
+    """
+    if not INGEST_DAEMON_ENABLED:
+        return None
+    from ingest_daemon import get_daemon
+    return get_daemon()
+
+
+def _run_once():
+    from worker import run_once
+    return run_once()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    ensure_dirs()
+    print(f"[CONFIG] {summary()}")
+    starter = None
+    if INGEST_DAEMON_ENABLED:
+        # Loading the processing stack takes a few seconds; serve meanwhile.
+        starter = threading.Thread(target=lambda: get_daemon().start(), name="ingest-start", daemon=True)
+        starter.start()
+    yield
+    if starter is not None:
+        starter.join()
+        get_daemon().stop(timeout=30)
+    if _pipeline is not None:
+        _pipeline.close()
+
+
+app = FastAPI(title="Anjuman Backend", lifespan=lifespan)
 
 @app.post("/ingest")
 async def ingest(background_tasks: BackgroundTasks):
     """
-    Trigger a background one-shot run. For continuous processing, run worker service separately.
+    Ask the ingest daemon to rescan the incoming folder now. Without the
+    daemon (INGEST_DAEMON_ENABLED = False), trigger a background one-shot run.
     """
-    background_tasks.add_task(run_once)
+    daemon = await asyncio.to_thread(get_daemon)
+    if daemon is not None and daemon.running():
+        daemon.nudge()
+        return {"status": "accepted", "message": "Ingest daemon notified.", "daemon": daemon.stats()}
+    background_tasks.add_task(_run_once)
     return {"status":"accepted", "message":"Ingestion job started in background."}
 
+@app.get("/ingest/status")
+def ingest_status():
+    daemon = get_daemon()
+    if daemon is None:
+        return {"running": False, "enabled": False}
+    return daemon.stats()
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Stage latencies, counters and queue gauges in the Prometheus text format (metrics.py)."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/profiling")
+def profiling_settings():
+    return profiling.settings()
+
+@app.post("/profiling")
+def set_profiling(sample_rate: float = None, app_ids: str = None):
+    """
+    Pick jobs to profile (profiling.py): a share of all jobs at random and/or
+    comma-separated app_ids (an empty value clears them). Lasts until restart.
+    """
+    if sample_rate is not None and not 0 <= sample_rate <= 1:
+        return {"error": "sample_rate must be between 0 and 1"}
+    ids = None
+    if app_ids is not None:
+        try:
+            ids = [int(a) for a in app_ids.split(",") if a.strip()]
+        except ValueError:
+            return {"error": "app_ids must be comma-separated integers"}
+    return profiling.configure(sample_rate, ids)
+
+@app.get("/jobs")
+def jobs(status: str = None, limit: int = 100):
+    """Processing jobs, newest first, with their completed stages."""
+    return {"jobs": list_jobs(status=status, limit=limit)}
+
+@app.get("/jobs/{app_id}")
+def job_status(app_id: int):
+    job = get_job(app_id)
+    if job is None:
+        return {"error":"not found"}
+    return job
+
+@app.get("/jobs/{app_id}/profile")
+def job_profile(app_id: int):
+    """A profiled job's artifacts and its per-stage memory summary."""
+    files = profiling.list_artifacts(app_id)
+    if files is None:
+        return {"error":"not found"}
+    return {"app_id": app_id, "files": files, "memory": profiling.memory_summary(app_id)}
+
+@app.get("/jobs/{app_id}/profile/{name}")
+def job_profile_file(app_id: int, name: str):
+    found = profiling.artifact(app_id, name)
+    if found is None:
+        return {"error":"not found"}
+    path, media_type = found
+    return FileResponse(path, media_type=media_type, filename=os.path.basename(path))
+
+@app.post("/jobs/{app_id}/retry")
+def retry(app_id: int):
+    """Requeue a failed job; it resumes from its first unfinished stage."""
+    job = get_job(app_id)
+    if job is None:
+        return {"error":"not found"}
+    if job["status"] != JOB_FAILED:
+        return {"error": f"job is {job['status']}"}
+    from worker import retry_job
+    requeued = retry_job(job)
+    if not requeued:
+        return {"error":"source files not found"}
+    daemon = get_daemon()
+    if daemon is not None and daemon.running():
+        daemon.nudge()
+    return {"status":"requeued", "app_id": app_id, "files": [os.path.basename(p) for p in requeued]}
+
 @app.post("/upload-zip")
-async def upload_zip(file: UploadFile = File(...)):
+async def upload_zip(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """
     Optional: upload a zip file from UI/operator machine; server extracts to incoming dir and triggers processing.
+    The upload is streamed to disk in chunks. Zip members are unpacked one
+    at a time in the background, and each PDF is queued as soon as it lands.
     """
-    save_path = os.path.join(INCOMING_DIR, file.filename)
-    with open(save_path, "wb") as f:
-        f.write(await file.read())
-    # If zip, extract
-    import zipfile
-    if zipfile.is_zipfile(save_path):
-        with zipfile.ZipFile(save_path, 'r') as z:
-            z.extractall(INCOMING_DIR)
-        os.remove(save_path)
-    return {"status":"uploaded"}
+    path, size = await save_upload(file)
+    if await asyncio.to_thread(zipfile.is_zipfile, path):
+        background_tasks.add_task(extract_upload, path, _enqueue_pdf)
+        return {"status":"uploaded", "bytes": size, "extracting": True}
+    dest = publish(path, safe_name(file.filename) or os.path.basename(path))
+    if dest.endswith(".pdf"):
+        await asyncio.to_thread(_enqueue_pdf, dest)
+    return {"status":"uploaded", "bytes": size, "file": os.path.basename(dest)}
+
+def _enqueue_pdf(path):
+    """
+    Start processing a PDF that just landed in INCOMING_DIR. May load the
+    processing stack: call it off the event loop.
+    """
+    daemon = get_daemon()
+    if daemon is not None and daemon.running():
+        daemon.nudge()
+        return
+    from worker import claim_file, settle_group
+    claimed = claim_file(path)
+    if claimed:
+        _upload_pipeline().submit([claimed], settle_group)
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+def _upload_pipeline():
+    """Pipeline for uploads when the ingest daemon is off; started on first use."""
+    global _pipeline
+    from pipeline import Pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = Pipeline().start()
+        return _pipeline
+
+def _not_modified(request, etag):
+    """True if the client's If-None-Match already names etag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def _byte_range(header, size):
+    """
+    (start, end) inclusive for a single "bytes=" range, "unsatisfiable", or
+    None when the header should be ignored (malformed or multiple ranges).
+    """
+    m = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", header)
+    if not m or m.group(1) == m.group(2) == "":
+        return None
+    if m.group(1) == "":
+        length = int(m.group(2))
+        if length == 0:
+            return "unsatisfiable"
+        return max(0, size - length), size - 1
+    start = int(m.group(1))
+    end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+    if start >= size:
+        return "unsatisfiable"
+    if end < start:
+        return None
+    return start, end
+
+def _read_span(f, start, length, chunk_size=64 * 1024):
+    with f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+def _serve_file(request, path, etag, media_type):
+    """
+    FileResponse with conditional GET (If-None-Match) and single byte-range
+    requests (Range, If-Range) answered with 206 Partial Content.
+    """
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    f = open(path, "rb")  # held open: the file may be evicted while streaming
+    size = os.fstat(f.fileno()).st_size
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'inline; filename="{os.path.basename(path)}"',
+    }
+    header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    span = _byte_range(header, size) if header and (not if_range or if_range == etag) else None
+    if span == "unsatisfiable":
+        f.close()
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}", "ETag": etag})
+    start, end = span or (0, size - 1)
+    if span:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_read_span(f, start, end - start + 1), status_code=206 if span else 200,
+                             media_type=media_type, headers=headers)
 
 @app.get("/results/list")
-def list_results():
-    jsons = [os.path.basename(p) for p in os.listdir(DRAFTS_DIR) if p.endswith(".json")]
-    pdfs = [os.path.basename(p) for p in os.listdir(REPORTS_DIR) if p.endswith(".pdf")]
-    return {"jsons": jsons, "pdfs": pdfs}
+def list_results(request: Request, response: Response, status: str = None, date_from: str = None,
+                 date_to: str = None, app_id: int = None, cursor: str = None, limit: int = 50):
+    """
+    Page through the results index (newest first) without touching the
+    filesystem. Pass next_cursor back as ?cursor= for the next page.
+    Filters: status, date_from/date_to (completion date, inclusive), app_id.
+    """
+    limit = max(1, min(limit, 500))
+    query = hashlib.sha1(str(sorted(request.query_params.multi_items())).encode()).hexdigest()[:12]
+    etag = f'"results-{results_version()}-{query}"'
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    try:
+        items, next_cursor = query_results(status=status, date_from=date_from, date_to=date_to,
+                                           app_id=app_id, cursor=cursor, limit=limit)
+    except ValueError as e:
+        return {"error": str(e)}
+    response.headers["ETag"] = etag
+    return {
+        "items": items,
+        "next_cursor": next_cursor,
+        "jsons": [i["json_file"] for i in items if i["json_file"]],
+        "pdfs": [i["report_file"] for i in items if i["report_file"]],
+    }
+
+@app.get("/results/app/{app_id}")
+def get_result_entry(app_id: int, request: Request, response: Response):
+    entry = get_result(app_id)
+    if entry is None:
+        return {"error":"not found"}
+    etag = f'"result-{app_id}-{entry["version"]}"'
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return entry
+
+@app.get("/results/app/{app_id}/json")
+def get_json_by_app_id(app_id: int, request: Request):
+    entry = get_result(app_id)
+    if entry is None or not entry["json_file"]:
+        return {"error":"not found"}
+    etag = f'"result-{app_id}-{entry["version"]}"'
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    path = os.path.join(DRAFTS_DIR, entry["json_file"])
+    if not os.path.exists(path):
+        return {"error":"not found"}
+    return FileResponse(path, media_type="application/json", headers={"ETag": etag})
 
 @app.get("/results/json/{fname}")
 def get_json(fname: str):
@@ -46,9 +312,36 @@ def get_json(fname: str):
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
+@app.get("/results/app/{app_id}/report")
+def get_report_by_app_id(app_id: int, request: Request):
+    """The application's PDF report, rendered on first request and cached."""
+    from report_cache import report_path
+    entry = get_result(app_id)
+    if entry is None:
+        return {"error":"not found"}
+    # A client holding the current version gets its 304 without a render.
+    if _not_modified(request, f'"report-{app_id}-{entry["version"]}"'):
+        return Response(status_code=304, headers={"ETag": f'"report-{app_id}-{entry["version"]}"'})
+    for attempt in range(2):
+        found = report_path(app_id)
+        if found is None:
+            return {"error":"not found"}
+        path, version = found
+        try:
+            return _serve_file(request, path, f'"report-{app_id}-{version}"', "application/pdf")
+        except FileNotFoundError:
+            # Evicted from the report cache between lookup and open: once more,
+            # rendering it again.
+            if attempt:
+                raise
+
 @app.get("/results/report/{fname}")
-def get_report(fname: str):
-    path = os.path.join(REPORTS_DIR, fname)
+def get_report(fname: str, request: Request):
+    m = re.fullmatch(r"application_(\d+)_report\.pdf", fname)
+    if m:
+        return get_report_by_app_id(int(m.group(1)), request)
+    path = os.path.join(REPORTS_DIR, os.path.basename(fname))
     if not os.path.exists(path):
         return {"error":"not found"}
-    return {"path": path}
+    st = os.stat(path)
+    return _serve_file(request, path, f'"{st.st_mtime_ns:x}-{st.st_size:x}"', "application/pdf")
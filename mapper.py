@@ -1,66 +1,208 @@
-import json
+import re
 import logging
 
+import docjson
+from zone_extractor import extract_zones, index_pages
+from table_extractor import extract_family_table
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
+# Label keywords per HeadOfFamily field, most specific field first: a label
+# such as "Father's Name" or "Name of Masjid" goes to the first field whose
+# keyword it contains, not to "name".
+FIELD_KEYWORDS = [
+    ("namazMasjid", ["masjid", "namaz"]),
+    ("fatherOrHusbandName", ["father", "husband"]),
+    ("voterID", ["voter id", "epic"]),
+    ("aadhaarNumber", ["aadhaar", "aadhar"]),
+    ("mobileNumber", ["mobile", "phone"]),
+    ("qualification", ["qualification", "education"]),
+    ("occupation", ["occupation", "work"]),
+    ("gender", ["gender", "sex"]),
+    ("address", ["address"]),
+    ("ward", ["ward"]),
+    ("age", ["age"]),
+    ("name", ["name", "head of family"]),
+]
+
+# Entity types Document AI may report confidences under, per field.
+ENTITY_TYPES = {
+    "name": "name",
+    "fatherOrHusbandName": "father",
+    "voterID": "voterid",
+    "aadhaarNumber": "aadhaar",
+    "gender": "gender",
+    "age": "age",
+    "qualification": "qualification",
+    "occupation": "occupation",
+    "address": "address",
+    "ward": "ward",
+    "mobileNumber": "mobile",
+    "namazMasjid": "masjid",
+}
+
+# Built once at import: keyword alternation -> (priority, field).
+_KEYWORD_FIELD = {}
+for _priority, (_field, _keywords) in enumerate(FIELD_KEYWORDS):
+    for _kw in _keywords:
+        _KEYWORD_FIELD.setdefault(_kw, (_priority, _field))
+_KEYWORD_RE = re.compile(
+    r"\b(?:" + "|".join(re.escape(k) for k in sorted(_KEYWORD_FIELD, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE,
+)
+_MAX_LABEL = 80  # only the tail of a long line before a colon is read as its label
+
+
+def classify_label(label):
+    """Return the HeadOfFamily field a label refers to, or None."""
+    best = None
+    for m in _KEYWORD_RE.finditer(label):
+        hit = _KEYWORD_FIELD[m.group(0).lower()]
+        if best is None or hit < best:
+            best = hit
+    return best[1] if best else None
+
+
+_LABEL_GLUE = 4  # "Father's Name", "Name of Masjid": keywords this close belong to one label
+
+
+def _label_start(part):
+    """
+    Where the label starts in the text between two colons ("55 Gender" ->
+    3): at the last keyword, extended back over keywords just before it.
+    len(part) when it holds no keyword (all value).
+    """
+    hits = list(_KEYWORD_RE.finditer(part))
+    if not hits:
+        return len(part)
+    k = len(hits) - 1
+    while k and hits[k].start() - hits[k - 1].end() <= _LABEL_GLUE:
+        k -= 1
+    return hits[k].start()
+
+
+def _clean(value):
+    return " ".join(value.split())
+
+
+def extract_fields(ocr_json):
+    """
+    Extract HeadOfFamily values in a single pass.
+    Structured formFields key/value pairs from the pages win; remaining
+    fields come from one scan over the OCR text lines for "label: value"
+    pairs (value on the same line, else on the next line). Each label is
+    matched against every field's keywords at once by a regex built at
+    import.
+    Returns (values, confidences); confidences only holds fields backed by
+    a formField.
+    """
+    text = ocr_json.get("text", "")
+    values, confidences = {}, {}
+
+    for page in docjson.pages(ocr_json):
+        for ff in docjson.form_fields(page):
+            label = docjson.layout_text(text, docjson.get(ff, "fieldName", "field_name"))
+            field = classify_label(label)
+            if field is None or values.get(field):
+                continue
+            value_layout = docjson.get(ff, "fieldValue", "field_value")
+            value = _clean(docjson.layout_text(text, value_layout))
+            if value:
+                values[field] = value
+                confidences[field] = docjson.confidence(value_layout, 0.9)
+
+    remaining = len(FIELD_KEYWORDS) - len(values)
+    lines = text.split("\n")
+    for i, line in enumerate(lines):
+        if not remaining:
+            break
+        if ":" not in line:
+            continue
+        # "Age: 55 Gender: Male" -> "Age" = "55", "Gender" = "Male": a middle
+        # part is a value followed by the next label, split by _label_start.
+        parts = line.split(":")
+        starts = [0] + [_label_start(p) for p in parts[1:-1]] + [len(parts[-1])]
+        for j in range(len(parts) - 1):
+            field = classify_label(parts[j][starts[j]:][-_MAX_LABEL:])
+            if field is None or values.get(field):
+                continue
+            value = parts[j + 1][:starts[j + 1]].strip()
+            if not value and j + 2 == len(parts) and i + 1 < len(lines) and ":" not in lines[i + 1]:
+                value = lines[i + 1].strip()
+            if value:
+                values[field] = _clean(value)
+                remaining -= 1
+
+    return values, confidences
+
+
 def map_fields_from_ocr(ocr_json, pdf_dims):
     """
     Converts Document AI OCR output JSON into the fixed AnjumanRegistrationForm schema.
+    Values come from the template.json zones first, then formFields, then
+    the text scan. pdf_dims may carry "page_numbers": the form page number
+    of each OCR page, when pages were dropped before OCR.
     """
-    text = ocr_json.get("text", "")
-    fields = {}
-
-    # Try to locate values by simple keyword search.
-    def find_value(keywords):
-        for k in keywords:
-            if k.lower() in text.lower():
-                idx = text.lower().find(k.lower())
-                snippet = text[idx: idx + 120]
-                parts = snippet.split(":")
-                if len(parts) > 1:
-                    value = parts[1].split("\n")[0].strip()
-                    return value
-        return ""
-
-    fields["name"] = find_value(["Name", "Head of Family"])
-    fields["fatherOrHusbandName"] = find_value(["Father", "Husband"])
-    fields["voterID"] = find_value(["Voter ID", "EPIC"])
-    fields["aadhaarNumber"] = find_value(["Aadhaar", "Aadhar"])
-    fields["gender"] = find_value(["Gender", "Sex"])
-    fields["age"] = find_value(["Age"])
-    fields["qualification"] = find_value(["Qualification", "Education"])
-    fields["occupation"] = find_value(["Occupation", "Work"])
-    fields["address"] = find_value(["Address"])
-    fields["ward"] = find_value(["Ward"])
-    fields["mobileNumber"] = find_value(["Mobile", "Phone"])
-    fields["namazMasjid"] = find_value(["Masjid", "Namaz"])
+    page_numbers = (pdf_dims or {}).get("page_numbers")
+    pages = index_pages(ocr_json)
+    zones = extract_zones(ocr_json, page_numbers, pages=pages)
+    members = extract_family_table(ocr_json, page_numbers, pages=pages)
+    values, field_conf = extract_fields(ocr_json)
+    sources = {field: ("form_field" if field in field_conf else "text") for field in values}
+    for field, _ in FIELD_KEYWORDS:
+        zone = zones.get(f"HeadOfFamily.{field}")
+        if zone and zone["value"]:
+            values[field] = zone["value"]
+            field_conf[field] = zone["confidence"]
+            sources[field] = "zone"
+    fields = {field: values.get(field, "") for field, _ in FIELD_KEYWORDS}
 
     # Basic confidence mapping
     confidence_map = {}
     for ent in ocr_json.get("entities", []):
-        field_name = ent.get("type_", "").lower()
+        field_name = (ent.get("type_") or ent.get("type") or "").lower()
         confidence_map[field_name] = ent.get("confidence", 0.85)
 
+    def conf(field, default=0.9):
+        if field in field_conf:
+            return field_conf[field]
+        return confidence_map.get(ENTITY_TYPES[field], default)
+
+    def zone_field(key, value, confidence):
+        """{"value", "confidence"} from a template zone, else the fallback."""
+        zone = zones.get(key)
+        if zone and zone["tokens"]:
+            return {"value": zone["value"], "confidence": zone["confidence"]}
+        return {"value": value, "confidence": confidence}
+
+    voter_id_mark = zones.get("DocumentChecklist.HOFVoterID")
+    if voter_id_mark is None:
+        hof_voter_id = {"value": True, "confidence": 0.95}
+    elif voter_id_mark["tokens"]:
+        hof_voter_id = {"value": True, "confidence": voter_id_mark["confidence"]}
+    else:
+        hof_voter_id = {"value": False, "confidence": 0.8}
+
     # Construct structured JSON in your specified template
     structured = {
         "AnjumanRegistrationForm": {
             "HeadOfFamily": {
-                "name": {"value": fields["name"], "confidence": confidence_map.get("name", 0.9999)},
-                "fatherOrHusbandName": {"value": fields["fatherOrHusbandName"], "confidence": confidence_map.get("father", 0.9)},
-                "voterID": {"value": fields["voterID"], "confidence": confidence_map.get("voterid", 0.9)},
-                "aadhaarNumber": {"value": fields["aadhaarNumber"], "confidence": confidence_map.get("aadhaar", 0.9)},
-                "gender": {"value": fields["gender"], "confidence": confidence_map.get("gender", 0.9)},
-                "age": {"value": int(fields["age"]) if fields["age"].isdigit() else 0, "confidence": confidence_map.get("age", 0.9)},
-                "qualification": {"value": fields["qualification"], "confidence": confidence_map.get("qualification", 0.9)},
-                "occupation": {"value": fields["occupation"], "confidence": confidence_map.get("occupation", 0.9)},
-                "address": {"value": fields["address"], "confidence": confidence_map.get("address", 0.9)},
-                "ward": {"value": fields["ward"], "confidence": confidence_map.get("ward", 0.9)},
-                "mobileNumber": {"value": fields["mobileNumber"], "confidence": confidence_map.get("mobile", 0.9)},
-                "namazMasjid": {"value": fields["namazMasjid"], "confidence": confidence_map.get("masjid", 0.9)},
+                "name": {"value": fields["name"], "confidence": conf("name", 0.9999)},
+                "fatherOrHusbandName": {"value": fields["fatherOrHusbandName"], "confidence": conf("fatherOrHusbandName")},
+                "voterID": {"value": fields["voterID"], "confidence": conf("voterID")},
+                "aadhaarNumber": {"value": fields["aadhaarNumber"], "confidence": conf("aadhaarNumber")},
+                "gender": {"value": fields["gender"], "confidence": conf("gender")},
+                "age": {"value": int(fields["age"]) if fields["age"].isdigit() else 0, "confidence": conf("age")},
+                "qualification": {"value": fields["qualification"], "confidence": conf("qualification")},
+                "occupation": {"value": fields["occupation"], "confidence": conf("occupation")},
+                "address": {"value": fields["address"], "confidence": conf("address")},
+                "ward": {"value": fields["ward"], "confidence": conf("ward")},
+                "mobileNumber": {"value": fields["mobileNumber"], "confidence": conf("mobileNumber")},
+                "namazMasjid": {"value": fields["namazMasjid"], "confidence": conf("namazMasjid")},
             },
-            "FamilyMembers": [],
+            "FamilyMembers": members,
             "DocumentChecklist": {
-                "HOFVoterID": {"value": True, "confidence": 0.95},
+                "HOFVoterID": hof_voter_id,
                 "HOFAdhaar": {"value": True, "confidence": 0.95},
                 "FamilyMemberAdultsVoterID": {"value": True, "confidence": 0.95},
                 "FamilyMemberMinorsAdhaar": {"value": True, "confidence": 0.95},
@@ -70,18 +212,22 @@ def map_fields_from_ocr(ocr_json, pdf_dims):
                 "consentToRegistration": {"value": True, "confidence": 0.99},
                 "truthfulnessOfInformation": {"value": True, "confidence": 0.99},
                 "responsibilityAcceptedByHOF": {"value": True, "confidence": 0.99},
-                "signatureOfHOF": {"value": fields["name"], "confidence": 0.97},
+                "signatureOfHOF": zone_field("LegalDeclaration.signatureOfHOF", fields["name"], 0.97),
                 "dateSigned": {"value": "", "confidence": 0.0},
             },
             "AcknowledgementSlip": {
-                "nameOfHeadOfFamily": {"value": fields["name"], "confidence": 0.98},
+                "nameOfHeadOfFamily": zone_field("AcknowledgementSlip.nameOfHeadOfFamily", fields["name"], 0.98),
                 "receivedBy": {"value": "", "confidence": 0.0},
                 "officeSealSignature": {"value": "", "confidence": 0.0},
-                "dateReceived": {"value": "", "confidence": 0.0},
+                "dateReceived": zone_field("AcknowledgementSlip.dateReceived", "", 0.0),
             },
         }
     }
 
-    provenance = {"total_entities": len(ocr_json.get("entities", []))}
+    provenance = {
+        "total_entities": len(ocr_json.get("entities", [])),
+        "family_members": len(members),
+        "field_sources": {field: sources.get(field, "none") for field, _ in FIELD_KEYWORDS},
+    }
     logging.info("Mapped form fields successfully")
     return structured, provenance
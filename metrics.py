@@ -0,0 +1,243 @@
+"""
+metrics.py  –  Process metrics in the Prometheus text format
+-----------------------------------------------------------
+Counters, gauges and histograms for the worker, the pipeline and the
+Document AI client, served by main.py on GET /metrics. A small subset of
+the prometheus_client API, so no extra package is needed:
+
+    STAGE_SECONDS.labels(stage="ocr").observe(seconds)
+    PAGES.labels(result="blank").inc()
+    OCR_IN_FLIGHT.inc() ... OCR_IN_FLIGHT.dec()
+
+An update is a dict lookup and a locked add. Values that already live
+elsewhere (queue depths, applications in flight) are not tracked as they
+change: functions registered with on_collect() copy them into gauges when
+/metrics is scraped. With METRICS_ENABLED off every update returns at once.
+"""
+
+import bisect
+import logging
+import threading
+import time
+
+from config import METRICS_ENABLED
+
+_registry = []   # metrics in definition order
+_collectors = []  # called before each render()
+
+# Seconds: from a fast SQLite write to a slow Document AI call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        _registry.append(self)
+
+    def labels(self, **labels):
+        """The child metric for one combination of label values."""
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _only(self):
+        return self._children[()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, key))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self.value = value
+
+    def render(self, name, labelnames, key):
+        with self._lock:
+            value = self.value
+        return [f"{name}{_label_text(labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """Monotonic count; the exposed name gets the conventional _total suffix."""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name if name.endswith("_total") else f"{name}_total", documentation, labelnames)
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._only().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._only().inc(amount)
+
+    def dec(self, amount=1):
+        self._only().dec(amount)
+
+    def set(self, value):
+        self._only().set(value)
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class _Buckets:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        if not METRICS_ENABLED:
+            return
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager observing the seconds its block takes."""
+        return _Timer(self)
+
+    def render(self, name, labelnames, key):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.bounds + (float("inf"),), counts):
+            cumulative += count
+            le = (("le", _format_value(float(bound))),)
+            lines.append(f"{name}_bucket{_label_text(labelnames, key, le)} {cumulative}")
+        lines.append(f"{name}_sum{_label_text(labelnames, key)} {_format_value(total)}")
+        lines.append(f"{name}_count{_label_text(labelnames, key)} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        self._only().observe(value)
+
+    def time(self):
+        return self._only().time()
+
+
+def on_collect(fn):
+    """Call fn() before every render(), to refresh gauges from live state."""
+    _collectors.append(fn)
+    return fn
+
+
+def render():
+    """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+    for fn in list(_collectors):
+        try:
+            fn()
+        except Exception:
+            logging.exception("Metrics collector %s failed", getattr(fn, "__name__", fn))
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ----------------------------------------------------------------------
+# Application metrics
+# ----------------------------------------------------------------------
+STAGE_SECONDS = Histogram("anjuman_stage_seconds", "Seconds per processing stage run (worker.STAGES).",
+                          ["stage"])
+STAGE_FAILURES = Counter("anjuman_stage_failures", "Stage runs that failed their job.", ["stage"])
+APPLICATIONS = Counter("anjuman_applications", "Applications finished, by outcome.", ["status"])
+PAGES = Counter("anjuman_pages", "Source pages rendered for preprocessing, by outcome.", ["result"])
+PAGE_RENDER_SECONDS = Histogram("anjuman_page_render_seconds", "Seconds to render one PDF page for preprocessing.",
+                                buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+BYTES_WRITTEN = Counter("anjuman_bytes_written", "Bytes written to disk, by artifact.", ["kind"])
+
+OCR_REQUESTS = Counter("anjuman_ocr_requests", "Document AI calls, by outcome (ok, retry, error).", ["outcome"])
+OCR_REQUEST_SECONDS = Histogram("anjuman_ocr_request_seconds", "Seconds per Document AI call.")
+OCR_IN_FLIGHT = Gauge("anjuman_ocr_in_flight", "Document AI calls in flight.")
+OCR_UPLOAD_BYTES = Counter("anjuman_ocr_upload_bytes", "Document bytes sent to Document AI.")
+OCR_CACHE_HITS = Counter("anjuman_ocr_cache_hits", "Documents answered from the OCR cache.")
+
+DB_TRANSACTION_SECONDS = Histogram("anjuman_db_transaction_seconds",
+                                   "Seconds per SQLite write transaction, waiting for the write lock included.",
+                                   buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+REPORT_SECONDS = Histogram("anjuman_report_seconds", "Seconds to render one PDF report.")
+
+QUEUE_DEPTH = Gauge("anjuman_queue_depth", "Items waiting in a queue (pipeline steps, ingest daemon).", ["queue"])
+PIPELINE_IN_FLIGHT = Gauge("anjuman_pipeline_in_flight", "Applications inside staged pipelines.")
@@ -0,0 +1,149 @@
+"""
+ocr_cache.py  –  Content-addressed cache of Document AI results
+--------------------------------------------------------------
+Entries are keyed by a SHA-256 of the normalized PDF bytes plus the
+processor ID and version, so a retried application (or a re-upload of the
+same pages) is answered from disk instead of a second paid OCR call.
+
+Each entry is the serialized Document proto in OCR_CACHE_DIR/<key>.pb.
+The cache is capped at OCR_CACHE_MAX_BYTES and evicts least recently used
+entries; recency survives restarts through the files' mtimes.
+"""
+
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+from google.cloud import documentai_v1 as documentai
+
+from config import (
+    PROCESSOR_ID,
+    PROCESSOR_VERSION,
+    OCR_CACHE_DIR,
+    OCR_CACHE_MAX_BYTES,
+    OCR_CACHE_ENABLED,
+)
+
+# Writer timestamps and file IDs differ between two builds of the same pages.
+_VOLATILE_PDF_FIELDS = re.compile(
+    rb"/(?:CreationDate|ModDate)\s*\([^)]*\)|/ID\s*\[\s*<[0-9A-Fa-f]*>\s*<[0-9A-Fa-f]*>\s*\]"
+)
+
+
+def normalize_pdf_bytes(pdf_bytes):
+    """Strip metadata that changes on every write but not with the content."""
+    return _VOLATILE_PDF_FIELDS.sub(b"", pdf_bytes)
+
+
+def cache_key(pdf_bytes, processor_id=PROCESSOR_ID, processor_version=PROCESSOR_VERSION):
+    h = hashlib.sha256()
+    h.update(f"{processor_id}:{processor_version or 'default'}\n".encode("utf-8"))
+    h.update(normalize_pdf_bytes(pdf_bytes))
+    return h.hexdigest()
+
+
+class OcrCache:
+    """Size-capped LRU cache of Document protos on local disk. Thread-safe."""
+
+    def __init__(self, cache_dir=OCR_CACHE_DIR, max_bytes=OCR_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._total = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pb")
+
+    def _load_index(self):
+        found = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pb"):
+                st = entry.stat()
+                found.append((st.st_mtime, entry.name[:-3], st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total += size
+
+    def get(self, key):
+        """Return the cached Document for key, or None."""
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                if key in self._entries:
+                    self._total -= self._entries.pop(key)
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if key not in self._entries:  # written by another process
+                self._entries[key] = len(data)
+                self._total += len(data)
+            self._entries.move_to_end(key)
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+        return documentai.Document.deserialize(data)
+
+    def put(self, key, document):
+        data = documentai.Document.serialize(document)
+        tmp = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._path(key))
+
+        with self._lock:
+            if key in self._entries:
+                self._total -= self._entries.pop(key)
+            self._entries[key] = len(data)
+            self._total += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Shared process-wide cache, or None when OCR_CACHE_ENABLED is off."""
+    global _cache
+    if not OCR_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = OcrCache()
+        return _cache
@@ -0,0 +1,250 @@
+"""
+ocr_packer.py  –  Several applications per Document AI request
+--------------------------------------------------------------
+An application's merged PDF is only a few pages, and every
+process_document call pays for its connection, auth and queueing on
+Google's side on top of the per-page work. OcrPacker collects the PDFs the
+pipeline sends within OCR_PACK_WAIT seconds into one PDF of at most
+OCR_PACK_MAX_PAGES pages (and OCR_PACK_MAX_BYTES), sends that as a single
+request, and splits the returned Document back into one per application:
+
+  pack_pdfs       concatenates the PDFs, with a top-level bookmark at each
+                  application's first page, and returns each one's page
+                  range
+  split_document  cuts the Document at those page ranges: each part gets its
+                  pages (renumbered from 1), its slice of the text, the
+                  entities on its pages, and every text anchor and page
+                  reference shifted into its slice
+
+Split documents are cached under each application's own PDF hash, so a
+retried or resumed job is answered from the OCR cache as if its PDF had
+been sent alone. If a packed request is rejected for anything other than
+throttling or a transient fault (a malformed PDF, say), its applications
+are sent again one by one, so one bad PDF does not fail its neighbours.
+"""
+
+import asyncio
+import bisect
+import logging
+
+import fitz  # PyMuPDF
+from google.cloud import documentai_v1 as documentai
+
+from config import OCR_PACK_MAX_PAGES, OCR_PACK_MAX_BYTES, OCR_PACK_WAIT
+from document_ai_client import AsyncDocumentAIClient, CircuitOpenError, RETRYABLE_ERRORS
+from ocr_cache import cache_key, get_cache
+
+_TEXT_ANCHOR = "google.cloud.documentai.v1.Document.TextAnchor"
+_PAGE_REF = "google.cloud.documentai.v1.Document.PageAnchor.PageRef"
+# Messages that never hold a text anchor or page reference; not walked.
+_NO_ANCHORS = {
+    "google.cloud.documentai.v1.BoundingPoly",
+    "google.cloud.documentai.v1.Document.Page.Image",
+    "google.cloud.documentai.v1.Document.Page.Matrix",
+    "google.cloud.documentai.v1.Document.Page.Dimension",
+    "google.cloud.documentai.v1.Document.Page.DetectedLanguage",
+    "google.cloud.documentai.v1.Document.Page.ImageQualityScores",
+    "google.cloud.documentai.v1.Document.Page.Token.DetectedBreak",
+    "google.cloud.documentai.v1.Document.Page.Token.StyleInfo",
+    "google.cloud.documentai.v1.Document.Provenance",
+}
+
+
+def page_count(content):
+    with fitz.open(stream=content, filetype="pdf") as doc:
+        return doc.page_count
+
+
+def pack_pdfs(contents):
+    """
+    One PDF holding the PDFs in contents, in order, bookmarked at each one's
+    first page. Returns (pdf_bytes, [(first_page, page_count)]), pages
+    counted from 0.
+    """
+    ranges = []
+    with fitz.open() as packed:
+        for content in contents:
+            with fitz.open(stream=content, filetype="pdf") as doc:
+                ranges.append((packed.page_count, doc.page_count))
+                packed.insert_pdf(doc)
+        packed.set_toc([[1, f"Application {i}", first + 1]
+                        for i, (first, count) in enumerate(ranges, start=1) if count])
+        return packed.tobytes(), ranges
+
+
+def _shift(msg, offset, first_page, length):
+    """Move the anchors under msg (a raw proto) into a part's text and pages."""
+    name = msg.DESCRIPTOR.full_name
+    if name == _TEXT_ANCHOR:
+        for seg in msg.text_segments:
+            seg.start_index = min(max(seg.start_index - offset, 0), length)
+            seg.end_index = min(max(seg.end_index - offset, 0), length)
+        return
+    if name == _PAGE_REF:
+        msg.page -= first_page
+        return
+    for field, value in msg.ListFields():
+        if field.message_type is None or field.message_type.full_name in _NO_ANCHORS:
+            continue
+        if field.label == field.LABEL_REPEATED:
+            for item in value:
+                _shift(item, offset, first_page, length)
+        else:
+            _shift(value, offset, first_page, length)
+
+
+def _text_start(pages):
+    starts = [seg.start_index for page in pages for seg in page.layout.text_anchor.text_segments]
+    return min(starts) if starts else None
+
+
+def _anchor_start(msg):
+    segments = msg.text_anchor.text_segments
+    return segments[0].start_index if segments else None
+
+
+def split_document(document, ranges):
+    """
+    Split the Document returned for a pack_pdfs PDF into one Document per
+    (first_page, page_count) range.
+    """
+    pb = documentai.Document.pb(document)
+    text = pb.text
+    # An application's text runs up to where the next one's begins.
+    bounds = [0] * len(ranges) + [len(text)]
+    for i in range(len(ranges) - 1, 0, -1):
+        first, count = ranges[i]
+        start = _text_start(pb.pages[first:first + count])
+        bounds[i] = bounds[i + 1] if start is None else min(start, bounds[i + 1])
+    firsts = [first for first, _ in ranges]
+
+    def part_of(entity):
+        refs = entity.page_anchor.page_refs
+        if refs:
+            return max(bisect.bisect_right(firsts, refs[0].page) - 1, 0)
+        start = _anchor_start(entity)
+        return None if start is None else max(bisect.bisect_right(bounds, start, hi=len(ranges)) - 1, 0)
+
+    entities = [[] for _ in ranges]
+    for entity in pb.entities:
+        i = part_of(entity)
+        if i is not None:
+            entities[i].append(entity)
+    styles = [[] for _ in ranges]
+    for style in pb.text_styles:
+        start = _anchor_start(style)
+        if start is not None:
+            styles[max(bisect.bisect_right(bounds, start, hi=len(ranges)) - 1, 0)].append(style)
+
+    parts = []
+    for i, (first, count) in enumerate(ranges):
+        start, end = bounds[i], bounds[i + 1]
+        part = type(pb)(mime_type=pb.mime_type, text=text[start:end])
+        if pb.uri:
+            part.uri = pb.uri
+        part.pages.extend(pb.pages[first:first + count])
+        for number, page in enumerate(part.pages, start=1):
+            page.page_number = number
+        part.entities.extend(entities[i])
+        ids = {entity.id for entity in entities[i] if entity.id}
+        part.entity_relations.extend(r for r in pb.entity_relations if r.subject_id in ids and r.object_id in ids)
+        part.text_styles.extend(styles[i])
+        if pb.HasField("error"):
+            part.error.CopyFrom(pb.error)
+        _shift(part, start, first, end - start)
+        parts.append(documentai.Document.wrap(part))
+    return parts
+
+
+class OcrPacker:
+    """
+    Stands in for AsyncDocumentAIClient.process() inside an asyncio loop,
+    packing PDFs from concurrent calls into shared requests. `client` sends
+    them (by default an AsyncDocumentAIClient without a cache: the packer
+    caches each application's Document in `cache`, the shared OCR cache
+    unless ``cache=False``).
+    """
+
+    def __init__(self, client=None, max_pages=OCR_PACK_MAX_PAGES, max_bytes=OCR_PACK_MAX_BYTES,
+                 wait=OCR_PACK_WAIT, cache=None):
+        self.client = client or AsyncDocumentAIClient(cache=False)
+        self.cache = get_cache() if cache is None else (cache or None)
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.wait = wait
+        self.requests = 0      # Document AI requests sent
+        self.applications = 0  # applications those requests carried
+        self._pending = []     # (content, cache key, future) waiting for a request
+        self._pages = 0
+        self._bytes = 0
+        self._timer = None
+        self._sending = set()
+
+    async def process(self, content, mime_type="application/pdf"):
+        """The documentai.Document for one application's PDF."""
+        if mime_type != "application/pdf":
+            return await self.client.process(content, mime_type)
+        key = None
+        if self.cache:
+            key = cache_key(content)
+            document = await asyncio.to_thread(self.cache.get, key)
+            if document is not None:
+                return document
+        pages = await asyncio.to_thread(page_count, content)
+        if self._pending and (self._pages + pages > self.max_pages or self._bytes + len(content) > self.max_bytes):
+            self._flush()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((content, key, future))
+        self._pages += pages
+        self._bytes += len(content)
+        if self._pages >= self.max_pages or self._bytes >= self.max_bytes:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        self._pages = self._bytes = 0
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch):
+        try:
+            documents = await self._request([content for content, _, _ in batch])
+        except Exception as e:
+            if len(batch) > 1 and not isinstance(e, RETRYABLE_ERRORS + (CircuitOpenError,)):
+                logging.warning("Packed Document AI request for %d applications failed (%r); sending them one by one",
+                                len(batch), e)
+                await asyncio.gather(*(self._send([item]) for item in batch))
+                return
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (content, key, future), document in zip(batch, documents):
+            if self.cache:
+                await asyncio.to_thread(self.cache.put, key, document)
+            if not future.done():
+                future.set_result(document)
+
+    async def _request(self, contents):
+        self.requests += 1
+        self.applications += len(contents)
+        if len(contents) == 1:
+            return [await self.client.process(contents[0])]
+        packed, ranges = await asyncio.to_thread(pack_pdfs, contents)
+        document = await self.client.process(packed)
+        return await asyncio.to_thread(split_document, document, ranges)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "applications": self.applications,
+            "apps_per_request": (self.applications / self.requests) if self.requests else 0.0,
+        }
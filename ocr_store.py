@@ -0,0 +1,174 @@
+"""
+ocr_store.py  –  Compact archive of raw Document AI output
+---------------------------------------------------------
+The worker maps fields from the in-memory Document; the raw OCR is only
+kept for audits and re-mapping. Each archive is the serialized Document
+proto, compressed with zstd when the zstandard package is installed and
+gzip otherwise, next to a small JSON summary (page sizes, entities, form
+fields) that can be read without the proto:
+
+    OCR_RAW_DIR/<name>_ocr.pb.zst   (or .pb.gz)
+    OCR_RAW_DIR/<name>_ocr.summary.json
+
+Archives are written on a background thread so the worker does not wait on
+compression or disk. load_document()/load_ocr_json() read these archives as
+well as the older pretty-printed <name>_ocr.json files.
+"""
+
+import os
+import gzip
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud import documentai_v1 as documentai
+
+from config import OCR_RAW_DIR, OCR_ARCHIVE_ENABLED, OCR_ARCHIVE_COMPRESSION, OCR_ARCHIVE_LEVEL
+from metrics import BYTES_WRITTEN
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def _compression():
+    if OCR_ARCHIVE_COMPRESSION == "zstd" and zstandard is None:
+        logging.warning("zstandard is not installed; OCR archives fall back to gzip")
+        return "gzip"
+    if OCR_ARCHIVE_COMPRESSION == "auto":
+        return "zstd" if zstandard is not None else "gzip"
+    return OCR_ARCHIVE_COMPRESSION
+
+
+def _stem(pdf_path):
+    return os.path.splitext(os.path.basename(pdf_path))[0] + "_ocr"
+
+
+def archive_path(pdf_path, out_dir=OCR_RAW_DIR):
+    ext = ".pb.zst" if _compression() == "zstd" else ".pb.gz"
+    return os.path.join(out_dir, _stem(pdf_path) + ext)
+
+
+def summarize(document):
+    """The few facts about a Document worth reading without loading it."""
+    text = document.text
+
+    def anchored(layout):
+        return "".join(text[int(s.start_index):int(s.end_index)] for s in layout.text_anchor.text_segments).strip()
+
+    return {
+        "text_length": len(text),
+        "pages": [
+            {
+                "page_number": p.page_number,
+                "width": p.dimension.width,
+                "height": p.dimension.height,
+                "tokens": len(p.tokens),
+                "form_fields": [
+                    {
+                        "name": anchored(ff.field_name),
+                        "value": anchored(ff.field_value),
+                        "confidence": ff.field_value.confidence,
+                    }
+                    for ff in p.form_fields
+                ],
+            }
+            for p in document.pages
+        ],
+        "entities": [
+            {"type": e.type_, "mention_text": e.mention_text, "confidence": e.confidence}
+            for e in document.entities
+        ],
+    }
+
+
+def _atomic_write(path, data):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    BYTES_WRITTEN.labels(kind="ocr_archive").inc(len(data))
+
+
+def write_archive(document, pdf_path, out_dir=OCR_RAW_DIR):
+    """Write the compressed proto and its summary; returns the archive path."""
+    os.makedirs(out_dir, exist_ok=True)
+    path = archive_path(pdf_path, out_dir)
+    data = documentai.Document.serialize(document)
+    if path.endswith(".zst"):
+        data = zstandard.ZstdCompressor(level=OCR_ARCHIVE_LEVEL).compress(data)
+    else:
+        data = gzip.compress(data, compresslevel=min(OCR_ARCHIVE_LEVEL, 9))
+    _atomic_write(path, data)
+    summary = os.path.join(out_dir, _stem(pdf_path) + ".summary.json")
+    _atomic_write(summary, json.dumps(summarize(document), indent=2).encode("utf-8"))
+    return path
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr-archive")
+        return _executor
+
+
+def _archive_done(future):
+    with _executor_lock:
+        _pending.discard(future)
+    if future.exception() is not None:
+        logging.error("Writing OCR archive failed: %s", future.exception())
+
+
+def archive_async(document, pdf_path, out_dir=OCR_RAW_DIR):
+    """
+    Queue write_archive() on the background writer and return its path
+    (the file appears once the write completes), or None if archiving is off.
+    """
+    if not OCR_ARCHIVE_ENABLED:
+        return None
+    future = _get_executor().submit(write_archive, document, pdf_path, out_dir)
+    with _executor_lock:
+        _pending.add(future)
+    future.add_done_callback(_archive_done)
+    return archive_path(pdf_path, out_dir)
+
+
+def flush(timeout=None):
+    """Wait for queued archive writes to finish."""
+    with _executor_lock:
+        pending = list(_pending)
+    for future in pending:
+        try:
+            future.result(timeout=timeout)
+        except Exception:
+            pass  # already logged by _archive_done
+
+
+def load_document(path):
+    """Read a Document from a .pb.zst / .pb.gz / .pb archive or an _ocr.json file."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(".json"):
+        return documentai.Document.from_json(data.decode("utf-8"), ignore_unknown_fields=True)
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{path} is zstd-compressed; install zstandard to read it")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif path.endswith(".gz"):
+        data = gzip.decompress(data)
+    return documentai.Document.deserialize(data)
+
+
+def load_ocr_json(path):
+    """The OCR output as the dict the mapper takes, from either format."""
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return documentai.Document.to_dict(load_document(path))
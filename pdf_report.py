@@ -1,12 +1,167 @@
 # pdf_report.py
+import reportlab
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfdoc
 from reportlab.lib.units import mm
 from reportlab.lib.utils import ImageReader
-import json, textwrap, os
-from config import REPORTS_DIR
+from PIL import Image
+import cv2
+import numpy as np
+import io, json, textwrap, os, re, zlib, hashlib, logging
+from config import REPORTS_DIR, REPORT_QUALITY, REPORT_QUALITY_TIERS
+from metrics import REPORT_SECONDS, BYTES_WRITTEN
 
-def generate_pdf_report(app_id, filled_json, page_image_paths, output_path=None):
+
+def _quality(quality):
+    tier = REPORT_QUALITY_TIERS.get(quality)
+    if tier is None:
+        raise ValueError(f"Unknown report quality {quality!r} (expected one of {sorted(REPORT_QUALITY_TIERS)})")
+    return tier
+
+
+def _page_array(img_src):
+    """In-memory pages are used as-is; files are only decoded when given as paths."""
+    if not isinstance(img_src, str):
+        return img_src
+    with Image.open(img_src) as im:
+        return np.asarray(im.convert("L" if im.mode in ("1", "L", "LA", "I", "I;16") else "RGB"))
+
+
+def _bilevel_levels(page):
+    """(dark, light) if a grayscale page holds only two values, else None."""
+    if page.ndim != 2 or page.dtype != np.uint8:
+        return None
+    levels = np.flatnonzero(cv2.calcHist([page], [0], None, [256], [0, 256]))
+    if len(levels) == 2:
+        return int(levels[0]), int(levels[1])
+    if len(levels) == 1:
+        return int(levels[0]), int(levels[0])
+    return None
+
+
+def _fit(page, w_pt, h_pt, dpi):
+    """
+    Downsample page to dpi at its displayed size (w_pt x h_pt). Never
+    upsamples, and skips resamples that would keep over 80% of the width:
+    they save little, and re-thresholded bilevel pages compress worse.
+    """
+    ih, iw = page.shape[:2]
+    tw, th = max(1, round(w_pt / 72 * dpi)), max(1, round(h_pt / 72 * dpi))
+    if tw > 0.8 * iw or th > 0.8 * ih:
+        return page
+    return cv2.resize(page, (tw, th), interpolation=cv2.INTER_AREA)
+
+
+def _encode_page(page, tier, w_pt, h_pt):
+    """
+    Encodes one page for embedding at w_pt x h_pt: ("bilevel", boolean
+    array) for bilevel pages, ("jpeg", bytes), or ("raw", 8-bit array) when
+    the tier has no jpeg_quality.
+    """
+    levels = _bilevel_levels(page) if tier["bilevel"] else None
+    page = _fit(page, w_pt, h_pt, tier["dpi"])
+    if levels is not None:
+        # Area downsampling greys the stroke edges; threshold back to 1 bit.
+        return "bilevel", page >= (levels[0] + levels[1] + 1) / 2
+    if tier["jpeg_quality"]:
+        pixels = page if page.ndim == 2 else cv2.cvtColor(page, cv2.COLOR_RGB2BGR)
+        ok, buf = cv2.imencode(".jpg", pixels, [cv2.IMWRITE_JPEG_QUALITY, int(tier["jpeg_quality"])])
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+        return "jpeg", buf.tobytes()
+    return "raw", np.ascontiguousarray(page)
+
+
+def _page_image(kind, data):
+    """ImageReader for canvas.drawImage (public API; 1-bit pages are stored as 8-bit RGB)."""
+    if kind == "jpeg":
+        return ImageReader(io.BytesIO(data))
+    return ImageReader(Image.fromarray(data))
+
+
+def _image_xobject(kind, data):
+    """
+    PDFImageXObject as the PDF should hold it: bilevel pages as 1-bit Flate,
+    JPEGs passed through without ASCII85, others as 8-bit Flate.
+    """
+    if kind == "bilevel":
+        packed = zlib.compress(np.packbits(data, axis=1).tobytes())
+        obj = pdfdoc.PDFImageXObject(hashlib.md5(packed).hexdigest())
+        obj.bitsPerComponent = 1
+        obj.colorSpace = "DeviceGray"
+        obj._filters = ("FlateDecode",)
+        obj.streamContent = packed
+        obj.width, obj.height = data.shape[1], data.shape[0]
+        obj.mask = None
+        return obj
+    if kind == "jpeg":
+        obj = pdfdoc.PDFImageXObject(hashlib.md5(data).hexdigest())
+        obj.loadImageFromJPEG(io.BytesIO(data))
+        if obj._filters[0] == "ASCII85Decode":
+            obj.streamContent, obj._filters = data, ("DCTDecode",)
+        return obj
+    obj = pdfdoc.PDFImageXObject(hashlib.md5(data).hexdigest())
+    obj.loadImageFromSRC(ImageReader(Image.fromarray(data)))
+    return obj
+
+
+def _draw_xobject(c, obj, x, y, w, h):
+    """canvas.drawImage for a prepared PDFImageXObject (skips its RGB digest pass)."""
+    doc, code, forms = c._doc, c._code, c._formsinuse  # fail here, before the page is touched
+    reg_name = doc.getXObjectName(obj.name)
+    if doc.idToObject.get(reg_name) is None:
+        c._setXObjects(obj)
+        doc.Reference(obj, reg_name)
+        doc.addForm(obj.name, obj)
+    c._currentPageHasImages = 1
+    c.saveState()
+    c.translate(x, y)
+    c.scale(w, h)
+    code.append(f"/{reg_name} Do")
+    c.restoreState()
+    forms.append(obj.name)
+
+
+def _reportlab_version():
+    return tuple(int(n) for n in re.findall(r"\d+", reportlab.Version)[:2])
+
+
+# drawImage stores 1-bit pages as 8-bit RGB and JPEGs ASCII85-encoded, and
+# decodes every image to hash it: reports come out up to 2.5x larger and
+# several times slower (the -drawImage rows of benchmark.py report). On the
+# reportlab releases _draw_xobject was checked against, pages go in as
+# prepared XObjects through canvas internals instead; elsewhere, or once
+# those internals turn out to have changed, drawImage is used.
+DIRECT_XOBJECTS = (4, 0) <= _reportlab_version() < (5, 0)
+
+
+def _draw_page(c, page, tier, x, y, w, h):
+    global DIRECT_XOBJECTS
+    kind, data = _encode_page(page, tier, w, h)
+    if DIRECT_XOBJECTS:
+        try:
+            _draw_xobject(c, _image_xobject(kind, data), x, y, w, h)
+            return
+        except (AttributeError, TypeError, KeyError):
+            logging.exception("reportlab %s internals changed; falling back to drawImage", reportlab.Version)
+            DIRECT_XOBJECTS = False
+    c.drawImage(_page_image(kind, data), x, y, w, h)
+
+
+def generate_pdf_report(app_id, filled_json, page_image_paths, output_path=None, quality=REPORT_QUALITY):
+    """
+    page_image_paths may hold image file paths or in-memory page arrays
+    (as produced by worker.preprocess_group). Page images are downsampled to
+    the quality tier's dpi at their size on the A4 page (REPORT_QUALITY_TIERS).
+    """
+    with REPORT_SECONDS.time():
+        output_path = _render_report(app_id, filled_json, page_image_paths, output_path, _quality(quality))
+    BYTES_WRITTEN.labels(kind="report").inc(os.path.getsize(output_path))
+    return output_path
+
+
+def _render_report(app_id, filled_json, page_image_paths, output_path, tier):
     if output_path is None:
         output_path = os.path.join(REPORTS_DIR, f"application_{app_id}_report.pdf")
     c = canvas.Canvas(output_path, pagesize=A4)
@@ -18,42 +173,40 @@ def generate_pdf_report(app_id, filled_json, page_image_paths, output_path=None)
     y -= 18
     c.setFont("Helvetica", 9)
     # Metadata top block
-    meta = filled_json.get('metadata', {})
     app_meta_text = f"Status: {filled_json.get('metadata', {}).get('status','draft')}"
     c.drawString(margin, y, app_meta_text)
     y -= 20
-    # JSON content (pretty printed) - limited lines per page
+    # JSON content (pretty printed), one text object per page
     json_text = json.dumps(filled_json, ensure_ascii=False, indent=2)
-    wrapped = textwrap.wrap(json_text, 120)
-    c.setFont("Courier", 7)
-    lines_per_page = 45
-    idx = 0
-    while idx < len(wrapped):
-        if y < 80:
+    text = c.beginText(margin, y)
+    text.setFont("Courier", 7, leading=12)
+    for line in textwrap.wrap(json_text, 120):
+        if text.getY() < 80:
+            c.drawText(text)
             c.showPage()
-            y = height - margin
-            c.setFont("Courier", 7)
-        line = wrapped[idx]
-        c.drawString(margin, y, line)
-        y -= 12
-        idx += 1
-    # Add page thumbnails after JSON, one per PDF page
-    for img_path in page_image_paths:
+            text = c.beginText(margin, height - margin)
+            text.setFont("Courier", 7, leading=12)
+        text.textLine(line)
+    c.drawText(text)
+    # Add page images after JSON, one per PDF page
+    max_w = width - 2*margin
+    max_h = height - 2*margin - 20*mm
+    for page_no, img_src in enumerate(page_image_paths, start=1):
         c.showPage()
         c.setFont("Helvetica-Bold", 12)
-        c.drawString(margin, height - margin - 12, f"Page image: {os.path.basename(img_path)}")
+        label = os.path.basename(img_src) if isinstance(img_src, str) else f"page_{page_no:02d}"
+        c.drawString(margin, height - margin - 12, f"Page image: {label}")
         try:
-            img = ImageReader(img_path)
+            page = _page_array(img_src)
+            ih, iw = page.shape[:2]
             # scale to fit A4 with margins
-            max_w = width - 2*margin
-            max_h = height - 2*margin - 20*mm
-            iw, ih = img.getSize()
             scale = min(max_w/iw, max_h/ih, 1.0)
             w_img, h_img = iw*scale, ih*scale
             x = (width - w_img)/2
             y_img = (height - h_img)/2 - 20
-            c.drawImage(img, x, y_img, w_img, h_img)
+            _draw_page(c, page, tier, x, y_img, w_img, h_img)
         except Exception:
+            logging.exception("Could not embed page %d of application %s in its report", page_no, app_id)
             c.drawString(margin, height - margin - 40, "Error embedding image.")
     c.save()
     return output_path
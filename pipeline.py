@@ -0,0 +1,290 @@
+"""
+pipeline.py  –  Staged executor for application processing
+----------------------------------------------------------
+process_application_group runs every stage of one application back to back,
+so while Document AI works on one form no core preprocesses the next. The
+Pipeline splits the same checkpointed stages (worker.STAGES) into four
+steps, each with its own workers, joined by bounded queues:
+
+  prepare   preprocess + dedup +       threads driving the preprocessing
+            build_pdf                  process pool (PIPELINE_PREPARE_WORKERS)
+  ocr       Document AI                one asyncio loop thread with up to
+                                       PIPELINE_OCR_CONCURRENCY requests in
+                                       flight (AsyncDocumentAIClient), each
+                                       carrying several applications with
+                                       OCR_PACK_ENABLED (ocr_packer.py)
+  persist   map + write_json + db      threads (PIPELINE_PERSIST_WORKERS)
+  report    report + archive           threads (PIPELINE_REPORT_WORKERS)
+
+A step blocks on a full downstream queue (PIPELINE_QUEUE_SIZE), and submit()
+blocks once PIPELINE_MAX_IN_FLIGHT applications are inside the pipeline, so
+page buffers held between steps stay bounded. With every step busy on a
+different application, throughput is set by the slowest step rather than the
+sum of all of them.
+
+Jobs are opened, checkpointed and failed exactly as in
+process_application_group, so an application that fails here resumes the
+same way on retry.
+"""
+
+import time
+import queue
+import asyncio
+import logging
+import threading
+
+from google.cloud import documentai_v1 as documentai
+
+from config import (
+    PIPELINE_PREPARE_WORKERS,
+    PIPELINE_OCR_CONCURRENCY,
+    PIPELINE_PERSIST_WORKERS,
+    PIPELINE_REPORT_WORKERS,
+    PIPELINE_QUEUE_SIZE,
+    PIPELINE_MAX_IN_FLIGHT,
+    OCR_PACK_ENABLED,
+)
+import worker
+from document_ai_client import AsyncDocumentAIClient
+from ocr_packer import OcrPacker
+from ocr_store import archive_async, archive_path
+from metrics import QUEUE_DEPTH, PIPELINE_IN_FLIGHT, on_collect
+
+_STOP = object()
+
+PREPARE_STAGES = ("preprocess", "dedup", "build_pdf")
+PERSIST_STAGES = ("map", "write_json", "db_insert")
+REPORT_STAGES = ("report", "archive")
+
+_running = set()  # started pipelines, read by the metrics collector
+_running_lock = threading.Lock()
+
+
+@on_collect
+def _collect_metrics():
+    """Depth of the queue in front of each step and applications in flight,
+    summed over running pipelines."""
+    depths = dict.fromkeys(("prepare", "ocr", "persist", "report"), 0)
+    in_flight = 0
+    with _running_lock:
+        pipelines = list(_running)
+    for p in pipelines:
+        for step, q in (("prepare", p._inbox), ("ocr", p._to_ocr), ("persist", p._to_persist),
+                        ("report", p._to_report)):
+            depths[step] += q.qsize()
+        in_flight += p._in_flight
+    for step, depth in depths.items():
+        QUEUE_DEPTH.labels(queue=f"pipeline_{step}").set(depth)
+    PIPELINE_IN_FLIGHT.set(in_flight)
+
+
+class Pipeline:
+    """
+    Usage:
+        with Pipeline() as p:
+            for group in groups:
+                p.submit(group, callback)   # callback(group, result_or_None)
+        # leaving the block waits for every submitted application
+    """
+
+    def __init__(self, prepare_workers=PIPELINE_PREPARE_WORKERS, ocr_concurrency=PIPELINE_OCR_CONCURRENCY,
+                 persist_workers=PIPELINE_PERSIST_WORKERS, report_workers=PIPELINE_REPORT_WORKERS,
+                 queue_size=PIPELINE_QUEUE_SIZE, max_in_flight=PIPELINE_MAX_IN_FLIGHT, ocr_client=None,
+                 ocr_pack=OCR_PACK_ENABLED):
+        self.workers = {
+            "prepare": max(1, prepare_workers),
+            "persist": max(1, persist_workers),
+            "report": max(1, report_workers),
+        }
+        self.ocr_concurrency = max(1, ocr_concurrency)
+        self._ocr_client = ocr_client
+        self.ocr_pack = ocr_pack
+        self._inbox = queue.Queue(maxsize=max(1, queue_size))
+        self._to_ocr = queue.Queue(maxsize=max(1, queue_size))
+        self._to_persist = queue.Queue(maxsize=max(1, queue_size))
+        self._to_report = queue.Queue(maxsize=max(1, queue_size))
+        self._admission = threading.BoundedSemaphore(max(1, max_in_flight))
+        self._idle = threading.Condition()
+        self._in_flight = 0
+        self._threads = []
+        self.results = []
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self):
+        if self._threads:
+            return self
+        steps = [
+            ("prepare", self._prepare_worker),
+            ("persist", self._persist_worker),
+            ("report", self._report_worker),
+        ]
+        for step, target in steps:
+            for i in range(self.workers[step]):
+                self._spawn(f"pipeline-{step}-{i}", target)
+        self._spawn("pipeline-ocr", self._ocr_thread)
+        with _running_lock:
+            _running.add(self)
+        return self
+
+    def _spawn(self, name, target):
+        t = threading.Thread(target=target, name=name, daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def submit(self, group_paths, callback=None):
+        """Queue one application; blocks while the pipeline is full."""
+        self._admission.acquire()
+        with self._idle:
+            self._in_flight += 1
+        self._inbox.put((group_paths, callback))
+
+    def join(self):
+        """Wait until every submitted application has finished or failed."""
+        with self._idle:
+            self._idle.wait_for(lambda: self._in_flight == 0)
+
+    def close(self):
+        """join(), then stop the workers. Returns the successful results."""
+        self.join()
+        for q, step in ((self._inbox, "prepare"), (self._to_persist, "persist"), (self._to_report, "report")):
+            for _ in range(self.workers[step]):
+                q.put(_STOP)
+        self._to_ocr.put(_STOP)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        with _running_lock:
+            _running.discard(self)
+        return self.results
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _finish(self, item, result):
+        group_paths, callback, _ = item
+        if result:
+            self.results.append(result)
+        try:
+            if callback:
+                callback(group_paths, result)
+        except Exception:
+            logging.exception("Pipeline callback failed for %s", group_paths)
+        finally:
+            self._admission.release()
+            with self._idle:
+                self._in_flight -= 1
+                self._idle.notify_all()
+
+    def _run_stages(self, item, stages):
+        ctx = item[2]
+        for stage in stages:
+            if not worker.run_stage(ctx, stage):
+                self._finish(item, None)
+                return False
+        return True
+
+    # ------------------------------------------------------------------
+    # Steps
+    # ------------------------------------------------------------------
+    def _prepare_worker(self):
+        while True:
+            entry = self._inbox.get()
+            if entry is _STOP:
+                return
+            group_paths, callback = entry
+            try:
+                ctx = worker.open_job(group_paths)
+            except Exception:
+                logging.exception("Could not open a job for %s", group_paths)
+                self._finish((group_paths, callback, None), None)
+                continue
+            item = (group_paths, callback, ctx)
+            if self._run_stages(item, PREPARE_STAGES):
+                self._to_ocr.put(item)
+
+    def _persist_worker(self):
+        while True:
+            item = self._to_persist.get()
+            if item is _STOP:
+                return
+            if self._run_stages(item, PERSIST_STAGES):
+                self._to_report.put(item)
+
+    def _report_worker(self):
+        while True:
+            item = self._to_report.get()
+            if item is _STOP:
+                return
+            if self._run_stages(item, REPORT_STAGES):
+                try:
+                    result = worker.close_job(item[2])
+                except Exception:
+                    logging.exception("Could not close job %s", item[2].app_id)
+                    result = None
+                self._finish(item, result)
+
+    def _ocr_thread(self):
+        asyncio.run(self._ocr_loop())
+
+    async def _ocr_loop(self):
+        client = self._ocr_client or AsyncDocumentAIClient(max_in_flight=self.ocr_concurrency,
+                                                           cache=False if self.ocr_pack else None)
+        slots = self.ocr_concurrency
+        if self.ocr_pack:
+            # The packer caches per application; every request in flight
+            # may carry up to max_pages one-page applications.
+            client = OcrPacker(client)
+            slots *= client.max_pages
+        slots = asyncio.Semaphore(slots)
+        tasks = set()
+        while True:
+            item = await asyncio.to_thread(self._to_ocr.get)
+            if item is _STOP:
+                break
+            await slots.acquire()
+            task = asyncio.create_task(self._ocr_one(client, item, slots))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def _ocr_one(self, client, item, slots):
+        ctx = item[2]
+        try:
+            if "ocr" not in ctx.done and not worker.skips_stage(ctx, "ocr"):
+                started = time.perf_counter()
+                try:
+                    pdf_bytes = await asyncio.to_thread(lambda: ctx.pdf_bytes)
+                    document = await client.process(pdf_bytes)
+                except Exception as e:
+                    await asyncio.to_thread(worker.fail_stage, ctx, "ocr", e)
+                    await asyncio.to_thread(self._finish, item, None)
+                    return
+                ok = await asyncio.to_thread(worker.run_stage, ctx, "ocr", lambda c: _ocr_done(c, document), started)
+                if not ok:
+                    await asyncio.to_thread(self._finish, item, None)
+                    return
+        finally:
+            slots.release()
+        await asyncio.to_thread(self._to_persist.put, item)
+
+
+def _ocr_done(ctx, document):
+    """Stage body for an OCR result fetched by the pipeline's async client."""
+    archive_async(document, ctx.pdf_path)
+    ctx._ocr_json = documentai.Document.to_dict(document)
+    return {"ocr_archive": archive_path(ctx.pdf_path)}
+
+
+def run_groups(groups, callback=None, **kwargs):
+    """Run groups through a fresh Pipeline; returns the successful results."""
+    with Pipeline(**kwargs) as p:
+        for group in groups:
+            p.submit(group, callback)
+    return p.results
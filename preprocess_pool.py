@@ -0,0 +1,103 @@
+"""
+preprocess_pool.py  –  Page-level process pool for image preprocessing
+---------------------------------------------------------------------
+Bilateral filtering and Otsu thresholding are CPU bound, so pages are spread
+across a process pool instead of threads. Each page is copied once into a
+shared-memory block; the child preprocesses it in place and only the block
+name and shape cross the process boundary, never the pixel data.
+
+Pages are submitted as soon as they are rendered and collected in submission
+order, so each application gets its pages back in page order.
+"""
+
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from config import PREPROCESS_WORKERS
+from utils import preprocess_page
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_child():
+    # One OpenCV thread per process; the pool already uses every core.
+    import cv2
+    cv2.setNumThreads(1)
+
+
+def make_pool(workers):
+    """Create a preprocessing process pool with `workers` processes."""
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_child)
+
+
+def get_pool():
+    """Shared pool sized by PREPROCESS_WORKERS, created on first use.
+    Returns None when preprocessing should run inline."""
+    global _pool
+    if PREPROCESS_WORKERS <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = make_pool(PREPROCESS_WORKERS)
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+def _preprocess_shared(shm_name, shape, profile=None):
+    """Child side: attach to the page block and preprocess it in place."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        page = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        page[...] = preprocess_page(page, profile)
+        del page
+    finally:
+        shm.close()
+
+
+def preprocess_pages(pages, pool=None, profile=None):
+    """
+    Preprocess an iterable of grayscale page arrays (e.g. utils.iter_pdf_pages)
+    and return the processed pages as a list, in input order.
+    Uses the shared pool unless another one is passed in; with no pool the
+    pages are processed inline. profile names a PREPROCESS_PROFILES entry.
+    """
+    pool = pool or get_pool()
+    if pool is None:
+        return [preprocess_page(p, profile) for p in pages]
+
+    blocks = []
+    try:
+        for page in pages:
+            shm = shared_memory.SharedMemory(create=True, size=max(page.size, 1))
+            blocks.append((shm, page.shape, None))
+            np.ndarray(page.shape, dtype=np.uint8, buffer=shm.buf)[...] = page
+            fut = pool.submit(_preprocess_shared, shm.name, page.shape, profile)
+            blocks[-1] = (shm, page.shape, fut)
+
+        processed = []
+        for shm, shape, fut in blocks:
+            fut.result()
+            processed.append(np.ndarray(shape, dtype=np.uint8, buffer=shm.buf).copy())
+        return processed
+    finally:
+        for shm, _, fut in blocks:
+            if fut is not None and not fut.done():
+                fut.cancel()
+                # A running task still has the block attached; let it finish.
+                try:
+                    fut.result()
+                except Exception:
+                    pass
+            shm.close()
+            shm.unlink()
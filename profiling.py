@@ -0,0 +1,207 @@
+"""
+profiling.py  –  Opt-in per-job profiling and memory tracing
+------------------------------------------------------------
+A job picked for profiling runs each of its stages under cProfile and
+tracemalloc. Jobs are picked when they are opened: every app_id in
+PROFILE_APP_IDS, plus a random PROFILE_SAMPLE_RATE share of the rest. Both
+can be changed at runtime with configure() (POST /profiling); the change
+lasts until the process restarts. With neither set, select() returns None
+and a stage pays for one ``is None`` check.
+
+Artifacts go to PROFILE_DIR/app_<id>/, one set per stage:
+
+  <stage>.prof    cProfile stats (pstats, snakeviz, ...)
+  <stage>.txt     the functions with the most cumulative time
+  memory.json     per stage: seconds, traced bytes at the start, peak growth
+                  over that and growth at the end, and the largest live
+                  allocations at the end by source line
+
+Caveats: tracemalloc counts every thread, so while the pipeline runs other
+applications' stages at the same time their allocations show up in a
+stage's peak; memory.json says so with "scope": "process". Stages running
+at once each keep their own peak: one starting does not lose the peak
+another has reached so far. Pages are preprocessed in the PREPROCESS_WORKERS processes,
+which the profile only shows as waiting on the pool (set PREPROCESS_WORKERS
+= 1 to profile preprocessing inline). In the pipeline the Document AI call
+itself runs on the OCR event loop, outside the "ocr" stage's profile.
+"""
+
+import io
+import os
+import json
+import time
+import random
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+
+from config import PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_APP_IDS, PROFILE_TOP_ALLOCATIONS
+
+_lock = threading.Lock()
+_sample_rate = PROFILE_SAMPLE_RATE
+_app_ids = {int(a) for a in PROFILE_APP_IDS}
+_peaks = {}              # profiled stage running -> its peak before the last reset_peak()
+_started_tracing = False  # tracemalloc was started here (not with PYTHONTRACEMALLOC)
+
+_MEDIA_TYPES = {".prof": "application/octet-stream", ".txt": "text/plain", ".json": "application/json"}
+
+
+def settings():
+    return {"sample_rate": _sample_rate, "app_ids": sorted(_app_ids)}
+
+
+def configure(sample_rate=None, app_ids=None):
+    """Change which jobs are profiled; None leaves a setting as it is."""
+    global _sample_rate, _app_ids
+    with _lock:
+        if sample_rate is not None:
+            _sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        if app_ids is not None:
+            _app_ids = {int(a) for a in app_ids}
+    return settings()
+
+
+def select(app_id):
+    """A JobProfile if the job is to be profiled, else None."""
+    if not _sample_rate and not _app_ids:
+        return None
+    if app_id in _app_ids or random.random() < _sample_rate:
+        logging.info("Profiling application %s", app_id)
+        return JobProfile(app_id)
+    return None
+
+
+def profile_dir(app_id):
+    return os.path.join(PROFILE_DIR, f"app_{app_id}")
+
+
+def list_artifacts(app_id):
+    """File names of a job's profile artifacts, or None if it was never profiled."""
+    directory = profile_dir(app_id)
+    if not os.path.isdir(directory):
+        return None
+    return sorted(name for name in os.listdir(directory) if not name.endswith(".tmp"))
+
+
+def artifact(app_id, name):
+    """(path, media type) of one artifact, or None."""
+    name = os.path.basename(name)
+    path = os.path.join(profile_dir(app_id), name)
+    if not os.path.isfile(path) or name.endswith(".tmp"):
+        return None
+    return path, _MEDIA_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+
+
+def memory_summary(app_id):
+    """memory.json of a profiled job, or None."""
+    try:
+        with open(os.path.join(profile_dir(app_id), "memory.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _start_tracing():
+    """Start tracing a stage (tracemalloc runs while any stage is traced); returns (token, traced bytes)."""
+    global _started_tracing
+    with _lock:
+        if not _peaks and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        # The peak is process-wide: keep what the stages already running
+        # have reached before resetting it for this one.
+        peak = tracemalloc.get_traced_memory()[1]
+        for running in _peaks:
+            _peaks[running] = max(_peaks[running], peak)
+        tracemalloc.reset_peak()
+        token = object()
+        _peaks[token] = 0
+        return token, tracemalloc.get_traced_memory()[0]
+
+
+def _stop_tracing(token):
+    """Traced (current, peak) bytes and a snapshot, then stop tracing if this was the last stage."""
+    global _started_tracing
+    snapshot = tracemalloc.take_snapshot()
+    with _lock:
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, _peaks.pop(token))
+        if not _peaks and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+    return current, peak, snapshot
+
+
+def _top_allocations(snapshot, limit):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ])
+    return [
+        {"site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+         "size_bytes": stat.size, "count": stat.count}
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+
+def _atomic_write(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+class JobProfile:
+    """Profiles the stages of one job; see the module docstring."""
+
+    def __init__(self, app_id, top=PROFILE_TOP_ALLOCATIONS):
+        self.app_id = app_id
+        self.dir = profile_dir(app_id)
+        self.top = top
+        self._lock = threading.Lock()
+        os.makedirs(self.dir, exist_ok=True)
+
+    def run(self, stage, fn, *args):
+        """fn(*args) under cProfile and tracemalloc; writes the stage's artifacts."""
+        profiler = cProfile.Profile()
+        token, start_bytes = _start_tracing()
+        started = time.perf_counter()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler is active (one per process from Python 3.12)
+            logging.warning("cProfile unavailable for app %s stage %s; tracing memory only", self.app_id, stage)
+            profiler = None
+        try:
+            return fn(*args)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            seconds = time.perf_counter() - started
+            current, peak, snapshot = _stop_tracing(token)
+            try:
+                self._write(stage, profiler, seconds, start_bytes, current, peak, snapshot)
+            except Exception:
+                logging.exception("Could not write the profile of app %s stage %s", self.app_id, stage)
+
+    def _write(self, stage, profiler, seconds, start_bytes, current, peak, snapshot):
+        if profiler is not None:
+            profiler.dump_stats(os.path.join(self.dir, f"{stage}.prof"))
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+            _atomic_write(os.path.join(self.dir, f"{stage}.txt"), out.getvalue())
+        entry = {
+            "seconds": round(seconds, 6),
+            "start_bytes": start_bytes,
+            "peak_bytes": max(peak - start_bytes, 0),
+            "end_bytes": current - start_bytes,
+            "top_allocations": _top_allocations(snapshot, self.top),
+        }
+        with self._lock:
+            path = os.path.join(self.dir, "memory.json")
+            summary = memory_summary(self.app_id) or {"app_id": self.app_id, "stages": {}}
+            summary["scope"] = "process"  # traced bytes count every thread, not only this job's
+            summary["stages"][stage] = entry
+            _atomic_write(path, json.dumps(summary, indent=2))
@@ -0,0 +1,291 @@
+"""
+report_cache.py  –  PDF reports rendered on request
+--------------------------------------------------
+Unless REPORT_EAGER is set, the worker does not render reports. It keeps
+each application's merged PDF (the preprocessed pages sent to OCR) as
+REPORT_SOURCE_DIR/app_<id>.pdf, hard-linked from the build_pdf checkpoint;
+the filled JSON is already in DRAFTS_DIR. The first request for a report
+renders it from those two into REPORT_CACHE_DIR, and later requests are
+served from there until the result's version changes (status update,
+reprocessing).
+
+The cache is capped at REPORT_CACHE_MAX_BYTES and evicts least recently
+served reports; an evicted report is rendered again from its source PDF when
+it is next asked for. Concurrent requests for the same report render it once.
+
+The merged PDFs are capped too, at REPORT_SOURCE_MAX_BYTES: the least
+recently used are pruned as new ones are kept. A report whose merged PDF was
+pruned is rendered from the job's archived source PDFs, preprocessed again.
+A merged PDF is also dropped when the worker renders that application's
+report itself (REPORT_EAGER), as it no longer matches the report.
+"""
+
+import os
+import json
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+
+from config import (
+    DRAFTS_DIR,
+    REPORTS_DIR,
+    REPORT_SOURCE_DIR,
+    REPORT_CACHE_DIR,
+    REPORT_CACHE_MAX_BYTES,
+    REPORT_SOURCE_MAX_BYTES,
+    PDF_RESOLUTION,
+    PREPROCESS_PROFILE,
+    PREPROCESS_PROFILES,
+    SKIP_BLANK_PAGES,
+)
+from local_db_manager import get_result, get_job
+
+
+def source_path(app_id):
+    return os.path.join(REPORT_SOURCE_DIR, f"app_{app_id}.pdf")
+
+
+def keep_report_source(app_id, pdf_path):
+    """Keep app_id's merged PDF for rendering its report later; returns the kept path."""
+    os.makedirs(REPORT_SOURCE_DIR, exist_ok=True)
+    dest = source_path(app_id)
+    tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.link(pdf_path, tmp)
+    except OSError:  # other filesystem, or no hard links
+        shutil.copyfile(pdf_path, tmp)
+    os.replace(tmp, dest)
+    prune_report_sources(keep=dest)
+    return dest
+
+
+def drop_report_source(app_id):
+    """Forget app_id's merged PDF (its report was rendered from other pages)."""
+    try:
+        os.remove(source_path(app_id))
+    except FileNotFoundError:
+        pass
+
+
+def prune_report_sources(max_bytes=REPORT_SOURCE_MAX_BYTES, keep=None):
+    """Remove the least recently used merged PDFs above max_bytes, never keep; returns how many."""
+    try:
+        entries = [e for e in os.scandir(REPORT_SOURCE_DIR) if e.name.endswith(".pdf")]
+    except FileNotFoundError:
+        return 0
+    found = []
+    for entry in entries:
+        try:
+            st = entry.stat()
+        except FileNotFoundError:  # pruned by another process
+            continue
+        found.append((st.st_mtime, entry.path, st.st_size))
+    total, pruned = sum(size for _, _, size in found), 0
+    for _, path, size in sorted(found):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            pruned += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+    if pruned:
+        logging.info("Pruned %d report source PDFs over %d MB", pruned, max_bytes // 1024 ** 2)
+    return pruned
+
+
+class ReportCache:
+    """Size-capped LRU cache of rendered reports on local disk. Thread-safe."""
+
+    def __init__(self, cache_dir=REPORT_CACHE_DIR, max_bytes=REPORT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.renders = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._app_locks = {}
+        self._entries = OrderedDict()  # file name -> size, least recently used first
+        self._total = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def _name(app_id, version):
+        return f"application_{app_id}_report.v{version}.pdf"
+
+    def _load_index(self):
+        found = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pdf"):
+                st = entry.stat()
+                found.append((st.st_mtime, entry.name, st.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._total += size
+
+    def _app_lock(self, app_id):
+        with self._lock:
+            return self._app_locks.setdefault(app_id, threading.Lock())
+
+    def _hit(self, name, path):
+        with self._lock:
+            self.hits += 1
+            if name not in self._entries:  # written by another process
+                self._entries[name] = os.path.getsize(path)
+                self._total += self._entries[name]
+            self._entries.move_to_end(name)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def get(self, app_id, version, render):
+        """
+        Path of the report for (app_id, version), calling render(output_path)
+        to produce it on a miss.
+        """
+        name = self._name(app_id, version)
+        path = os.path.join(self.cache_dir, name)
+        if os.path.exists(path):
+            return self._hit(name, path)
+        with self._app_lock(app_id):
+            if os.path.exists(path):  # rendered while we waited
+                return self._hit(name, path)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                render(tmp)
+                os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            size = os.path.getsize(path)
+            stale = f"application_{app_id}_report.v"
+            with self._lock:
+                self.renders += 1
+                for old in [n for n in self._entries if n.startswith(stale)]:
+                    self._drop(old)
+                self._entries[name] = size
+                self._total += size
+                self._evict()
+        return path
+
+    def _drop(self, name):
+        self._total -= self._entries.pop(name)
+        try:
+            os.remove(os.path.join(self.cache_dir, name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.renders
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "renders": self.renders,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Shared process-wide report cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ReportCache()
+        return _cache
+
+
+def _report_page(page):
+    """
+    A page of the merged PDF, back at the pixel size the worker had it.
+    Binarized pages come back two-tone (CCITT G4); in merged PDFs written
+    before pages were stored as 1-bit they picked up JPEG ringing, so
+    threshold those back to two tones for 1-bit encoding. Pages that
+    preprocessing kept grayscale stay as they are.
+    """
+    import cv2
+    from utils import is_two_tone, thresholding_loses_content
+
+    if is_two_tone(page) or thresholding_loses_content(page):
+        return page
+    return cv2.threshold(page, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+
+
+def _archived_pages(paths):
+    """
+    The pages of the archived source PDFs as the worker's preprocess stage
+    made them (current PREPROCESS_PROFILE, blank pages skipped).
+    """
+    from utils import iter_pdf_pages, is_blank_page
+    from preprocess_pool import preprocess_pages
+
+    dpi = PREPROCESS_PROFILES[PREPROCESS_PROFILE]["dpi"]
+    pages = []
+    for path in paths:
+        kept = (p for p in iter_pdf_pages(path, dpi=dpi) if not (SKIP_BLANK_PAGES and is_blank_page(p)))
+        pages.extend(preprocess_pages(kept))
+    return pages
+
+
+def report_path(app_id):
+    """
+    (path, version) of app_id's report, rendering it if needed, or None if
+    there is no result or nothing to render it from. Reports rendered in the
+    worker (REPORT_EAGER, or before reports were deferred) are served as is.
+    """
+    entry = get_result(app_id)
+    if entry is None:
+        return None
+    source = source_path(app_id)
+    archived = None
+    if not os.path.exists(source):
+        path = os.path.join(REPORTS_DIR, entry["report_file"] or f"application_{app_id}_report.pdf")
+        if os.path.exists(path):
+            return path, entry["version"]
+        job = get_job(app_id)
+        archived = job and job["source_paths"]
+        if not archived or not all(os.path.exists(p) for p in archived):
+            return None
+    json_path = os.path.join(DRAFTS_DIR, entry["json_file"] or "")
+    if not entry["json_file"] or not os.path.exists(json_path):
+        return None
+
+    def render(output_path):
+        # The image and PDF stack loads with the first report rendered, not
+        # with the API.
+        from pdf_report import generate_pdf_report
+        from utils import iter_pdf_pages
+
+        with open(json_path, "r", encoding="utf-8") as f:
+            filled_json = json.load(f)
+        if archived:
+            pages = _archived_pages(archived)
+        else:
+            try:
+                os.utime(source)  # recently used: pruned last
+            except OSError:
+                pass
+            pages = (_report_page(page) for page in iter_pdf_pages(source, scale=PDF_RESOLUTION / 72.0))
+        generate_pdf_report(app_id, filled_json, pages, output_path=output_path)
+        logging.info("Rendered report for app %s%s", app_id, " from its archived source PDFs" if archived else "")
+
+    return get_cache().get(app_id, entry["version"], render), entry["version"]
@@ -0,0 +1,118 @@
+"""
+table_extractor.py  –  FamilyMembers table parser
+------------------------------------------------
+Reads the template's family_table zone (page 2, eight column x-ranges)
+from the Document AI tokens. All token boxes on the page are held in NumPy
+arrays: columns are assigned with one searchsorted over the column edges,
+rows are found by splitting the y-sorted token centres wherever the gap
+exceeds ROW_GAP_FACTOR median token heights, and cell text and confidence
+are gathered per (row, column) with grouped array operations instead of
+per-token Python loops.
+"""
+
+import re
+
+import numpy as np
+
+from zone_extractor import load_template, index_pages
+
+ROW_GAP_FACTOR = 1.5  # a vertical gap above this many token heights starts a new row
+
+HEADER_WORDS = {"name", "member", "relation", "gender", "sex", "age", "qualification",
+                "aadhaar", "aadhar", "voter", "id", "occupation", "(<18)", "(18+)"}
+
+INT_COLUMNS = {"age"}
+
+
+def _table_zone(template):
+    for zone in template["zones"].values():
+        if "columns" in zone:
+            return zone
+    return None
+
+
+def _is_header(cells):
+    words = [w.lower() for text in cells if text for w in text.split()]
+    return bool(words) and sum(w in HEADER_WORDS for w in words) >= len(words) / 2
+
+
+def _typed(key, text):
+    if key in INT_COLUMNS:
+        digits = re.sub(r"\D", "", text)
+        return int(digits) if digits else 0
+    return text
+
+
+def extract_family_table(ocr_json, page_numbers=None, template=None, pages=None):
+    """
+    Parse the family table into FamilyMembers records:
+    [{column_key: {"value", "confidence"}}, ...] in table order. Empty rows
+    and a header row above the first member are dropped. `pages` can pass a prebuilt
+    zone_extractor.index_pages() result.
+    """
+    template = template or load_template()
+    zone = _table_zone(template)
+    if zone is None:
+        return []
+    pages = pages if pages is not None else index_pages(ocr_json, template)
+    numbers = page_numbers or list(range(1, len(pages) + 1))
+    if zone["page"] not in numbers or numbers.index(zone["page"]) >= len(pages):
+        return []
+    page = pages[numbers.index(zone["page"])]
+    if not len(page):
+        return []
+
+    # Tokens inside the table box
+    x, y, w, h = zone["bbox"]
+    columns = sorted(zone["columns"], key=lambda c: c["x"])
+    starts = np.array([c["x"] for c in columns], dtype=np.float64)
+    ends = starts + np.array([c["w"] for c in columns], dtype=np.float64)
+    right = max(x + w, float(ends.max()))
+    inside = (page.cx >= x) & (page.cx < right) & (page.cy >= y) & (page.cy < y + h)
+
+    # Column assignment: one searchsorted over the column start edges
+    col = np.searchsorted(starts, page.cx, side="right") - 1
+    in_col = (col >= 0) & (page.cx < ends[np.clip(col, 0, len(columns) - 1)])
+    sel = np.flatnonzero(inside & in_col)
+    if not len(sel):
+        return []
+    col = col[sel]
+    cx, cy = page.cx[sel], page.cy[sel]
+    conf = page.confidence[sel]
+
+    # Row clustering on y: split where the gap between consecutive centres is large
+    line_h = max(float(np.median(page.heights[sel])), 1.0)
+    by_y = np.argsort(cy, kind="stable")
+    row_sorted = np.concatenate(([0], np.cumsum(np.diff(cy[by_y]) > ROW_GAP_FACTOR * line_h)))
+    row = np.empty_like(row_sorted)
+    row[by_y] = row_sorted
+    n_rows, n_cols = int(row.max()) + 1, len(columns)
+
+    # Cells: sort tokens by (cell, text line, x) and cut at cell boundaries
+    cell = row * n_cols + col
+    line = np.round(cy / line_h).astype(np.int64)
+    order = np.lexsort((cx, line, cell))
+    cell_sorted = cell[order]
+    cuts = (np.flatnonzero(np.diff(cell_sorted)) + 1).tolist()
+    starts_, ends_ = [0] + cuts, cuts + [len(order)]
+    cell_ids = cell_sorted[starts_].tolist()
+    texts = [page.texts[i] for i in sel[order].tolist()]
+
+    conf_sum = np.bincount(cell, weights=conf, minlength=n_rows * n_cols)
+    counts = np.bincount(cell, minlength=n_rows * n_cols)
+    cell_conf = np.divide(conf_sum, counts, out=np.zeros_like(conf_sum), where=counts > 0).tolist()
+
+    grid = [[""] * n_cols for _ in range(n_rows)]
+    for cid, a, b in zip(cell_ids, starts_, ends_):
+        grid[cid // n_cols][cid % n_cols] = " ".join(t for t in texts[a:b] if t)
+
+    keys = [c["key"] for c in columns]
+    members = []
+    for r, cells in enumerate(grid):
+        if not any(cells) or (not members and _is_header(cells)):
+            continue
+        members.append({
+            key: {"value": _typed(key, cells[k]), "confidence": cell_conf[r * n_cols + k]}
+            for k, key in enumerate(keys)
+        })
+    return members
@@ -0,0 +1,58 @@
+"""
+test_async_client.py
+----------------------------------
+AsyncDocumentAIClient (document_ai_client.py) against the local Document AI
+stand-in: quota, deadline and circuit breaker accounting.
+
+Usage:
+    python -m pytest test_async_client.py
+"""
+
+import asyncio
+
+from google.api_core import exceptions as api_exceptions
+
+from document_ai_client import AsyncDocumentAIClient, CircuitBreaker
+from fake_docai import FakeDocumentProcessorServiceAsyncClient
+
+
+def test_local_throttling_does_not_open_the_circuit():
+    fake = FakeDocumentProcessorServiceAsyncClient(latency=0, page_latency=0, error_rate=0)
+    breaker = CircuitBreaker(threshold=2, reset_timeout=60)
+    # One request per second: all but the first run out of time waiting for quota.
+    client = AsyncDocumentAIClient(client=fake, cache=False, rate_limit=1, burst=1, timeout=0.3, breaker=breaker)
+
+    async def run():
+        return await asyncio.gather(*(client.process(b"%PDF-" + bytes([i])) for i in range(5)),
+                                    return_exceptions=True)
+
+    outcomes = asyncio.run(run())
+    assert not isinstance(outcomes[0], Exception)
+    assert all(isinstance(o, api_exceptions.DeadlineExceeded) for o in outcomes[1:])
+    assert fake.calls == 1
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_service_errors_open_the_circuit():
+    fake = FakeDocumentProcessorServiceAsyncClient(latency=0, page_latency=0, error_rate=1)
+    breaker = CircuitBreaker(threshold=2, reset_timeout=60)
+    client = AsyncDocumentAIClient(client=fake, cache=False, rate_limit=0, max_retries=0, breaker=breaker)
+
+    async def run():
+        return [await asyncio.gather(client.process(b"%PDF-" + bytes([i])), return_exceptions=True)
+                for i in range(3)]
+
+    outcomes = [o for [o] in asyncio.run(run())]
+    assert [type(o).__name__ for o in outcomes] == ["ServiceUnavailable", "ServiceUnavailable", "CircuitOpenError"]
+    assert fake.calls == 2
+
+
+def test_a_slow_service_raises_deadline_exceeded():
+    fake = FakeDocumentProcessorServiceAsyncClient(latency=5, page_latency=0, error_rate=0)
+    breaker = CircuitBreaker(threshold=5, reset_timeout=60)
+    client = AsyncDocumentAIClient(client=fake, cache=False, rate_limit=0, max_retries=0, timeout=0.2,
+                                   breaker=breaker)
+
+    [outcome] = asyncio.run(client.process_many([b"%PDF-slow"]))
+    assert isinstance(outcome, api_exceptions.DeadlineExceeded)
+    assert breaker.failures == 1
@@ -0,0 +1,37 @@
+"""
+test_dedup.py
+----------------------------------
+Near-duplicate index (dedup.DedupIndex) over stored page-hash rows.
+
+Usage:
+    python -m pytest test_dedup.py
+"""
+
+import random
+
+from dedup import DedupIndex, HASH_BYTES
+
+
+def _hash(seed):
+    return random.Random(seed).getrandbits(HASH_BYTES * 8).to_bytes(HASH_BYTES, "big")
+
+
+def test_rehashed_application_replaces_its_pages():
+    stored = []  # (row_id, app_id, page_no, hash), as page_hashes_since returns them
+    row_ids = iter(range(1, 1000))  # AUTOINCREMENT: ids are never reused
+
+    def save(app_id, hashes):
+        # save_page_hashes: delete the app's rows, insert the new ones
+        stored[:] = [r for r in stored if r[1] != app_id]
+        stored.extend((next(row_ids), app_id, n, h) for n, h in enumerate(hashes, start=1))
+
+    index = DedupIndex(rows=lambda row_id: [r for r in stored if r[0] > row_id])
+    first, second = [_hash(1), _hash(2), _hash(3)], [_hash(4), _hash(5)]
+    save(1001, first)
+    assert [m["app_id"] for m in index.find(first)] == [1001]
+
+    # The job is retried and keeps two different pages (another process stored them).
+    save(1001, second)
+    assert index.find(first) == []
+    assert [m["app_id"] for m in index.find(second)] == [1001]
+    assert index.find(first[:2]) == []
@@ -4,39 +4,78 @@ test_docai.py
 Quick sanity test for Google Document AI connection.
 Processes one local PDF and prints detected text length.
 No GCS, fully local call.
+
+Processor, credentials and backend come from config.py. With
+DOC_AI_BACKEND=fake the call goes to the local stand-in, so this also runs
+offline; without a sample PDF a blank 4-page form is generated. Under
+pytest the same request goes to the local stand-in only.
+
+Usage:
+    python test_docai.py [path/to/sample_form.pdf]
+    python -m pytest test_docai.py
 """
 
-from google.cloud import documentai_v1 as documentai
 import os
+import sys
+
+import fitz  # PyMuPDF
+from google.cloud import documentai_v1 as documentai
+
+from config import INCOMING_DIR, OCR_RAW_DIR, DOC_AI_BACKEND
+from document_ai_client import PROCESSOR_NAME, make_client
+from fake_docai import FakeDocumentProcessorServiceClient
+
+
+def blank_pdf(pages=4):
+    with fitz.open() as blank:
+        for _ in range(pages):
+            blank.new_page()
+        return blank.tobytes()
+
+
+def process(client, content):
+    document = {"content": content, "mime_type": "application/pdf"}
+    return client.process_document(request={"name": PROCESSOR_NAME, "raw_document": document}).document
+
+
+def test_blank_form_through_the_local_stand_in():
+    client = FakeDocumentProcessorServiceClient(latency=0, page_latency=0, error_rate=0)
+    doc = process(client, blank_pdf(4))
+    assert len(doc.pages) == 4
+    assert doc.text
+    assert documentai.Document.from_json(documentai.Document.to_json(doc)).text == doc.text
+
+
+def main():
+    # === CONFIG ===
+    sample_file = sys.argv[1] if len(sys.argv) > 1 else os.path.join(INCOMING_DIR, "sample_form.pdf")
+
+    # === CLIENT ===
+    client = make_client()
+
+    # === PROCESS DOCUMENT ===
+    if os.path.exists(sample_file):
+        with open(sample_file, "rb") as f:
+            content = f.read()
+    else:
+        print(f"[TEST] {sample_file} not found; using a blank 4-page PDF")
+        content = blank_pdf(4)
+
+    print(f"[TEST] Sending {os.path.basename(sample_file)} to Document AI ({DOC_AI_BACKEND})...")
+    doc = process(client, content)
+
+    # === OUTPUT SUMMARY ===
+    print(f"[SUCCESS] Processed '{os.path.basename(sample_file)}'")
+    print(f"[INFO] Document text length: {len(doc.text)} characters")
+    print(f"[INFO] Pages: {len(doc.pages)}, form fields: {sum(len(p.form_fields) for p in doc.pages)}")
+
+    # Optional: save raw OCR output
+    os.makedirs(OCR_RAW_DIR, exist_ok=True)
+    out_path = os.path.join(OCR_RAW_DIR, "sample_form_ocr_output.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(documentai.Document.to_json(doc))
+    print(f"[INFO] OCR JSON saved to {out_path}")
+
 
-# === CONFIG ===
-PROJECT_ID = "ai-form-416805"
-LOCATION = "us"
-PROCESSOR_ID = "8c59dbf065df1fa2"
-SERVICE_ACCOUNT_FILE = r"C:\Users\HI\Desktop\intelligent-form-processor-local\backend\anjuman_backend\ai-form-416805-bdea6b1fbf2e.json"
-SAMPLE_FILE = r"C:\Users\HI\Desktop\intelligent-form-processor-local\backend\anjuman_backend\incoming\sample_form.pdf"
-
-# === SETUP ===
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = SERVICE_ACCOUNT_FILE
-
-# === CLIENT ===
-client = documentai.DocumentProcessorServiceClient()
-name = f"projects/{PROJECT_ID}/locations/{LOCATION}/processors/{PROCESSOR_ID}"
-
-# === PROCESS DOCUMENT ===
-with open(SAMPLE_FILE, "rb") as f:
-    document = {"content": f.read(), "mime_type": "application/pdf"}
-
-print(f"[TEST] Sending {os.path.basename(SAMPLE_FILE)} to Document AI...")
-result = client.process_document(request={"name": name, "raw_document": document})
-doc = result.document
-
-# === OUTPUT SUMMARY ===
-print(f"[SUCCESS] Processed '{os.path.basename(SAMPLE_FILE)}'")
-print(f"[INFO] Document text length: {len(doc.text)} characters")
-
-# Optional: save raw OCR output
-out_path = os.path.join(os.path.dirname(SAMPLE_FILE), "sample_form_ocr_output.json")
-with open(out_path, "w", encoding="utf-8") as f:
-    f.write(documentai.Document.to_json(doc))
-print(f"[INFO] OCR JSON saved to {out_path}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+test_grouping.py
+----------------------------------
+Footer grouping (grouping.py) across a crash: a PDF split into part PDFs
+stays claimed until all its pages are in an application, and a restart must
+not pick up both it and the parts already written from it. Runs in a fresh
+interpreter with its own data directory, since config.py reads
+ANJUMAN_DATA_DIR when it is imported.
+
+Usage:
+    python -m pytest test_grouping.py
+"""
+
+import os
+import sys
+import json
+import subprocess
+import textwrap
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _run(script, data_dir):
+    env = dict(os.environ, ANJUMAN_DATA_DIR=str(data_dir), DOC_AI_BACKEND="fake", PYTHONPATH=HERE)
+    proc = subprocess.run([sys.executable, "-c", textwrap.dedent(script)], env=env, cwd=HERE,
+                          capture_output=True, text=True, timeout=300)
+    assert proc.returncode == 0, proc.stderr[-3000:]
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def test_parts_of_a_claimed_source_are_not_requeued(tmp_path):
+    out = _run("""
+        import os, json
+        import config
+        from benchmark import _footer_forms, _write_footer_scenario
+        from grouping import FooterGrouper, part_source
+        import worker
+
+        first, second = _footer_forms(2, text_layer=True)
+        # The stack's second form is still short of its last page, so the
+        # stack stays claimed after its first form is split off.
+        [stack] = _write_footer_scenario(config.CLAIM_DIR, [first, second[:-1]], "stacked")
+        [[part]] = FooterGrouper(cache=False).feed([stack])
+        before = sorted(os.listdir(config.CLAIM_DIR))
+        print(json.dumps({
+            "source": part_source(part) == stack,
+            "before": before,
+            "requeued": [os.path.basename(p) for p in worker.list_claimed_files()],
+            "after": sorted(os.listdir(config.CLAIM_DIR)),
+        }))
+    """, tmp_path)
+    assert out["source"]
+    assert len(out["before"]) == 2
+    assert out["requeued"] == out["after"] == ["stack.pdf"]
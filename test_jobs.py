@@ -0,0 +1,140 @@
+"""
+test_jobs.py
+----------------------------------
+Job claiming (local_db_manager.start_job): which unfinished job a new
+submission of the same source resumes. Each test runs in a fresh interpreter
+with its own data directory and the local Document AI stand-in, since
+config.py reads ANJUMAN_DATA_DIR when it is imported.
+
+Usage:
+    python -m pytest test_jobs.py
+"""
+
+import os
+import sys
+import json
+import subprocess
+import textwrap
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _run(script, data_dir):
+    env = dict(os.environ, ANJUMAN_DATA_DIR=str(data_dir), DOC_AI_BACKEND="fake", FAKE_DOC_AI_LATENCY="0",
+               FAKE_DOC_AI_PAGE_LATENCY="0", FAKE_DOC_AI_ERROR_RATE="0", PYTHONPATH=HERE)
+    proc = subprocess.run([sys.executable, "-c", textwrap.dedent(script)], env=env, cwd=HERE,
+                          capture_output=True, text=True, timeout=300)
+    assert proc.returncode == 0, proc.stderr[-3000:]
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def test_same_bytes_twice_in_one_batch(tmp_path):
+    out = _run("""
+        import os, json, shutil
+        import config
+        from benchmark import write_synthetic_forms
+        import worker
+        from local_db_manager import list_jobs
+
+        [path] = write_synthetic_forms(config.INCOMING_DIR, 1, 2)
+        shutil.copy(path, os.path.join(config.INCOMING_DIR, "zz_copy.pdf"))
+        results = worker.run_once(parallel_workers=1)
+        print(json.dumps({
+            "results": len(results),
+            "jobs": [(j["app_id"], j["status"], j["attempts"]) for j in list_jobs()],
+            "failed": os.listdir(config.FAILED_DIR),
+        }))
+    """, tmp_path)
+    assert out["failed"] == []
+    assert out["results"] == 2
+    assert len({app_id for app_id, _, _ in out["jobs"]}) == 2
+    assert [(status, attempts) for _, status, attempts in out["jobs"]] == [("done", 1), ("done", 1)]
+
+
+def test_only_failed_or_orphaned_jobs_are_resumed(tmp_path):
+    out = _run("""
+        import json, subprocess, sys
+        import local_db_manager as db
+
+        first, resumed = db.start_job("k", ["a.pdf"])
+        second, _ = db.start_job("k", ["b.pdf"])       # first is still running here
+        db.finish_job(second["app_id"], db.JOB_FAILED, "boom")
+        retried, retried_resumed = db.start_job("k", ["b.pdf"])
+
+        dead = subprocess.Popen([sys.executable, "-c", "pass"])
+        dead.wait()
+        conn = db._conn()
+        conn.execute("UPDATE jobs SET owner = ? WHERE app_id = ?",
+                     (f"{db.socket.gethostname()}:{dead.pid}", first["app_id"]))
+        orphan, orphan_resumed = db.start_job("k", ["a.pdf"])
+        print(json.dumps({
+            "first": first["app_id"], "resumed": resumed, "second": second["app_id"],
+            "retried": [retried["app_id"], retried_resumed, retried["attempts"]],
+            "orphan": [orphan["app_id"], orphan_resumed, orphan["attempts"]],
+        }))
+    """, tmp_path)
+    assert out["resumed"] is False
+    assert out["second"] != out["first"]
+    assert out["retried"] == [out["second"], True, 2]
+    assert out["orphan"] == [out["first"], True, 2]
+
+
+def test_page_numbers_survive_a_failed_file(tmp_path):
+    out = _run("""
+        import json
+        import config
+        from benchmark import write_synthetic_forms
+        import worker
+
+        paths = write_synthetic_forms(config.INCOMING_DIR, 3, 2)
+        real, calls = worker.preprocess_pages, []
+
+        def flaky(pages, profile=None):
+            calls.append(1)
+            if len(calls) == 2:  # the second file fails after its first page
+                next(iter(pages))
+                raise RuntimeError("boom")
+            return real(pages, profile=profile)
+
+        worker.preprocess_pages = flaky
+        pages, numbers = worker.preprocess_group(paths, config.WORK_DIR)
+        print(json.dumps({"pages": len(pages), "numbers": numbers}))
+    """, tmp_path)
+    assert out == {"pages": 4, "numbers": [1, 2, 5, 6]}
+
+
+def test_map_without_the_ocr_archive_resumes_from_ocr(tmp_path):
+    out = _run("""
+        import os, json
+        import config
+        from benchmark import write_synthetic_forms
+        import worker
+        import local_db_manager as db
+
+        [path] = write_synthetic_forms(config.INCOMING_DIR, 1, 2)
+        group = [worker.claim_file(path)]
+        ctx = worker.open_job(group)
+        for stage in ("preprocess", "dedup", "build_pdf", "ocr"):
+            assert worker.run_stage(ctx, stage)
+        worker.flush_ocr_archives()
+        os.remove(ctx.artifacts["ocr_archive"])
+
+        resumed = worker.JobContext(db.get_job(ctx.app_id), group)
+        resumed.done = set(db.get_job(ctx.app_id)["stages"])
+        mapped = worker.run_stage(resumed, "map")
+        failed = db.get_job(ctx.app_id)
+        retried = worker.process_application_group(group)
+        print(json.dumps({
+            "mapped": mapped,
+            "status": failed["status"],
+            "error": failed["error"],
+            "ocr_done": "ocr" in failed["stages"],
+            "retried": retried is not None and retried["app_id"] == ctx.app_id,
+            "stages": sorted(db.get_job(ctx.app_id)["stages"]),
+        }))
+    """, tmp_path)
+    assert out["mapped"] is False
+    assert out["status"] == "failed" and "resumes from ocr" in out["error"]
+    assert out["ocr_done"] is False
+    assert out["retried"]
+    assert "ocr" in out["stages"] and "map" in out["stages"]
@@ -0,0 +1,30 @@
+"""
+test_mapper.py
+----------------------------------
+Field extraction from OCR text (mapper.extract_fields).
+
+Usage:
+    python -m pytest test_mapper.py
+"""
+
+from mapper import extract_fields
+
+
+def test_several_label_value_pairs_on_one_line():
+    text = ("Name: Abdul Rahman Father's Name: Yusuf Khan\n"
+            "Age: 55 Gender: Male\n"
+            "Address: 12 Masjid Road Ward: 7\n")
+    values, _ = extract_fields({"text": text, "pages": []})
+    assert values == {
+        "name": "Abdul Rahman",
+        "fatherOrHusbandName": "Yusuf Khan",
+        "age": "55",
+        "gender": "Male",
+        "address": "12 Masjid Road",
+        "ward": "7",
+    }
+
+
+def test_value_on_the_next_line():
+    values, _ = extract_fields({"text": "Occupation:\nTailor\n", "pages": []})
+    assert values == {"occupation": "Tailor"}
@@ -0,0 +1,175 @@
+"""
+test_packer.py
+----------------------------------
+Request packing (ocr_packer.py) against the local Document AI stand-in,
+which reads a packed PDF as one continuous document, as the real service
+does: every part split from the response must read the same text through
+its remapped anchors (pages, lines, tokens, form fields, entities) as the
+packed document does.
+
+Usage:
+    python -m pytest test_packer.py
+    python test_packer.py
+"""
+
+import asyncio
+
+import cv2
+import numpy as np
+from google.api_core import exceptions as api_exceptions
+from google.cloud import documentai_v1 as documentai
+
+from document_ai_client import AsyncDocumentAIClient
+from fake_docai import FakeDocumentProcessorServiceClient, FakeDocumentProcessorServiceAsyncClient
+from ocr_packer import OcrPacker, pack_pdfs, split_document
+from utils import pages_to_pdf_bytes
+
+Doc = documentai.Document
+
+
+def _application(seed, pages):
+    """Merged PDF of a small bilevel application, distinct per seed."""
+    rng = np.random.default_rng(seed)
+    out = []
+    for p in range(pages):
+        page = np.full((700, 500), 255, np.uint8)
+        cv2.putText(page, f"app {seed} page {p + 1}", (30, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2)
+        for x, y in rng.integers(20, 480, (12, 2)):
+            cv2.rectangle(page, (int(x), int(y) + 100), (int(x) + 15, int(y) + 110), 0, -1)
+        out.append(page)
+    return pages_to_pdf_bytes(out)
+
+
+def _request(content):
+    return {"name": "test", "raw_document": {"content": content, "mime_type": "application/pdf"}}
+
+
+def _anchored(doc, layout):
+    return "".join(doc.text[s.start_index:s.end_index] for s in layout.text_anchor.text_segments)
+
+
+def _with_entities(doc):
+    """doc with an entity on every page's first line and every form field value."""
+    for n, page in enumerate(doc.pages):
+        for i, layout in enumerate([page.lines[0].layout] + [ff.field_value for ff in page.form_fields]):
+            doc.entities.append(Doc.Entity(
+                id=f"{n}.{i}", type_="field", mention_text=_anchored(doc, layout), text_anchor=layout.text_anchor,
+                page_anchor=Doc.PageAnchor(page_refs=[Doc.PageAnchor.PageRef(page=n)])))
+    return doc
+
+
+def _assert_reads_like_packed(part, whole, first):
+    """Every anchor in part reads what its counterpart reads in the packed document."""
+    count = len(part.pages)
+    for page, packed in zip(part.pages, whole.pages[first:first + count]):
+        assert _anchored(part, page.layout) == _anchored(whole, packed.layout)
+        for field in ("lines", "tokens"):
+            assert [_anchored(part, x.layout) for x in getattr(page, field)] == \
+                   [_anchored(whole, x.layout) for x in getattr(packed, field)]
+        assert [(_anchored(part, f.field_name), _anchored(part, f.field_value)) for f in page.form_fields] == \
+               [(_anchored(whole, f.field_name), _anchored(whole, f.field_value)) for f in packed.form_fields]
+    expected = [e for e in whole.entities if first <= e.page_anchor.page_refs[0].page < first + count]
+    assert [(e.id, e.page_anchor.page_refs[0].page, _anchored(part, e)) for e in part.entities] == \
+           [(e.id, e.page_anchor.page_refs[0].page - first, _anchored(whole, e)) for e in expected]
+
+
+def test_split_parts_read_the_packed_text():
+    apps = [_application(1, 4), _application(2, 3), _application(3, 4)]
+    client = FakeDocumentProcessorServiceClient(latency=0, page_latency=0, error_rate=0)
+
+    packed, ranges = pack_pdfs(apps)
+    assert ranges == [(0, 4), (4, 3), (7, 4)]
+    whole = _with_entities(client.process_document(request=_request(packed)).document)
+    assert len(whole.pages) == 11 and len(whole.entities) > 0
+    parts = split_document(whole, ranges)
+
+    assert len(parts) == 3
+    assert "".join(p.text for p in parts) == whole.text
+    for part, (first, count) in zip(parts, ranges):
+        assert [p.page_number for p in part.pages] == list(range(1, count + 1))
+        assert all(len(p.tokens) for p in part.pages) and len(part.entities) >= count
+        _assert_reads_like_packed(part, whole, first)
+
+
+def test_split_moves_entities_and_page_refs():
+    def anchor(start, end):
+        return Doc.TextAnchor(text_segments=[Doc.TextAnchor.TextSegment(start_index=start, end_index=end)])
+
+    def entity(id_, start, end, page):
+        return Doc.Entity(id=id_, type_="name", mention_text="x", text_anchor=anchor(start, end),
+                          page_anchor=Doc.PageAnchor(page_refs=[Doc.PageAnchor.PageRef(page=page)]))
+
+    text = "alpha one\nbeta two\ngamma three\n"
+    pages = [Doc.Page(page_number=n, layout=Doc.Page.Layout(text_anchor=anchor(s, e)))
+             for n, (s, e) in enumerate([(0, 10), (10, 19), (19, 31)], start=1)]
+    whole = Doc(text=text, pages=pages,
+                entities=[entity("a", 0, 5, 0), entity("b", 10, 14, 1), entity("c", 19, 24, 2)],
+                entity_relations=[Doc.EntityRelation(subject_id="b", object_id="c", relation="next")])
+
+    first, second = split_document(whole, [(0, 1), (1, 2)])
+    assert first.text == "alpha one\n" and second.text == "beta two\ngamma three\n"
+    assert [e.id for e in first.entities] == ["a"]
+    assert [(e.id, e.page_anchor.page_refs[0].page, _anchored(second, e)) for e in second.entities] == \
+           [("b", 0, "beta"), ("c", 1, "gamma")]
+    assert [p.page_number for p in second.pages] == [1, 2]
+    assert _anchored(second, second.pages[1].layout) == "gamma three\n"
+    assert len(first.entity_relations) == 0 and len(second.entity_relations) == 1
+
+
+def _packer(fake, max_pages=8):
+    client = AsyncDocumentAIClient(client=fake, cache=False, rate_limit=0, max_retries=0)
+    return OcrPacker(client, max_pages=max_pages, wait=0.05, cache=False)
+
+
+def test_packer_shares_requests():
+    class Recording(FakeDocumentProcessorServiceAsyncClient):
+        async def process_document(self, request=None, **kwargs):
+            response = await super().process_document(request=request, **kwargs)
+            responses.append(response.document)
+            return response
+
+    responses = []
+    apps = [_application(10 + i, 4) for i in range(5)]
+    fake = Recording(latency=0, page_latency=0, error_rate=0)
+    packer = _packer(fake)
+
+    async def run():
+        return await asyncio.gather(*(packer.process(app) for app in apps))
+
+    documents = asyncio.run(run())
+    # Two applications fill a request of 8 pages; the fifth goes alone.
+    assert fake.calls == 3 and packer.stats()["requests"] == 3
+    assert [len(d.pages) for d in responses] == [8, 8, 4]
+    for document in documents:
+        assert [p.page_number for p in document.pages] == [1, 2, 3, 4]
+        # The response and page it came from: requests need not go out in order.
+        whole, first = next((w, f) for w in responses for f in range(0, len(w.pages), 4)
+                            if _anchored(w, w.pages[f].layout) == _anchored(document, document.pages[0].layout))
+        _assert_reads_like_packed(document, whole, first)
+
+
+def test_rejected_pack_is_sent_one_by_one():
+    class RejectsPacks(FakeDocumentProcessorServiceAsyncClient):
+        async def process_document(self, request=None, **kwargs):
+            if len(request["raw_document"]["content"]) > max(map(len, apps)):
+                self.calls += 1
+                raise api_exceptions.InvalidArgument("too many pages")
+            return await super().process_document(request=request, **kwargs)
+
+    apps = [_application(20 + i, 2) for i in range(3)]
+    fake = RejectsPacks(latency=0, page_latency=0, error_rate=0)
+    packer = _packer(fake)
+
+    async def run():
+        return await asyncio.gather(*(packer.process(app) for app in apps))
+
+    documents = asyncio.run(run())
+    assert fake.calls == 1 + len(apps)
+    assert [len(d.pages) for d in documents] == [2, 2, 2]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"[OK] {name}")
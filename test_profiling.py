@@ -0,0 +1,22 @@
+"""
+test_profiling.py
+----------------------------------
+Memory tracing of profiled stages (profiling.py): a stage starting while
+another runs must not cut the peak the other one reports.
+
+Usage:
+    python -m pytest test_profiling.py
+"""
+
+import profiling
+
+
+def test_overlapping_stages_keep_their_peaks():
+    first, first_start = profiling._start_tracing()
+    block = bytearray(8 * 1024 * 1024)
+    del block
+    second, second_start = profiling._start_tracing()  # resets tracemalloc's peak
+    _, second_peak, _ = profiling._stop_tracing(second)
+    _, first_peak, _ = profiling._stop_tracing(first)
+    assert first_peak - first_start >= 8 * 1024 * 1024
+    assert second_peak - second_start < 8 * 1024 * 1024
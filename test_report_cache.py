@@ -0,0 +1,62 @@
+"""
+test_report_cache.py
+----------------------------------
+Reports rendered on request (report_cache.py): the merged PDFs the worker
+keeps for them stay under REPORT_SOURCE_MAX_BYTES, and a report whose merged
+PDF was pruned still renders. Runs in a fresh interpreter with its own data
+directory and the local Document AI stand-in, since config.py reads
+ANJUMAN_DATA_DIR when it is imported.
+
+Usage:
+    python -m pytest test_report_cache.py
+"""
+
+import os
+import sys
+import json
+import subprocess
+import textwrap
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _run(script, data_dir):
+    env = dict(os.environ, ANJUMAN_DATA_DIR=str(data_dir), DOC_AI_BACKEND="fake", FAKE_DOC_AI_LATENCY="0",
+               FAKE_DOC_AI_PAGE_LATENCY="0", FAKE_DOC_AI_ERROR_RATE="0", PYTHONPATH=HERE)
+    proc = subprocess.run([sys.executable, "-c", textwrap.dedent(script)], env=env, cwd=HERE,
+                          capture_output=True, text=True, timeout=300)
+    assert proc.returncode == 0, proc.stderr[-3000:]
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def test_pruned_sources_render_from_the_archive(tmp_path):
+    out = _run("""
+        import os, json
+        import config
+        from benchmark import write_synthetic_forms
+        import worker
+        import report_cache
+
+        write_synthetic_forms(config.INCOMING_DIR, 2, 2)
+        results = worker.run_once(parallel_workers=1)
+        kept = sorted(os.listdir(config.REPORT_SOURCE_DIR))
+        newest = max(kept, key=lambda n: os.path.getmtime(os.path.join(config.REPORT_SOURCE_DIR, n)))
+        size = os.path.getsize(os.path.join(config.REPORT_SOURCE_DIR, newest))
+        pruned_to_one = report_cache.prune_report_sources(max_bytes=size)
+        left = os.listdir(config.REPORT_SOURCE_DIR)
+        report_cache.prune_report_sources(max_bytes=0)
+        reports = [report_cache.report_path(r["app_id"]) for r in results]
+        print(json.dumps({
+            "kept": len(kept),
+            "urls": [r["report"] == f"/results/app/{r['app_id']}/report" for r in results],
+            "pruned_to_one": pruned_to_one,
+            "left": left == [newest],
+            "empty": os.listdir(config.REPORT_SOURCE_DIR),
+            "reports": [found is not None and os.path.getsize(found[0]) > 0 for found in reports],
+        }))
+    """, tmp_path)
+    assert out["kept"] == 2
+    assert out["urls"] == [True, True]
+    assert out["pruned_to_one"] == 1 and out["left"]
+    assert out["empty"] == []
+    assert out["reports"] == [True, True]
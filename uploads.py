@@ -0,0 +1,130 @@
+"""
+uploads.py  –  Streaming upload handling for /upload-zip
+-------------------------------------------------------
+Uploads are copied to UPLOAD_DIR in UPLOAD_CHUNK_SIZE chunks with aiofiles,
+so neither the whole file nor a blocking write ever sits on the event loop.
+
+Zip archives are then unpacked one member at a time on a worker thread.
+Each PDF member is streamed to a partial file in UPLOAD_DIR and moved into
+INCOMING_DIR with os.replace as soon as it is complete, so the ingest daemon
+(or the caller's on_pdf hook) starts on the first form while the rest of the
+archive is still being unpacked. Members are flattened to their base name;
+absolute paths, ".." components and symlinks are rejected (zip slip).
+"""
+
+import os
+import stat
+import shutil
+import logging
+import zipfile
+import tempfile
+
+import aiofiles
+
+from config import INCOMING_DIR, UPLOAD_DIR, UPLOAD_CHUNK_SIZE
+
+
+def safe_name(filename):
+    """Base name of a client-supplied file name, or "" if nothing usable is left."""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    return "" if name in ("", ".", "..") else name
+
+
+def _unique_path(directory, name):
+    stem, ext = os.path.splitext(name)
+    path, n = os.path.join(directory, name), 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f"{stem}-{n}{ext}")
+        n += 1
+    return path
+
+
+async def save_upload(upload, directory=UPLOAD_DIR, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Stream a FastAPI UploadFile into directory; returns (path, bytes written)."""
+    os.makedirs(directory, exist_ok=True)
+    name = safe_name(upload.filename) or "upload"
+    fd, path = tempfile.mkstemp(prefix=".upload-", suffix=f"-{name}", dir=directory)
+    os.close(fd)
+    written = 0
+    try:
+        async with aiofiles.open(path, "wb") as out:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                await out.write(chunk)
+                written += len(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, written
+
+
+def publish(path, name, incoming_dir=INCOMING_DIR):
+    """Atomically move a complete file into incoming_dir under a free name."""
+    dest = _unique_path(incoming_dir, name)
+    os.replace(path, dest)
+    return dest
+
+
+def _member_problem(info):
+    """Why a zip member must not be extracted, or None."""
+    name = info.filename.replace("\\", "/")
+    if name.startswith("/") or (len(name) > 1 and name[1] == ":"):
+        return "absolute path"
+    if ".." in name.split("/"):
+        return "parent directory reference"
+    if stat.S_ISLNK(info.external_attr >> 16):
+        return "symlink"
+    return None
+
+
+def extract_pdfs(zip_path, on_pdf=None, staging_dir=UPLOAD_DIR, incoming_dir=INCOMING_DIR,
+                 chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Unpack the PDF members of zip_path one at a time into incoming_dir,
+    calling on_pdf(path) after each one lands. Other members are skipped.
+    Returns the extracted paths. Blocking; run it off the event loop.
+    """
+    extracted = []
+    with zipfile.ZipFile(zip_path) as z:
+        for info in z.infolist():
+            if info.is_dir():
+                continue
+            problem = _member_problem(info)
+            if problem:
+                logging.warning("Skipping zip member %r: %s", info.filename, problem)
+                continue
+            name = safe_name(info.filename)
+            if not name.lower().endswith(".pdf"):
+                continue
+            fd, part = tempfile.mkstemp(prefix=".member-", suffix=".part", dir=staging_dir)
+            try:
+                with z.open(info) as src, os.fdopen(fd, "wb") as dst:
+                    shutil.copyfileobj(src, dst, chunk_size)
+                # incoming/ only picks up "*.pdf"
+                dest = publish(part, os.path.splitext(name)[0] + ".pdf", incoming_dir)
+            except BaseException:
+                if os.path.exists(part):
+                    os.remove(part)
+                raise
+            extracted.append(dest)
+            if on_pdf:
+                on_pdf(dest)
+    return extracted
+
+
+def extract_upload(zip_path, on_pdf=None):
+    """Background task: extract_pdfs(), then delete the uploaded archive."""
+    try:
+        extracted = extract_pdfs(zip_path, on_pdf)
+        logging.info("Extracted %d PDFs from %s", len(extracted), os.path.basename(zip_path))
+        return extracted
+    except zipfile.BadZipFile:
+        logging.error("Upload %s is not a readable zip", zip_path)
+        return []
+    finally:
+        try:
+            os.remove(zip_path)
+        except FileNotFoundError:
+            pass
@@ -1,10 +1,175 @@
+import io
 import os
 import re
+import time
 import cv2
 import fitz  # PyMuPDF
 import numpy as np
-from PIL import Image, ImageEnhance
-from PyPDF2 import PdfMerger
+from PIL import Image, ImageEnhance, features
+
+from config import (
+    PREPROCESS_PROFILE,
+    PREPROCESS_PROFILES,
+    BLANK_PAGE_INK_RATIO,
+    BILEVEL_MAX_MIDTONE,
+    PAGE_FOOTER_CROP_RATIO,
+    FOOTER_DPI,
+)
+from metrics import PAGE_RENDER_SECONDS
+
+
+def source_dpi(page):
+    """
+    Resolution of the scan behind a PDF page: the dpi of its largest image
+    if that image covers at least half the page, else None (vector or text
+    pages, which render sharply at any scale).
+    """
+    best, best_area = None, 0.0
+    for info in page.get_image_info():
+        bbox = fitz.Rect(info["bbox"])
+        if info["width"] and bbox.width > 0 and bbox.get_area() > best_area:
+            best, best_area = info, bbox.get_area()
+    if best is None or best_area < 0.5 * page.rect.get_area():
+        return None
+    return best["width"] / (fitz.Rect(best["bbox"]).width / 72.0)
+
+
+def render_scale(page, dpi):
+    """Render scale for dpi, never above the resolution of the page's scan."""
+    native = source_dpi(page)
+    return min(dpi, native or dpi) / 72.0
+
+
+def pdf_page_count(pdf_path):
+    """Number of pages in a PDF, or None if it cannot be opened."""
+    try:
+        with fitz.open(pdf_path) as doc:
+            return doc.page_count
+    except Exception:
+        return None
+
+
+def iter_pdf_pages(pdf_path, scale=2.0, dpi=None):
+    """
+    Renders each PDF page straight to an 8-bit grayscale NumPy array.
+    With dpi, each page is rendered at that resolution or at its scan's own
+    resolution, whichever is lower, instead of at a fixed scale.
+    The arrays are zero-copy views over the fitz Pixmap buffer and are only
+    valid until the generator advances; consume or copy each page before
+    asking for the next one.
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        for page in doc:
+            started = time.perf_counter()
+            s = render_scale(page, dpi) if dpi else scale
+            pix = page.get_pixmap(matrix=fitz.Matrix(s, s), colorspace=fitz.csGRAY, alpha=False)
+            PAGE_RENDER_SECONDS.observe(time.perf_counter() - started)
+            samples = getattr(pix, "samples_mv", None) or pix.samples
+            view = np.frombuffer(samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, : pix.width]
+            yield view
+            del view, samples, pix
+    finally:
+        doc.close()
+
+
+def is_two_tone(gray):
+    """True for pages that are already binarized (bilevel scans, faxes)."""
+    return np.count_nonzero(cv2.calcHist([gray], [0], None, [256], [0, 256])) <= 2
+
+
+def is_blank_page(gray, ink_ratio=BLANK_PAGE_INK_RATIO):
+    """
+    True if under ink_ratio of the page is clearly darker than the paper.
+    Runs on a quarter-size copy, which also averages scanner noise away.
+    """
+    small = cv2.resize(gray, None, fx=0.25, fy=0.25, interpolation=cv2.INTER_AREA)
+    paper = float(np.median(small))
+    ink = np.count_nonzero(small < paper - 48)
+    return ink < ink_ratio * small.size
+
+
+def otsu_levels(gray):
+    """(Otsu threshold, mean ink level, mean paper level) of a grayscale page."""
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel().astype(np.float64)
+    levels = np.arange(256)
+    omega = np.cumsum(hist)
+    mu = np.cumsum(hist * levels)
+    total, mu_total = omega[-1], mu[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (mu_total * omega - mu * total) ** 2 / (omega * (total - omega))
+    t = int(np.argmax(np.nan_to_num(between)))
+    ink = mu[t] / omega[t] if omega[t] else 0.0
+    paper = (mu_total - mu[t]) / (total - omega[t]) if total > omega[t] else 255.0
+    return t, ink, paper
+
+
+def thresholding_loses_content(gray, levels=None, max_midtone=BILEVEL_MAX_MIDTONE, tiles=8):
+    """
+    True if binarizing the page would wipe out content: some 1/tiles x
+    1/tiles area holds over max_midtone of pixels well between the ink and
+    paper levels (a photo, shading, a stamp) rather than the odd stroke edge.
+    """
+    _, ink, paper = levels or otsu_levels(gray)
+    margin = (paper - ink) / 4
+    if margin <= 0:
+        return False
+    mid = cv2.inRange(gray, ink + margin, paper - margin)
+    share = cv2.resize(mid, (tiles, tiles), interpolation=cv2.INTER_AREA)
+    return int(share.max()) > max_midtone * 255
+
+
+def _denoise(gray, profile):
+    if profile["denoise"] == "median":
+        return cv2.medianBlur(gray, profile.get("ksize", 3))
+    return cv2.bilateralFilter(gray, profile.get("d", 9), 75, 75)
+
+
+def preprocess_page(gray, profile=None):
+    """
+    Enhances one grayscale page buffer (denoise, binarize, contrast) using
+    a PREPROCESS_PROFILES entry (default PREPROCESS_PROFILE). Pages that are
+    already two-tone skip denoising; pages that binarizing would damage
+    (thresholding_loses_content) stay grayscale. Only denoising allocates;
+    thresholding and contrast run in place on the filtered buffer, which is
+    returned.
+    """
+    settings = PREPROCESS_PROFILES[profile or PREPROCESS_PROFILE]
+    if is_two_tone(gray):
+        page = gray.copy()
+        cv2.threshold(page, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=page)
+    else:
+        page = _denoise(gray, settings)
+        levels = otsu_levels(page)
+        if not thresholding_loses_content(page, levels):
+            cv2.threshold(page, levels[0], 255, cv2.THRESH_BINARY, dst=page)
+    cv2.convertScaleAbs(page, dst=page, alpha=1.2, beta=10)
+    return page
+
+
+def _pdf_image(page):
+    """
+    Two-tone pages become 1-bit images, which Pillow stores with CCITT
+    Group 4 compression when it has libtiff; anything else stays 8-bit
+    grayscale (JPEG).
+    """
+    if features.check("libtiff"):
+        levels = np.flatnonzero(cv2.calcHist([page], [0], None, [256], [0, 256]))
+        if len(levels) <= 2:
+            cut = (int(levels[0]) + int(levels[-1]) + 1) / 2 if len(levels) == 2 else 128
+            bits = np.packbits(page >= cut, axis=1)
+            return Image.frombytes("1", (page.shape[1], page.shape[0]), bits.tobytes())
+    return Image.fromarray(page)
+
+
+def pages_to_pdf_bytes(pages, resolution=100.0):
+    """Builds a multi-page PDF in memory from grayscale page arrays."""
+    if not pages:
+        raise ValueError("No pages to build PDF from")
+    images = [_pdf_image(p) for p in pages]
+    buf = io.BytesIO()
+    images[0].save(buf, "PDF", resolution=resolution, save_all=True, append_images=images[1:])
+    return buf.getvalue()
 
 
 def preprocess_image(input_path, output_path):
@@ -28,37 +193,50 @@ def preprocess_image(input_path, output_path):
     if image is None:
         raise ValueError(f"Failed to read image: {input_path}")
 
-    image = cv2.bilateralFilter(image, 9, 75, 75)
-    _, image = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    enhanced = cv2.convertScaleAbs(image, alpha=1.2, beta=10)
+    enhanced = preprocess_page(image)
     cv2.imwrite(output_path, enhanced)
     return output_path
 
 
-def detect_footer_text(file_path, crop_ratio=0.12):
+def footer_rect(page, crop_ratio=PAGE_FOOTER_CROP_RATIO):
+    """The bottom crop_ratio of a PDF page, in page coordinates."""
+    r = page.rect
+    return fitz.Rect(r.x0, r.y1 - r.height * crop_ratio, r.x1, r.y1)
+
+
+def render_footer(page, crop_ratio=PAGE_FOOTER_CROP_RATIO, dpi=FOOTER_DPI):
+    """
+    Only the footer strip of a PDF page, rendered in grayscale at dpi (or
+    the scan's own resolution if lower), as a NumPy array.
+    """
+    s = render_scale(page, dpi)
+    pix = page.get_pixmap(matrix=fitz.Matrix(s, s), clip=footer_rect(page, crop_ratio),
+                          colorspace=fitz.csGRAY, alpha=False)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width).copy()
+
+
+def detect_footer_text(file_path, crop_ratio=PAGE_FOOTER_CROP_RATIO):
     """
     Extracts bottom text region (footer) to detect 'Acknowledgement Slip' or 'Page X of Y'
     for automatic grouping.
-    Works for PDFs and images.
+    Works for PDFs and images. For a PDF only the footer strip of the first
+    page is rendered (render_footer).
     """
     ext = os.path.splitext(file_path)[1].lower()
-    img = None
+    footer = None
 
     if ext == ".pdf":
-        doc = fitz.open(file_path)
-        page = doc.load_page(0)
-        pix = page.get_pixmap(matrix=fitz.Matrix(1.5, 1.5))
-        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3)
-        img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-        doc.close()
+        with fitz.open(file_path) as doc:
+            footer = render_footer(doc.load_page(0), crop_ratio)
     else:
         img = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
+        if img is not None:
+            h = img.shape[0]
+            footer = img[int(h * (1 - crop_ratio)) : h, :]
 
-    if img is None:
+    if footer is None:
         return ""
 
-    h = img.shape[0]
-    footer = img[int(h * (1 - crop_ratio)) : h, :]
     text = extract_text_from_image(footer)
     if re.search(r"(acknowledgement slip|page\s*\d+\s*of\s*\d+)", text, re.IGNORECASE):
         return text.strip()
@@ -77,43 +255,46 @@ def extract_text_from_image(image):
 def images_to_pdf(input_paths, output_path):
     """
     Converts a list of files (PDF or images) into a single merged PDF.
-    Handles PDFs directly; converts images automatically.
+    Handles PDFs directly; converts images automatically (grayscale scans
+    stay grayscale, and bilevel ones are stored as 1-bit, see _pdf_image).
     """
+    from PyPDF2 import PdfMerger  # only this legacy helper needs it
+
     merger = PdfMerger()
-    temp_files = []
 
     for p in input_paths:
         ext = os.path.splitext(p)[1].lower()
         if ext == ".pdf":
             merger.append(p)
         else:
-            im = Image.open(p).convert("RGB")
-            temp_pdf = p + ".tmp.pdf"
-            im.save(temp_pdf, "PDF", resolution=100.0)
-            merger.append(temp_pdf)
-            temp_files.append(temp_pdf)
+            with Image.open(p) as src:
+                gray = src.mode in ("1", "L", "LA", "I", "I;16")
+                im = _pdf_image(np.asarray(src.convert("L"))) if gray else src.convert("RGB")
+            page_pdf = io.BytesIO()
+            im.save(page_pdf, "PDF", resolution=100.0)
+            page_pdf.seek(0)
+            merger.append(page_pdf)
 
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     merger.write(output_path)
     merger.close()
-
-    for tmp in temp_files:
-        if os.path.exists(tmp):
-            os.remove(tmp)
     return output_path
 
 
-def convert_pdf_to_images(pdf_path, output_dir):
+def convert_pdf_to_images(pdf_path, output_dir, profile=None):
     """
-    Converts a full PDF (multi-page) into individual page images.
+    Converts a full PDF (multi-page) into individual page images, rendered
+    at the profile's dpi (capped at each page's scan resolution).
     Returns list of image file paths.
     """
+    dpi = PREPROCESS_PROFILES[profile or PREPROCESS_PROFILE]["dpi"]
     doc = fitz.open(pdf_path)
     out_images = []
     os.makedirs(output_dir, exist_ok=True)
 
     for i, page in enumerate(doc, start=1):
-        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
+        s = render_scale(page, dpi)
+        pix = page.get_pixmap(matrix=fitz.Matrix(s, s))
         img_path = os.path.join(output_dir, f"page_{i:02d}.jpg")
         pix.save(img_path)
         out_images.append(img_path)
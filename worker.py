@@ -3,23 +3,59 @@ import sys
 import time
 import json
 import shutil
+import hashlib
 import logging
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import cv2
+from google.cloud import documentai_v1 as documentai
+
 from config import (
     INCOMING_DIR,
     WORK_DIR,
+    ARCHIVE_DIR,
+    CLAIM_DIR,
+    FAILED_DIR,
     PDFS_DIR,
-    OCR_RAW_DIR,
     DRAFTS_DIR,
     REPORTS_DIR,
+    REPORT_EAGER,
+    PDF_RESOLUTION,
+    PREPROCESS_PROFILE,
+    PREPROCESS_PROFILES,
+    SKIP_BLANK_PAGES,
+    DEDUP_MODE,
+    KEEP_INTERMEDIATE_FILES,
+    PIPELINE_ENABLED,
+    FOOTER_GROUPING,
+    ensure_dirs,
+    summary,
 )
-from utils import preprocess_image, detect_footer_text, images_to_pdf, convert_pdf_to_images
+from utils import iter_pdf_pages, is_blank_page, pages_to_pdf_bytes, pdf_page_count
+from preprocess_pool import preprocess_pages
 from document_ai_client import process_pdf_local
+from ocr_store import archive_path, load_ocr_json, flush as flush_ocr_archives
 from mapper import map_fields_from_ocr
 from pdf_report import generate_pdf_report
-from local_db_manager import generate_application_id, insert_form_record
+from report_cache import keep_report_source, drop_report_source
+from dedup import page_hash, get_index as get_dedup_index
+from grouping import FooterGrouper, part_source
+from metrics import STAGE_SECONDS, STAGE_FAILURES, APPLICATIONS, PAGES, BYTES_WRITTEN
+import profiling
+from local_db_manager import (
+    JOB_DONE,
+    JOB_FAILED,
+    start_job,
+    complete_job_stage,
+    reopen_job_stage,
+    finish_job,
+    update_job_sources,
+    save_form_record,
+    record_result,
+    get_result,
+    link_duplicate,
+)
 
 
 # ----------------------------------------------------------------------
@@ -31,9 +67,7 @@ logging.basicConfig(
     handlers=[logging.StreamHandler(sys.stdout)],
 )
 
-ARCHIVE_DIR = os.path.join(WORK_DIR, "archive")
-for d in [ARCHIVE_DIR, PDFS_DIR, OCR_RAW_DIR, DRAFTS_DIR, REPORTS_DIR, INCOMING_DIR]:
-    os.makedirs(d, exist_ok=True)
+ensure_dirs()
 
 
 # ----------------------------------------------------------------------
@@ -45,50 +79,154 @@ def list_incoming_files():
     return [str(f) for f in files]
 
 
+def claim_file(path):
+    """
+    Take an incoming PDF for processing by renaming it into CLAIM_DIR.
+    The rename is atomic, so of several runs racing for one file exactly one
+    gets it. Returns the claimed path, or None if the file was already taken.
+    """
+    name = os.path.basename(path)
+    stem, ext = os.path.splitext(name)
+    dest, n = os.path.join(CLAIM_DIR, name), 1
+    while os.path.exists(dest):  # same file name uploaded again while the first is in progress
+        dest = os.path.join(CLAIM_DIR, f"{stem}-{n}{ext}")
+        n += 1
+    try:
+        os.rename(path, dest)
+    except FileNotFoundError:
+        return None
+    return dest
+
+
+def list_claimed_files():
+    """
+    Claimed PDFs not yet archived or failed (e.g. left by a crashed run).
+    Part PDFs whose source is still claimed are removed rather than listed:
+    the source is grouped again and writes them anew, so listing both would
+    process those pages twice.
+    """
+    claimed = [str(f) for f in sorted(Path(CLAIM_DIR).glob("*.pdf"))]
+    names = set(claimed)
+    files = []
+    for path in claimed:
+        if part_source(path) in names:
+            logging.info("Dropping %s; its source is grouped again", os.path.basename(path))
+            os.remove(path)
+        else:
+            files.append(path)
+    return files
+
+
+def settle_group(group_paths, result):
+    """Move a group's claimed PDFs to FAILED_DIR if processing did not succeed.
+    (process_application_group archives them itself on success.)"""
+    if result:
+        return
+    for f in group_paths:
+        try:
+            shutil.move(f, os.path.join(FAILED_DIR, os.path.basename(f)))
+            logging.warning("Moved %s to %s", os.path.basename(f), FAILED_DIR)
+        except FileNotFoundError:
+            pass
+
+
+def retry_job(job):
+    """
+    Put a failed job's source PDFs back into INCOMING_DIR so the next run
+    (or the ingest daemon) picks them up; the job then resumes under the
+    same app_id. Returns the requeued paths.
+    """
+    requeued = []
+    for path in job["source_paths"]:
+        name = os.path.basename(path)
+        for candidate in (path, os.path.join(FAILED_DIR, name), os.path.join(CLAIM_DIR, name)):
+            if os.path.exists(candidate):
+                dest = os.path.join(INCOMING_DIR, name)
+                os.replace(candidate, dest)
+                requeued.append(dest)
+                break
+    return requeued
+
+
 def group_pdfs_into_apps(file_paths):
-    """Each PDF is treated as one application."""
-    grouped = []
-    for path in file_paths:
-        grouped.append([path])
-    return grouped
+    """
+    Groups PDFs into applications by their page footers (grouping.py):
+    loose pages are joined and multi-form PDFs split into part PDFs. Without
+    FOOTER_GROUPING each PDF is treated as one application.
+    """
+    if not FOOTER_GROUPING:
+        return [[path] for path in file_paths]
+    return FooterGrouper().group(file_paths)
 
 
 # ----------------------------------------------------------------------
 # Preprocessing
 # ----------------------------------------------------------------------
-def preprocess_group(file_paths, work_subdir):
+def preprocess_group(file_paths, work_subdir, profile=PREPROCESS_PROFILE):
     """
-    Handles PDFs: splits each into page images and enhances them.
-    Returns list of page image paths.
+    Handles PDFs: renders each page to memory at the profile's dpi and
+    enhances it, spreading pages across the preprocessing process pool.
+    Blank pages are dropped when SKIP_BLANK_PAGES is set.
+    Returns (processed grayscale page arrays, form page number of each).
+    Page images are only written to work_subdir when KEEP_INTERMEDIATE_FILES
+    is set.
     """
-    os.makedirs(work_subdir, exist_ok=True)
     processed = []
+    page_numbers = []
+    offset = 0  # form pages in the files before this one
+    read = 0    # pages of the current file rendered so far
+
+    def kept(src):
+        nonlocal read
+        for index, page in enumerate(iter_pdf_pages(src, dpi=PREPROCESS_PROFILES[profile]["dpi"]), start=1):
+            read = index
+            if SKIP_BLANK_PAGES and is_blank_page(page):
+                logging.info("Skipping blank page %d of %s", index, os.path.basename(src))
+                PAGES.labels(result="blank").inc()
+                continue
+            PAGES.labels(result="kept").inc()
+            page_numbers.append(offset + index)
+            yield page
 
     for src in file_paths:
+        read = 0
         try:
-            # Convert each PDF page to image
-            pages = convert_pdf_to_images(src, work_subdir)
-            for page_img in pages:
-                base = os.path.basename(page_img)
-                out_path = os.path.join(work_subdir, base)
-                processed_img = preprocess_image(page_img, out_path)
-                processed.append(processed_img)
+            processed.extend(preprocess_pages(kept(src), profile=profile))
         except Exception as e:
             logging.exception("Failed to preprocess %s", src)
+            del page_numbers[len(processed):]
+            # The files after it keep their place in the form.
+            read = pdf_page_count(src) or read
+        offset += read
+
+    if KEEP_INTERMEDIATE_FILES:
+        os.makedirs(work_subdir, exist_ok=True)
+        for i, page in enumerate(processed, start=1):
+            cv2.imwrite(os.path.join(work_subdir, f"page_{i:02d}.jpg"), page)
 
-    return processed
+    return processed, page_numbers
 
 
 # ----------------------------------------------------------------------
 # PDF build
 # ----------------------------------------------------------------------
-def build_pdf_from_images(image_paths, pdf_path):
-    """Combine processed images into a single PDF."""
+def build_pdf_from_images(pages, pdf_path):
+    """
+    Combine processed page arrays into a single in-memory PDF.
+    Returns the PDF bytes. The file at pdf_path is written as well: it is
+    the job checkpoint later stages resume from, and is removed when the job
+    completes unless KEEP_INTERMEDIATE_FILES is set.
+    """
     try:
-        if not image_paths:
+        if not pages:
             raise ValueError("No images found for PDF build")
-        images_to_pdf(image_paths, pdf_path)
-        return pdf_path
+        pdf_bytes = pages_to_pdf_bytes(pages, resolution=PDF_RESOLUTION)
+        tmp = f"{pdf_path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(pdf_bytes)
+        os.replace(tmp, pdf_path)
+        BYTES_WRITTEN.labels(kind="pdf").inc(len(pdf_bytes))
+        return pdf_bytes
     except Exception as e:
         logging.exception("PDF build failed: %s", e)
         return None
@@ -99,99 +237,357 @@ def safe_write_json(path, data):
     tmp = f"{path}.tmp"
     with open(tmp, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+        size = f.tell()
     os.replace(tmp, path)
+    BYTES_WRITTEN.labels(kind="json").inc(size)
 
 
 # ----------------------------------------------------------------------
-# Core processing
+# Jobs and stages
 # ----------------------------------------------------------------------
-def process_application_group(group_paths):
-    """Process one PDF form and extract structured JSON."""
-    job_start = time.time()
-    app_id = generate_application_id()
-    work_subdir = os.path.join(WORK_DIR, f"app_{app_id}")
-    os.makedirs(work_subdir, exist_ok=True)
+class StageFailed(Exception):
+    """A stage could not produce its output; the job stops and can be retried."""
+
 
+def source_key(group_paths):
+    """Content hash identifying a group's source PDFs across retries and renames."""
+    h = hashlib.sha256()
+    for path in group_paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class JobContext:
+    """
+    State shared by the stages of one application. Outputs of stages that
+    finished in an earlier attempt are loaded from their artifacts on first
+    use: pages and PDF bytes from the build_pdf checkpoint, OCR from the raw
+    archive (or the OCR cache), the mapped form from the job record.
+    """
+
+    def __init__(self, job, group_paths):
+        self.app_id = job["app_id"]
+        self.group_paths = group_paths
+        self.artifacts = dict(job["artifacts"])
+        self.job_start = time.time()
+        self.work_subdir = os.path.join(WORK_DIR, f"app_{self.app_id}")
+        self.pdf_path = os.path.join(PDFS_DIR, f"app_{self.app_id}.pdf")
+        self.form = self.artifacts.get("form")
+        # Earlier application this one was linked to by the dedup stage
+        self.duplicate_of = (self.artifacts.get("dedup") or {}).get("linked_to")
+        self._pages = None
+        self._pdf_bytes = None
+        self._ocr_json = None
+        self.resumed = False
+        self.done = set()  # stages completed, in this or an earlier attempt
+        self.timings = {}  # seconds per stage run in this attempt
+        self.profile = None  # profiling.JobProfile when this job is profiled
+
+    @property
+    def pages(self):
+        if self._pages is None:
+            if os.path.exists(self.pdf_path):
+                scale = PDF_RESOLUTION / 72.0
+                self._pages = [page.copy() for page in iter_pdf_pages(self.pdf_path, scale=scale)]
+            else:
+                # Preprocessed pages only persist through the PDF checkpoint.
+                self._pages, _ = preprocess_group(self.group_paths, self.work_subdir)
+        return self._pages
+
+    @property
+    def pdf_bytes(self):
+        if self._pdf_bytes is None:
+            if not os.path.exists(self.pdf_path):
+                raise StageFailed(f"PDF checkpoint {self.pdf_path} is missing")
+            with open(self.pdf_path, "rb") as f:
+                self._pdf_bytes = f.read()
+        return self._pdf_bytes
+
+    @property
+    def ocr_json(self):
+        if self._ocr_json is None:
+            flush_ocr_archives()
+            archive = self.artifacts.get("ocr_archive")
+            if not (archive and os.path.exists(archive)):
+                # Not archived (OCR archives off, or lost in a crash). OCR is a
+                # paid call: rather than make it inside a later stage, fail
+                # that stage and have the retry resume from ocr.
+                reopen_job_stage(self.app_id, "ocr")
+                self.done.discard("ocr")
+                raise StageFailed(f"OCR archive {archive} is missing; the job resumes from ocr")
+            self._ocr_json = load_ocr_json(archive)
+        return self._ocr_json
+
+
+def _stage_preprocess(ctx):
+    ctx._pages, page_numbers = preprocess_group(ctx.group_paths, ctx.work_subdir)
+    if not ctx._pages:
+        raise StageFailed("No pages extracted")
+    return {"page_count": len(ctx._pages), "page_numbers": page_numbers}
+
+
+def _stage_dedup(ctx):
+    if DEDUP_MODE == "off":
+        return {}
+    hashes = [page_hash(page) for page in ctx.pages]
+    index = get_dedup_index()
+    # Only applications with a result can be linked to (not ones still
+    # running or failed).
+    match = next((m for m in index.find(hashes, exclude=ctx.app_id) if get_result(m["app_id"])), None)
+    decision = {"mode": DEDUP_MODE, "duplicate_of": match and match["app_id"]}
+    if match is None:
+        index.add(ctx.app_id, hashes)
+        return {"dedup": decision}
+    decision["distance"] = match["distance"]
+    logging.info("App %s is a near-duplicate of app %s (%d bits)", ctx.app_id, match["app_id"], match["distance"])
+    if DEDUP_MODE != "link":
+        index.add(ctx.app_id, hashes)
+        return {"dedup": decision}
+    form = link_duplicate(match["app_id"], {
+        "app_id": ctx.app_id,
+        "source_files": [os.path.basename(p) for p in ctx.group_paths],
+        "distance": match["distance"],
+        "linked_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    })
+    entry = get_result(match["app_id"])
+    if form is not None and entry["json_file"]:
+        safe_write_json(os.path.join(DRAFTS_DIR, entry["json_file"]), form)
+    decision["linked_to"] = ctx.duplicate_of = match["app_id"]
+    return {"dedup": decision}
+
+
+def _stage_build_pdf(ctx):
+    ctx._pdf_bytes = build_pdf_from_images(ctx.pages, ctx.pdf_path)
+    if not ctx._pdf_bytes:
+        raise StageFailed("Failed to create merged PDF")
+    # Size of the Document AI upload
+    return {"pdf": ctx.pdf_path, "payload_bytes": len(ctx._pdf_bytes)}
+
+
+def _stage_ocr(ctx):
+    document = process_pdf_local(ctx.pdf_path, content=ctx.pdf_bytes)
+    if document is None:
+        raise StageFailed("No OCR result")
+    ctx._ocr_json = documentai.Document.to_dict(document)
+    return {"ocr_archive": archive_path(ctx.pdf_path)}
+
+
+def _stage_map(ctx):
+    source_pdf = ctx.pdf_path if KEEP_INTERMEDIATE_FILES else os.path.join(ARCHIVE_DIR, os.path.basename(ctx.group_paths[0]))
+
+    # Map OCR output to template
+    # Form page number of each OCR page, with blank pages skipped
+    filled_json, provenance = map_fields_from_ocr(ctx.ocr_json, {"page_numbers": ctx.artifacts.get("page_numbers")})
+    filled_json.setdefault("metadata", {})
+    filled_json["metadata"].update(
+        {
+            "app_id": ctx.app_id,
+            "source_pdf": source_pdf,
+            "ocr_archive": ctx.artifacts.get("ocr_archive"),
+            "status": "draft",
+            "processing_started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ctx.job_start)),
+            "processing_completed": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+    )
+    if ctx.artifacts.get("dedup"):
+        filled_json["metadata"]["dedup"] = ctx.artifacts["dedup"]
+
+    hof = (
+        filled_json.get("AnjumanRegistrationForm", {})
+        .get("HeadOfFamily", {})
+        .get("name", {})
+        .get("value", "HOF")
+    )
+    safe_hof = "".join([c if c.isalnum() or c in (" ", "_") else "_" for c in hof]).strip().replace(" ", "_")
+
+    ctx.form = filled_json
+    return {"form": filled_json, "json": os.path.join(DRAFTS_DIR, f"application_{ctx.app_id}_{safe_hof}.json")}
+
+
+def _stage_write_json(ctx):
+    safe_write_json(ctx.artifacts["json"], ctx.form)
+    meta = ctx.form.get("metadata", {})
+    record_result(
+        ctx.app_id,
+        status=meta.get("status", "draft"),
+        hof_name=ctx.form.get("AnjumanRegistrationForm", {}).get("HeadOfFamily", {}).get("name", {}).get("value", ""),
+        json_file=os.path.basename(ctx.artifacts["json"]),
+        completed_at=meta.get("processing_completed"),
+    )
+
+
+def _stage_db_insert(ctx):
+    # Store in local database (replaces the record a previous attempt stored)
+    save_form_record(ctx.form)
+
+
+def _stage_report(ctx):
+    report_file = f"application_{ctx.app_id}_report.pdf"
+    if not REPORT_EAGER:
+        # Keep the merged PDF for the API to render the report from when it
+        # is first requested (report_cache.py).
+        source = keep_report_source(ctx.app_id, ctx.pdf_path)
+        record_result(ctx.app_id, report_file=report_file)
+        return {"report_source": source, "report": f"/results/app/{ctx.app_id}/report"}
+    # Generate visual PDF report
+    report_path = generate_pdf_report(
+        ctx.app_id,
+        ctx.form,
+        ctx.pages,
+        output_path=os.path.join(REPORTS_DIR, report_file),
+    )
+    drop_report_source(ctx.app_id)  # kept by an earlier lazy run; the API would prefer it
+    record_result(ctx.app_id, report_file=report_file)
+    return {"report": report_path}
+
+
+def _stage_archive(ctx):
+    # Move processed PDF to archive
+    archived = []
+    for f in ctx.group_paths:
+        dest = os.path.join(ARCHIVE_DIR, os.path.basename(f))
+        try:
+            shutil.move(f, dest)
+            archived.append(dest)
+        except Exception:
+            pass
+    if not KEEP_INTERMEDIATE_FILES:
+        shutil.rmtree(ctx.work_subdir, ignore_errors=True)
+        try:
+            os.remove(ctx.pdf_path)
+        except FileNotFoundError:
+            pass
+    update_job_sources(ctx.app_id, archived or ctx.group_paths)
+
+
+STAGES = [
+    ("preprocess", _stage_preprocess),
+    ("dedup", _stage_dedup),
+    ("build_pdf", _stage_build_pdf),
+    ("ocr", _stage_ocr),
+    ("map", _stage_map),
+    ("write_json", _stage_write_json),
+    ("db_insert", _stage_db_insert),
+    ("report", _stage_report),
+    ("archive", _stage_archive),
+]
+STAGE_FUNCS = dict(STAGES)
+# Stages a job linked to an earlier application (DEDUP_MODE = "link") skips
+LINKED_SKIPS = {"build_pdf", "ocr", "map", "write_json", "db_insert", "report"}
+
+
+def skips_stage(ctx, stage):
+    return ctx.duplicate_of is not None and stage in LINKED_SKIPS
+
+
+# ----------------------------------------------------------------------
+# Core processing
+# ----------------------------------------------------------------------
+def open_job(group_paths):
+    """Start or resume the job for a group; returns its JobContext."""
+    job, resumed = start_job(source_key(group_paths), group_paths)
+    ctx = JobContext(job, group_paths)
+    ctx.resumed = resumed
+    ctx.done = set(job["stages"])
+    ctx.profile = profiling.select(ctx.app_id)
+    if resumed:
+        logging.info("Resuming application %s (attempt %d, done: %s)",
+                     ctx.app_id, job["attempts"], ", ".join(job["stages"]) or "nothing")
+    else:
+        logging.info("Processing application %s", ctx.app_id)
+    return ctx
+
+
+def fail_stage(ctx, stage, error):
+    STAGE_FAILURES.labels(stage=stage).inc()
+    APPLICATIONS.labels(status="failed").inc()
+    if isinstance(error, StageFailed):
+        logging.error("%s for app %s", error, ctx.app_id)
+        message = f"{stage}: {error}"
+    else:
+        logging.error("Unhandled error processing %s in stage %s", ctx.app_id, stage, exc_info=error)
+        message = f"{stage}: {error!r}"
+    finish_job(ctx.app_id, JOB_FAILED, message)
+
+
+def run_stage(ctx, stage, run=None, started=None):
+    """
+    Run one stage and checkpoint it, unless an earlier attempt completed it.
+    `run` replaces the stage function and `started` (a perf_counter value)
+    backdates its timing, for callers that did the stage's work elsewhere
+    (the pipeline's async OCR). Returns False after marking the job failed.
+    """
+    if stage in ctx.done:
+        return True
+    if skips_stage(ctx, stage):
+        ctx.done.add(stage)
+        return True
+    started = time.perf_counter() if started is None else started
+    run = run or STAGE_FUNCS[stage]
     try:
-        logging.info("Processing application %s", app_id)
+        artifacts = (run(ctx) if ctx.profile is None else ctx.profile.run(stage, run, ctx)) or {}
+    except Exception as e:
+        fail_stage(ctx, stage, e)
+        return False
+    ctx.timings[stage] = time.perf_counter() - started
+    STAGE_SECONDS.labels(stage=stage).observe(ctx.timings[stage])
+    ctx.artifacts.update(artifacts)
+    complete_job_stage(ctx.app_id, stage, artifacts, ctx.timings[stage])
+    ctx.done.add(stage)
+    return True
 
-        processed_images = preprocess_group(group_paths, work_subdir)
-        if not processed_images:
-            logging.error("No pages extracted for app %s", app_id)
-            return None
 
-        pdf_path = os.path.join(PDFS_DIR, f"app_{app_id}.pdf")
-        if not build_pdf_from_images(processed_images, pdf_path):
-            logging.error("Failed to create merged PDF for %s", app_id)
-            return None
+def close_job(ctx):
+    """
+    Mark a job whose stages all completed as done; returns the run summary.
+    Its "report" is the report file, or with reports rendered on request the
+    API path that serves it.
+    """
+    finish_job(ctx.app_id, JOB_DONE)
+    APPLICATIONS.labels(status="linked" if ctx.duplicate_of is not None else "done").inc()
+    if ctx.duplicate_of is not None:
+        logging.info("Completed app %s -> linked to app %s", ctx.app_id, ctx.duplicate_of)
+    else:
+        logging.info("Completed app %s -> JSON %s | Report %s",
+                     ctx.app_id, ctx.artifacts.get("json"), ctx.artifacts.get("report"))
+    return {
+        "app_id": ctx.app_id,
+        "duplicate_of": ctx.duplicate_of,
+        "json": ctx.artifacts.get("json"),
+        "report": ctx.artifacts.get("report"),
+        "payload_bytes": ctx.artifacts.get("payload_bytes"),
+        "timings": ctx.timings,
+        "resumed": ctx.resumed,
+    }
 
-        # Call Document AI locally
-        ocr_json_path = process_pdf_local(pdf_path)
-        if not ocr_json_path or not os.path.exists(ocr_json_path):
-            logging.error("OCR JSON missing for app %s", app_id)
-            return None
 
-        with open(ocr_json_path, "r", encoding="utf-8") as f:
-            ocr_json = json.load(f)
-
-        # Map OCR output to template
-        filled_json, provenance = map_fields_from_ocr(ocr_json, {})
-        filled_json.setdefault("metadata", {})
-        filled_json["metadata"].update(
-            {
-                "app_id": app_id,
-                "source_pdf": pdf_path,
-                "status": "draft",
-                "processing_started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(job_start)),
-                "processing_completed": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-            }
-        )
-
-        hof = (
-            filled_json.get("AnjumanRegistrationForm", {})
-            .get("HeadOfFamily", {})
-            .get("name", {})
-            .get("value", "HOF")
-        )
-        safe_hof = "".join([c if c.isalnum() or c in (" ", "_") else "_" for c in hof]).strip().replace(" ", "_")
-
-        json_path = os.path.join(DRAFTS_DIR, f"application_{app_id}_{safe_hof}.json")
-        safe_write_json(json_path, filled_json)
-
-        # Store in local database
-        insert_form_record(filled_json)
-
-        # Generate visual PDF report
-        report_path = generate_pdf_report(
-            app_id,
-            filled_json,
-            processed_images,
-            output_path=os.path.join(REPORTS_DIR, f"application_{app_id}_report.pdf"),
-        )
-
-        # Move processed PDF to archive
-        for f in group_paths:
-            try:
-                shutil.move(f, os.path.join(ARCHIVE_DIR, os.path.basename(f)))
-            except Exception:
-                pass
-        shutil.rmtree(work_subdir, ignore_errors=True)
-
-        logging.info("Completed app %s -> JSON %s | Report %s", app_id, json_path, report_path)
-        return {"app_id": app_id, "json": json_path, "report": report_path}
-
-    except Exception:
-        logging.exception("Unhandled error processing %s", app_id)
-        shutil.rmtree(work_subdir, ignore_errors=True)
-        return None
+def process_application_group(group_paths):
+    """
+    Process one PDF form and extract structured JSON, running every stage in
+    this thread. Each stage is checkpointed in the job record. If an earlier
+    attempt on the same source PDF failed, the job resumes at its first
+    unfinished stage under the original app_id.
+    """
+    ctx = open_job(group_paths)
+    for stage, _ in STAGES:
+        if not run_stage(ctx, stage):
+            return None
+    return close_job(ctx)
 
 
 # ----------------------------------------------------------------------
 # Orchestrator
 # ----------------------------------------------------------------------
 def run_once(parallel_workers=1):
-    """Run pipeline on all incoming PDFs."""
-    files = list_incoming_files()
+    """Run pipeline on all incoming PDFs. Each file is claimed first, so a
+    concurrent run or the ingest daemon never processes it a second time.
+    With PIPELINE_ENABLED the groups go through the staged pipeline
+    (pipeline.py); otherwise parallel_workers threads each run whole
+    applications."""
+    files = [c for c in map(claim_file, list_incoming_files()) if c]
     if not files:
         logging.info("No PDFs in incoming folder.")
         return []
@@ -199,14 +595,20 @@ def run_once(parallel_workers=1):
     groups = group_pdfs_into_apps(files)
     logging.info("Found %d application PDFs", len(groups))
 
-    results = []
-    with ThreadPoolExecutor(max_workers=parallel_workers) as ex:
-        futures = {ex.submit(process_application_group, g): g for g in groups}
-        for fut in as_completed(futures):
-            res = fut.result()
-            if res:
-                results.append(res)
-
+    if PIPELINE_ENABLED:
+        from pipeline import run_groups  # pipeline builds on this module
+        results = run_groups(groups, callback=settle_group)
+    else:
+        results = []
+        with ThreadPoolExecutor(max_workers=parallel_workers) as ex:
+            futures = {ex.submit(process_application_group, g): g for g in groups}
+            for fut in as_completed(futures):
+                res = fut.result()
+                settle_group(futures[fut], res)
+                if res:
+                    results.append(res)
+
+    flush_ocr_archives()
     logging.info("Processing complete: %d succeeded of %d", len(results), len(groups))
     return results
 
@@ -215,4 +617,5 @@ def run_once(parallel_workers=1):
 # Main entry
 # ----------------------------------------------------------------------
 if __name__ == "__main__":
+    print(f"[CONFIG] {summary()}")
     run_once(parallel_workers=1)
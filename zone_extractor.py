@@ -0,0 +1,169 @@
+"""
+zone_extractor.py  –  Template-zone extraction over Document AI tokens
+---------------------------------------------------------------------
+template.json gives a bounding box per form field, in pixels on a
+page_base-sized page (2480x3508 at 300 dpi). Instead of searching the OCR
+text, each page's layout tokens are scaled to page_base and bucketed into a
+uniform grid keyed by token centre. A zone is then answered with a range
+query over the grid cells it overlaps, so the cost is proportional to the
+tokens near the zone rather than to the whole document.
+
+Each zone yields its text in reading order and the mean confidence of the
+tokens that make it up.
+"""
+
+import json
+import threading
+
+import numpy as np
+
+import docjson
+from config import TEMPLATE_FILE
+
+GRID_CELL = 128  # px at page_base scale
+
+_template = None
+_template_lock = threading.Lock()
+
+
+def load_template(path=TEMPLATE_FILE):
+    """template.json, parsed once per process."""
+    global _template
+    with _template_lock:
+        if _template is None:
+            with open(path, "r", encoding="utf-8") as f:
+                _template = json.load(f)
+        return _template
+
+
+class PageTokens:
+    """
+    One page's tokens as NumPy arrays in page_base pixels, plus a grid
+    index from cell to token indices.
+    """
+
+    def __init__(self, page, text, base_width, base_height, cell=GRID_CELL):
+        self.cell = cell
+        dim = page.get("dimension") or {}
+        page_w = float(dim.get("width") or base_width)
+        page_h = float(dim.get("height") or base_height)
+
+        texts, boxes, confs = [], [], []
+        for tok in docjson.tokens(page):
+            lay = docjson.layout(tok)
+            box = _token_box(lay, page_w, page_h)
+            if box is None:
+                continue
+            texts.append(docjson.layout_text(text, lay).strip())
+            boxes.append(box)
+            confs.append(docjson.confidence(lay))
+
+        self.texts = texts
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        scale = np.array([base_width, base_height, base_width, base_height], dtype=np.float64)
+        self.boxes = boxes * scale  # x0, y0, x1, y1
+        self.confidence = np.asarray(confs, dtype=np.float64)
+        self.cx = (self.boxes[:, 0] + self.boxes[:, 2]) / 2
+        self.cy = (self.boxes[:, 1] + self.boxes[:, 3]) / 2
+        self.heights = self.boxes[:, 3] - self.boxes[:, 1]
+
+        self.grid = {}
+        cols = (self.cx // cell).astype(np.int64)
+        rows = (self.cy // cell).astype(np.int64)
+        for i, key in enumerate(zip(rows.tolist(), cols.tolist())):
+            self.grid.setdefault(key, []).append(i)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def query(self, bbox):
+        """Indices of tokens whose centre lies in bbox = [x, y, w, h],
+        in reading order (top to bottom, then left to right)."""
+        x, y, w, h = bbox
+        c0, c1 = int(x // self.cell), int((x + w) // self.cell)
+        r0, r1 = int(y // self.cell), int((y + h) // self.cell)
+        candidates = []
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                candidates.extend(self.grid.get((r, c), ()))
+        if not candidates:
+            return []
+        idx = np.asarray(candidates, dtype=np.int64)
+        cx, cy = self.cx[idx], self.cy[idx]
+        idx = idx[(cx >= x) & (cx < x + w) & (cy >= y) & (cy < y + h)]
+        return _reading_order(idx, self.cx, self.cy, self.heights)
+
+
+def _token_box(lay, page_w, page_h):
+    """Token bounding box normalized to 0..1 as (x0, y0, x1, y1), or None."""
+    poly = docjson.get(lay, "boundingPoly", "bounding_poly") or {}
+    verts = docjson.get(poly, "normalizedVertices", "normalized_vertices") or []
+    if verts:
+        xs = [float(v.get("x", 0.0)) for v in verts]
+        ys = [float(v.get("y", 0.0)) for v in verts]
+    else:
+        verts = poly.get("vertices") or []
+        if not verts:
+            return None
+        xs = [float(v.get("x", 0)) / page_w for v in verts]
+        ys = [float(v.get("y", 0)) / page_h for v in verts]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _reading_order(idx, cx, cy, heights):
+    if len(idx) <= 1:
+        return idx.tolist()
+    idx = idx[np.argsort(cy[idx], kind="stable")]
+    # Tokens within half a line height of the line's first token share a line.
+    tolerance = max(float(np.median(heights[idx])) / 2, 1.0)
+    lines, line, top = [], [idx[0]], cy[idx[0]]
+    for i in idx[1:]:
+        if cy[i] - top <= tolerance:
+            line.append(i)
+        else:
+            lines.append(line)
+            line, top = [i], cy[i]
+    lines.append(line)
+    return [i for ln in lines for i in sorted(ln, key=lambda k: cx[k])]
+
+
+def index_pages(ocr_json, template=None):
+    """PageTokens for every OCR page, in OCR page order."""
+    template = template or load_template()
+    base = template["page_base"]
+    text = ocr_json.get("text", "")
+    return [PageTokens(p, text, base["width"], base["height"]) for p in docjson.pages(ocr_json)]
+
+
+def extract_zones(ocr_json, page_numbers=None, template=None, pages=None):
+    """
+    Answer every simple (bbox) zone of the template.
+    page_numbers[i] is the form page number of OCR page i (defaults to i+1),
+    for when blank or extra pages were dropped before OCR. `pages` can pass
+    a prebuilt index_pages() result.
+    Returns {zone_name: {"value", "confidence", "tokens"}} for zones whose
+    page is present; zones on missing pages are left out.
+    """
+    template = template or load_template()
+    pages = pages if pages is not None else index_pages(ocr_json, template)
+    numbers = page_numbers or list(range(1, len(pages) + 1))
+    by_number = {n: pages[i] for i, n in enumerate(numbers) if i < len(pages)}
+
+    results = {}
+    for name, zone in template["zones"].items():
+        if "bbox" not in zone or "columns" in zone:
+            continue
+        page = by_number.get(zone["page"])
+        if page is None:
+            continue
+        hits = page.query(zone["bbox"])
+        value = " ".join(page.texts[i] for i in hits if page.texts[i])
+        if ":" in value:
+            # The zone caught a printed label as well; keep what follows it.
+            value = value.rsplit(":", 1)[1].strip()
+        results[name] = {
+            "value": value,
+            "confidence": float(page.confidence[hits].mean()) if hits else 0.0,
+            "tokens": len(hits),
+        }
+    return results